@@ -0,0 +1,337 @@
+import bisect
+from .rank_refresher import RANK_FIELDS, account_key, rank_markers
+from .ranks import parse_tier, rating
+
+# 索引の作成に必要なフィールド（ランク更新と同じ列にしてキャッシュを共有する）
+INDEX_FIELDS = RANK_FIELDS
+# オートコンプリートに表示する候補数の上限（Discordの制限）
+MAX_CHOICES = 25
+# ELOを1つの数値で検索した場合の前後の幅
+ELO_BAND = 100
+# 1つの検索範囲で確認する索引の件数の上限
+SCAN_LIMIT = MAX_CHOICES * 4
+
+# 関連度（小さいほど上位に表示）
+_MATCH_EXACT = 0
+_MATCH_NAME = 1
+_MATCH_RANK = 2
+_MATCH_ELO = 3
+
+
+class AccountIndex:
+    """
+    利用可能なアカウントの検索用索引
+
+    名前・ランク・レーティング・ティアごとにソート済みのリストを保持し、前方一致や
+    範囲検索を二分探索で行う。ランキング用に借用中のアカウントも含めた
+    レーティング順のリストも保持する。アカウントの状態やランクが変わった場合は
+    その行だけを入れ替える。
+    """
+
+    def __init__(self):
+        self._accounts = {}
+        # 行番号ごとの索引のキー {row: (名前のキー, ランクのキー, レーティング, ティアID)}
+        self._keys = {}
+        self._names = []
+        self._ranks = []
+        self._elos = []
+        # ティアの高い順・同じティアではレーティングの高い順 [(-ティアID, -レーティング, row)]
+        self._tiers = []
+        # 全アカウントのレーティング順のリスト（ランキング用）
+        self._ratings = {}
+        self._leaderboard = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def rebuild(self, accounts):
+        """
+        アカウント一覧から索引を作り直す
+
+        Args:
+            accounts (list): アカウント情報（Account）のリスト
+        """
+        self._accounts = {account.row: account for account in accounts if account.name}
+        self._keys = {}
+        self._ratings = {}
+        names, ranks, elos, tiers, leaderboard = [], [], [], [], []
+        for row, account in self._accounts.items():
+            keys = self._index_keys(account)
+            if keys[2] is not None:
+                self._ratings[row] = keys[2]
+                leaderboard.append((keys[2], row))
+            if account.status != "available":
+                continue
+            self._keys[row] = keys
+            names.append((keys[0], row))
+            ranks.append((keys[1], row))
+            if keys[2] is not None:
+                elos.append((keys[2], row))
+            if keys[3] is not None:
+                tiers.append(self._tier_entry(keys, row))
+        self._names = sorted(names)
+        self._ranks = sorted(ranks)
+        self._elos = sorted(elos)
+        self._tiers = sorted(tiers)
+        self._leaderboard = sorted(leaderboard)
+
+    @staticmethod
+    def _index_keys(account):
+        """アカウントの索引のキーを作成"""
+        marker = rank_markers.get(account_key(account)) if account.has_valorant_info else None
+        elo = marker[0] if marker and marker[0] is not None else None
+        # APIから取得したティアIDがあればそれを使い、ない場合のみランクの文字列を解析する
+        tier = marker[2] if marker and len(marker) > 2 else None
+        if not tier or tier < 3:
+            tier = parse_tier(account.rank)
+        return account.name.lower(), (account.rank or "").lower(), rating(tier, elo), tier
+
+    @staticmethod
+    def _tier_entry(keys, row):
+        """ティアの索引のエントリを作成"""
+        return -keys[3], -(keys[2] or 0), row
+
+    @staticmethod
+    def _discard(entries, entry):
+        """ソート済みのリストからエントリを削除"""
+        position = bisect.bisect_left(entries, entry)
+        if position < len(entries) and entries[position] == entry:
+            del entries[position]
+
+    def _remove(self, row):
+        """行を索引から削除"""
+        keys = self._keys.pop(row, None)
+        if keys is None:
+            return
+        for entries, key in (
+            (self._names, keys[0]), (self._ranks, keys[1]), (self._elos, keys[2])
+        ):
+            if key is not None:
+                self._discard(entries, (key, row))
+        if keys[3] is not None:
+            self._discard(self._tiers, self._tier_entry(keys, row))
+
+    def _insert(self, account):
+        """行を索引に追加"""
+        keys = self._index_keys(account)
+        self._keys[account.row] = keys
+        bisect.insort(self._names, (keys[0], account.row))
+        bisect.insort(self._ranks, (keys[1], account.row))
+        if keys[2] is not None:
+            bisect.insort(self._elos, (keys[2], account.row))
+        if keys[3] is not None:
+            bisect.insort(self._tiers, self._tier_entry(keys, account.row))
+
+    def _update_rating(self, account):
+        """ランキング用のリストのレーティングを更新"""
+        previous = self._ratings.pop(account.row, None)
+        if previous is not None:
+            self._discard(self._leaderboard, (previous, account.row))
+        current = self._index_keys(account)[2]
+        if current is not None:
+            self._ratings[account.row] = current
+            bisect.insort(self._leaderboard, (current, account.row))
+
+    def on_accounts_loaded(self, sheet, fields, accounts):
+        """
+        スプレッドシートからアカウント一覧を読み込んだ時に索引を作り直す
+
+        Args:
+            sheet: スプレッドシートのワークシート
+            fields (tuple or None): 読み込んだフィールド名
+            accounts (list): 読み込んだアカウント情報のリスト
+        """
+        if fields is None or set(INDEX_FIELDS) <= set(fields):
+            self.rebuild(accounts)
+
+    def on_account_event(self, event, account):
+        """
+        アカウントの借用・返却・ランク更新を索引に反映
+
+        Args:
+            event (str): イベントの種類（"borrow" / "return" / "auto_return" / "rank_update"）
+            account (Account): 対象のアカウント
+        """
+        indexed = self._accounts.get(account.row)
+        if indexed is None:
+            return
+        if event == "borrow":
+            indexed.status = "borrowed"
+        elif event in ("return", "auto_return"):
+            indexed.status = "available"
+        elif event == "rank_update":
+            indexed.rank = account.rank
+            self._update_rating(indexed)
+
+        self._remove(indexed.row)
+        if indexed.status == "available":
+            self._insert(indexed)
+
+    def available(self):
+        """
+        利用可能なアカウントを名前順に取得
+
+        Returns:
+            list: アカウント情報（Account）のリスト
+        """
+        return [self._accounts[row] for _, row in self._names]
+
+    def leaderboard(self, limit=10, available_only=False):
+        """
+        レーティングの高い順にアカウントを取得
+
+        Args:
+            limit (int): 取得する件数の上限
+            available_only (bool): 利用可能なアカウントのみに絞り込むか
+
+        Returns:
+            list: (アカウント情報, レーティング) のリスト
+        """
+        result = []
+        for value, row in reversed(self._leaderboard):
+            if len(result) >= limit:
+                break
+            account = self._accounts[row]
+            if available_only and account.status != "available":
+                continue
+            result.append((account, value))
+        return result
+
+    def in_tier_range(self, low, high, limit=MAX_CHOICES):
+        """
+        ティアが範囲内の利用可能なアカウントを取得
+
+        Args:
+            low (int): ティアIDの下限
+            high (int): ティアIDの上限
+
+        Returns:
+            list: ティア・レーティングの高い順のアカウント情報（Account）のリスト
+        """
+        # 索引はティア・レーティングの高い順に並んでいるため、範囲の先頭から取り出すだけでよい
+        position = bisect.bisect_left(self._tiers, (-high,))
+        end = bisect.bisect_left(self._tiers, (-low + 1,), position)
+        return [self._accounts[row] for _, _, row in self._tiers[position:min(end, position + limit)]]
+
+    def _scan_prefix(self, entries, prefix):
+        """前方一致するエントリの行番号を順に取得"""
+        position = bisect.bisect_left(entries, (prefix,))
+        for key, row in entries[position:position + SCAN_LIMIT]:
+            if not key.startswith(prefix):
+                break
+            yield key, row
+
+    def _scan_elo(self, low, high):
+        """ELOが範囲内のエントリを取得"""
+        position = bisect.bisect_left(self._elos, (low,))
+        for elo, row in self._elos[position:position + SCAN_LIMIT]:
+            if elo > high:
+                break
+            yield elo, row
+
+    def search(self, query, limit=MAX_CHOICES, tier_range=None, exclude=()):
+        """
+        利用可能なアカウントを名前・ランク・ELOで検索
+
+        数値（例: "1500"）はその前後 ELO_BAND のELO、範囲（例: "1200-1500"）は
+        その範囲のELOで検索する。それ以外は名前とランクの前方一致で検索する。
+        ELOが取得できていないアカウントはランクから推定した値で検索する。
+
+        Args:
+            query (str): 検索文字列
+            limit (int): 取得する件数の上限
+            tier_range (tuple, optional): 絞り込むティアIDの範囲 (下限, 上限)
+            exclude (collection): 候補から除く行番号（他のユーザーに確保されているアカウントなど）
+
+        Returns:
+            list: 関連度順のアカウント情報（Account）のリスト
+        """
+        if exclude:
+            matches = self.search(query, limit + len(exclude), tier_range)
+            return [account for account in matches if account.row not in exclude][:limit]
+        query = query.strip().lower()
+        if tier_range is not None:
+            low, high = tier_range
+            if not query:
+                return self.in_tier_range(low, high, limit)
+            matches = self.search(query, len(self._keys))
+            return [
+                account for account in matches
+                if low <= (self._keys[account.row][3] or -1) <= high
+            ][:limit]
+        if not query:
+            return [self._accounts[row] for _, row in self._names[:limit]]
+
+        scored = {}
+
+        def add(row, score):
+            if row not in scored or score < scored[row]:
+                scored[row] = score
+
+        elo_range = _parse_elo_query(query)
+        if elo_range is not None:
+            low, high, center = elo_range
+            for elo, row in self._scan_elo(low, high):
+                add(row, (_MATCH_ELO, abs(elo - center)))
+
+        for name, row in self._scan_prefix(self._names, query):
+            add(row, (_MATCH_EXACT if name == query else _MATCH_NAME, len(name)))
+        for _, row in self._scan_prefix(self._ranks, query):
+            add(row, (_MATCH_RANK, 0))
+
+        rows = sorted(scored, key=lambda row: (scored[row], self._keys[row][0]))
+        return [self._accounts[row] for row in rows[:limit]]
+
+
+def _parse_elo_query(query):
+    """
+    ELOの検索文字列を解析
+
+    Args:
+        query (str): 検索文字列（"1500" または "1200-1500"）
+
+    Returns:
+        tuple or None: (下限, 上限, 中心)。ELOの検索でない場合はNone
+    """
+    low, separator, high = query.partition("-")
+    try:
+        if separator:
+            low, high = sorted((int(low), int(high)))
+            return low, high, (low + high) / 2
+        value = int(query)
+    except ValueError:
+        return None
+    return value - ELO_BAND, value + ELO_BAND, value
+
+
+# ワークシートごとの索引 {sheet_key: AccountIndex}
+_indexes = {}
+
+
+def get_account_index(sheet_key):
+    """
+    ワークシートの索引を取得（なければ空の索引を作成）
+
+    Args:
+        sheet_key (str): ワークシートのキー
+
+    Returns:
+        AccountIndex: アカウント検索用の索引
+    """
+    index = _indexes.get(sheet_key)
+    if index is None:
+        index = _indexes[sheet_key] = AccountIndex()
+    return index
+
+
+def on_accounts_loaded(sheet, fields, accounts):
+    """アカウント一覧の読み込みを読み込み元のワークシートの索引に反映"""
+    get_account_index(sheet.key).on_accounts_loaded(sheet, fields, accounts)
+
+
+def on_account_event(event, account):
+    """アカウントのイベントを読み込み元のワークシートの索引に反映"""
+    index = _indexes.get(account.sheet)
+    if index is not None:
+        index.on_account_event(event, account)
+
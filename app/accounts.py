@@ -1,65 +1,226 @@
+import os
+import time
 import logging
 import asyncio
 import datetime
+import functools
 from zoneinfo import ZoneInfo
+from .rank_refresher import mark_returned
+from .borrow_store import BorrowStore
+from .borrow_stats import get_borrow_stats
 
 # タイムゾーンの設定（東京）
 TOKYO_TZ = ZoneInfo("Asia/Tokyo")
 
-# アカウント管理用変数
-# borrowed_accounts: {user_id: {"account": account_data, "task": task, "guild_id": guild_id, "channel_id": channel_id}}
-borrowed_accounts = {}
-user_status = {}
+class Account:
+    """
+    スプレッドシートの1行分のアカウント情報
+
+    属性名はスプレッドシートのヘッダー名と一致させている。
+    """
+
+    # スプレッドシートの列に対応するフィールド
+    FIELDS = ("name", "id", "password", "rank", "status", "val_username", "val_tag")
+
+    # sheet: 読み込み元のワークシートのキー（複数のサーバーの行を区別するため）
+    __slots__ = ("row", "sheet") + FIELDS
+
+    def __init__(self, row, name="", id="", password="", rank="", status="",
+                 val_username="", val_tag=""):
+        """
+        初期化
+
+        Args:
+            row (int): スプレッドシート上の行番号
+            name (str): アカウント名
+            id (str): ログインID
+            password (str): パスワード
+            rank (str): ランク
+            status (str): 状態（"available" / "borrowed"）
+            val_username (str): Valorantユーザー名
+            val_tag (str): Valorantタグ
+        """
+        self.row = row
+        self.sheet = None
+        self.name = name
+        self.id = id
+        self.password = password
+        self.rank = rank
+        self.status = status
+        self.val_username = val_username
+        self.val_tag = val_tag
+
+    @classmethod
+    def from_values(cls, row, values, column_map):
+        """
+        スプレッドシートの行の値からアカウント情報を作成
+
+        Args:
+            row (int): スプレッドシート上の行番号
+            values (list): 行の値のリスト
+            column_map (dict): {フィールド名: 列番号(1始まり)} の辞書
+
+        Returns:
+            Account: アカウント情報
+        """
+        account = cls(row)
+        for field, col in column_map.items():
+            if col <= len(values):
+                setattr(account, field, str(values[col - 1]))
+        return account
+
+    # 借用状態と一緒に保存するフィールド（ID・パスワードは保存しない）
+    RECORD_FIELDS = ("row", "sheet", "name", "rank", "val_username", "val_tag")
+
+    def to_record(self):
+        """
+        借用状態の保存用の辞書に変換
+
+        Returns:
+            dict: RECORD_FIELDS の値
+        """
+        return {field: getattr(self, field) for field in self.RECORD_FIELDS}
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        保存用の辞書からアカウント情報を復元
+
+        Args:
+            record (dict): to_record で作成した辞書
+
+        Returns:
+            Account: アカウント情報（状態は "borrowed"）
+        """
+        account = cls(record["row"], status="borrowed")
+        for field in cls.RECORD_FIELDS[1:]:
+            setattr(account, field, record.get(field) or ("" if field != "sheet" else None))
+        return account
+
+    @property
+    def has_valorant_info(self):
+        """Valorantのユーザー名とタグが両方設定されているか"""
+        return bool(self.val_username and self.val_tag)
+
+    def __repr__(self):
+        return f"Account(row={self.row}, name={self.name!r}, status={self.status!r})"
+
+
+# 借用期間
+BORROW_DURATION = datetime.timedelta(hours=5)
+# 返却期限を過ぎた借用を確認する間隔（秒）
+BORROW_SWEEP_INTERVAL = int(os.getenv("BORROW_SWEEP_INTERVAL", "30"))
+
+# 借用状態のストア（すべてのシャードプロセスで共有する）
+_borrow_store = None
+_sweeper_task = None
+
+
+def get_borrow_store():
+    """
+    借用状態のストアを取得（初回呼び出し時に開く）
+
+    Returns:
+        BorrowStore: 借用状態のストア
+    """
+    global _borrow_store
+    if _borrow_store is None:
+        _borrow_store = BorrowStore()
+    return _borrow_store
+
+
+# アカウントの借用・返却・ランク更新を受け取る関数のリスト
+_account_listeners = []
+
+
+def add_account_listener(listener):
+    """
+    アカウントのイベントを受け取る関数を登録
+
+    Args:
+        listener: (event, account) を受け取る関数。event は "borrow" / "return" /
+            "auto_return" / "rank_update" のいずれか
+    """
+    _account_listeners.append(listener)
+
+
+def notify_account_event(event, account):
+    """
+    登録済みの関数にアカウントのイベントを通知
+
+    Args:
+        event (str): イベントの種類
+        account (Account): 対象のアカウント
+    """
+    for listener in list(_account_listeners):
+        try:
+            listener(event, account)
+        except Exception as e:
+            logging.error(f"アカウントイベント通知エラー ({event}): {e}", exc_info=True)
+
+
+# 自動返却処理
+async def _run_store(func, *args):
+    """借用ストア（SQLite）の操作をイベントループ外で実行"""
+    return await asyncio.get_event_loop().run_in_executor(None, func, *args)
 
 
-# 自動返却タスク（5時間後に自動返却）
-async def auto_return_account(user_id, account, guild_id, channel_id, bot, sheet_updater):
+async def auto_return_account(borrow, bot, sheet_updater):
     """
-    指定時間後にアカウントを自動的に返却するタスク
+    返却期限を過ぎたアカウントを自動的に返却
+    
+    借用したサーバーを担当していないシャードからも実行できるように、
+    チャンネルが見つからない場合はAPIから取得する。
     
     Args:
-        user_id (int): ユーザーID
-        account (dict): アカウント情報
-        guild_id (int): サーバーID
-        channel_id (int): チャンネルID
+        borrow (dict): claim_expired で取り出した借用情報
         bot: Discordボット
-        sheet_updater: スプレッドシート更新用の関数
+        sheet_updater: スプレッドシート更新用の関数 (row, col, value)
+
+    Returns:
+        bool: スプレッドシートの状態を更新できた場合はTrue
+            （Falseの場合、呼び出し元は借用を戻して次回に再試行する）
     """
-    await asyncio.sleep(5 * 60 * 60)  # 5時間待機
+    user_id = borrow["user_id"]
+    guild_id = borrow["guild_id"]
+    channel_id = borrow["channel_id"]
+    account = Account.from_record(borrow["account"])
+    logging.info(f"自動返却処理開始: User ID={user_id}, Account={account.name}")
+    # スプレッドシートの状態を更新（書き込めた場合のみ借用を削除する）
     try:
-        logging.info(f"自動返却処理開始: User ID={user_id}, Account={account['name']}")
-        # スプレッドシートの状態を更新
-        await sheet_updater(account["row"], 5, "available")
-        
-        # 借用情報をクリア
-        borrowed_accounts.pop(user_id, None)
-        user_status.pop(user_id, None)
+        result = await sheet_updater(account.row, "status", "available")
+    except Exception as e:
+        logging.error(f"自動返却中にエラーが発生しました: {e}")
+        return False
+    if result is not True:
+        logging.error(
+            f"自動返却: スプレッドシートの状態を更新できませんでした - "
+            f"User ID={user_id}, Account={account.name}"
+        )
+        return False
+
+    try:
+        await _run_store(get_borrow_store().complete_claim, borrow)
+        mark_returned(account)
+        get_borrow_stats().record_return(borrow, auto=True)
+        notify_account_event("auto_return", account)
         
-        # サーバー、チャンネル、ユーザー情報を取得
-        guild = bot.get_guild(guild_id)
-        if guild is None:
-            logging.error(f"Guild ID {guild_id} が見つかりません。")
-            return
-            
-        channel = guild.get_channel(channel_id)
+        # チャンネル情報を取得
+        channel = bot.get_channel(channel_id)
         if channel is None:
-            logging.error(
-                f"Channel ID {channel_id} がGuild ID {guild_id}内に見つかりません。"
-            )
-            return
-            
-        user = guild.get_member(user_id)
-        if user is None:
-            logging.error(
-                f"User ID {user_id} がGuild ID {guild_id}内に見つかりません。"
-            )
-            return
+            try:
+                channel = await bot.fetch_channel(channel_id)
+            except Exception:
+                logging.error(
+                    f"Channel ID {channel_id} がGuild ID {guild_id}内に見つかりません。"
+                )
+                return True
 
         # 自動返却処理の埋め込みメッセージを作成して送信
         import discord
         embed = discord.Embed(
             title="自動返却通知",
-            description=f"{user.mention} の **{account['name']}** に自動返却処理を行いました。",
+            description=f"<@{user_id}> の **{account.name}** に自動返却処理を行いました。",
             color=0xff0000  # 赤色
         )
         embed.set_footer(
@@ -67,77 +228,149 @@ async def auto_return_account(user_id, account, guild_id, channel_id, bot, sheet
         )
         await channel.send(embed=embed)
         
-        logging.info(f"自動返却処理完了: User ID={user_id}, Account={account['name']}")
+        logging.info(f"自動返却処理完了: User ID={user_id}, Account={account.name}")
     except Exception as e:
         logging.error(f"自動返却中にエラーが発生しました: {e}")
+    return True
+
+
+async def _expiry_loop(bot, get_sheet, sheet_update_cell):
+    """返却期限を過ぎた借用を定期的に取り出して自動返却するループ"""
+    store = get_borrow_store()
+    while True:
+        await asyncio.sleep(BORROW_SWEEP_INTERVAL)
+        try:
+            expired = await _run_store(store.claim_expired)
+        except Exception as e:
+            logging.error(f"期限切れの借用の取得中にエラーが発生しました: {e}")
+            continue
+        for borrow in expired:
+            # 借用後にサーバーの設定が変わっていても、借りたアカウントのワークシートに書き込む
+            try:
+                sheet = await get_sheet(borrow["account"].get("sheet"), borrow["guild_id"])
+                returned = await auto_return_account(
+                    borrow, bot, functools.partial(sheet_update_cell, sheet)
+                )
+            except Exception as e:
+                logging.error(f"自動返却するアカウントのワークシートを取得できませんでした: {e}")
+                returned = False
+            if not returned:
+                try:
+                    await _run_store(store.release_claim, borrow)
+                except Exception as e:
+                    logging.error(f"自動返却できなかった借用を戻せませんでした: {e}")
+
+
+def start_expiry_sweeper(bot, get_sheet, sheet_update_cell):
+    """
+    自動返却のタスクを起動（起動済みの場合は何もしない）
+
+    Args:
+        bot: Discordボット
+        get_sheet: (ワークシートのキー, サーバーID) からワークシートを取得する
+            コルーチン関数（GuildSheets.for_account）
+        sheet_update_cell: セル更新関数 (sheet, row, col, value)
+
+    Returns:
+        asyncio.Task: 自動返却のタスク
+    """
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(
+            _expiry_loop(bot, get_sheet, sheet_update_cell)
+        )
+    return _sweeper_task
 
 
-def borrow_account(user_id, account, guild_id, channel_id):
+async def borrow_account(user_id, account, guild_id, channel_id):
     """
     ユーザーがアカウントを借りる処理
     
     Args:
         user_id (int): ユーザーID
-        account (dict): アカウント情報
+        account (Account): アカウント情報
         guild_id (int): サーバーID
         channel_id (int): チャンネルID
         
     Returns:
-        dict: アカウント借用情報
+        float or None: 返却期限（UNIX時刻）。前の借用が残っている場合はNone
     """
-    user_status[user_id] = True
-    borrowed_info = {
-        "account": account,
-        "task": None,
-        "guild_id": guild_id,
-        "channel_id": channel_id
-    }
-    borrowed_accounts[user_id] = borrowed_info
-    return borrowed_info
+    expires_at = time.time() + BORROW_DURATION.total_seconds()
+    stored = await _run_store(
+        get_borrow_store().put, guild_id, user_id, channel_id, account.to_record(), expires_at
+    )
+    if not stored:
+        return None
+    get_borrow_stats().record_borrow(guild_id, user_id, account.name)
+    return expires_at
 
 
-def get_borrowed_account(user_id):
+async def get_borrowed_account(user_id, guild_id):
     """
     ユーザーが借りているアカウント情報を取得
     
     Args:
         user_id (int): ユーザーID
+        guild_id (int): サーバーID
         
     Returns:
-        dict or None: アカウント借用情報、存在しない場合はNone
+        dict or None: アカウント借用情報（"account" は Account）、存在しない場合はNone
     """
-    return borrowed_accounts.get(user_id)
+    borrow = await _run_store(get_borrow_store().get, guild_id, user_id)
+    if borrow:
+        borrow["account"] = Account.from_record(borrow["account"])
+    return borrow
 
 
-def return_account(user_id):
+async def return_account(user_id, guild_id):
     """
     ユーザーのアカウント借用状態をクリア
     
     Args:
         user_id (int): ユーザーID
+        guild_id (int): サーバーID
         
     Returns:
-        tuple: (task, account) タスクとアカウント情報のタプル
+        Account or None: 返却したアカウント情報（借用していなかった場合はNone）
+    """
+    borrow = await _run_store(get_borrow_store().pop, guild_id, user_id)
+    if borrow is None:
+        return None
+    get_borrow_stats().record_return(borrow)
+    return Account.from_record(borrow["account"])
+
+
+async def reset_borrow(user_id, guild_id):
     """
-    account_info = borrowed_accounts.pop(user_id, None)
-    user_status.pop(user_id, None)
+    ユーザーのアカウント借用状態を返却として集計せずにクリア
+    
+    管理者による手動リセットや、状態の不整合を解消する場合に使う。
     
-    if account_info:
-        return account_info.get("task"), account_info.get("account")
-    return None, None
+    Args:
+        user_id (int): ユーザーID
+        guild_id (int): サーバーID
+        
+    Returns:
+        Account or None: クリアしたアカウント情報（借用していなかった場合はNone）
+    """
+    borrow = await _run_store(get_borrow_store().pop, guild_id, user_id)
+    if borrow is None:
+        return None
+    return Account.from_record(borrow["account"])
 
 
-def is_account_borrowed(user_id):
+async def is_account_borrowed(user_id, guild_id):
     """
     ユーザーがアカウントを借りているかチェック
     
     Args:
         user_id (int): ユーザーID
+        guild_id (int): サーバーID
         
     Returns:
         bool: アカウントを借りている場合はTrue
     """
-    return user_id in user_status
+    return await _run_store(get_borrow_store().get, guild_id, user_id) is not None
 
 
 def get_return_time_str():
@@ -147,5 +380,5 @@ def get_return_time_str():
     Returns:
         str: 返却期限の文字列表現
     """
-    return_time = datetime.datetime.now(TOKYO_TZ) + datetime.timedelta(hours=5)
+    return_time = datetime.datetime.now(TOKYO_TZ) + BORROW_DURATION
     return return_time.strftime('%Y-%m-%d %H:%M:%S %Z') 
\ No newline at end of file
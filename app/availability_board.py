@@ -0,0 +1,214 @@
+import os
+import json
+import asyncio
+import logging
+import datetime
+import discord
+from .accounts import TOKYO_TZ
+from .account_index import get_account_index
+
+# ボードを設置したチャンネルの保存先
+BOARD_CONFIG_PATH = os.getenv(
+    "AVAILABILITY_BOARD_PATH",
+    os.path.join(os.getenv("DATA_DIR", "data"), "availability_boards.json")
+)
+# 変更を検知してからボードを更新するまでの待機時間（秒）。この間の変更はまとめて1回で反映する
+BOARD_DEBOUNCE = float(os.getenv("AVAILABILITY_BOARD_DEBOUNCE", "5"))
+# 埋め込みの説明文の最大文字数（Discordの制限）
+EMBED_DESCRIPTION_LIMIT = 4096
+
+
+class AvailabilityBoard:
+    """
+    利用可能なアカウントの一覧を表示するピン留めメッセージ（ボード）
+
+    チャンネルのサーバーが使用するワークシートの索引から表示内容を作成し、
+    借用・返却・ランク更新のイベントを受け取るとメッセージを編集する。
+    短時間の連続した変更はまとめて1回の編集にする。
+    """
+
+    def __init__(self, bot, guild_sheets, path=BOARD_CONFIG_PATH):
+        """
+        初期化
+
+        Args:
+            bot: Discordボット
+            guild_sheets (GuildSheets): サーバーごとのスプレッドシートの対応表
+            path (str): ボードの設定の保存先
+        """
+        self.bot = bot
+        self.guild_sheets = guild_sheets
+        self.path = path
+        # {channel_id: message_id}
+        self.boards = {}
+        self._update_task = None
+        # 更新が必要なワークシートのキー
+        self._dirty = set()
+        # チャンネルごとの最後に表示した内容 {channel_id: str}
+        self._last_descriptions = {}
+        self._load()
+
+    def _load(self):
+        """保存済みのボードの設定を読み込む"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.boards = {int(channel_id): int(message_id) for channel_id, message_id in data.items()}
+        except FileNotFoundError:
+            self.boards = {}
+        except Exception as e:
+            logging.error(f"ボードの設定の読み込みに失敗しました: {e}")
+            self.boards = {}
+
+    def _save(self):
+        """ボードの設定を保存"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({str(channel_id): message_id for channel_id, message_id in self.boards.items()}, f)
+        os.replace(temp_path, self.path)
+
+    async def _sheet_key(self, channel):
+        """チャンネルのサーバーが使用するワークシートのキー"""
+        guild_id = channel.guild.id if getattr(channel, "guild", None) else None
+        return (await self.guild_sheets.for_guild(guild_id)).key
+
+    def render(self, sheet_key):
+        """
+        ボードの埋め込みメッセージを作成
+
+        Args:
+            sheet_key (str): チャンネルのサーバーが使用するワークシートのキー
+
+        Returns:
+            discord.Embed: ボードの埋め込みメッセージ
+        """
+        accounts = get_account_index(sheet_key).available()
+        lines = [f"• **{account.name}** ({account.rank or 'Unknown'})" for account in accounts]
+        description = ""
+        for shown, line in enumerate(lines):
+            rest = f"\n…ほか {len(lines) - shown} 件"
+            if len(description) + len(line) + 1 + len(rest) > EMBED_DESCRIPTION_LIMIT:
+                description += rest
+                break
+            description += ("\n" if description else "") + line
+        if not description:
+            description = "現在利用可能なアカウントはありません。"
+
+        embed = discord.Embed(
+            title=f"利用可能なアカウント（{len(accounts)}件）",
+            description=description,
+            color=0x00ff00  # 緑色
+        )
+        embed.set_footer(
+            text=f"最終更新: {datetime.datetime.now(TOKYO_TZ).strftime('%Y-%m-%d %H:%M:%S %Z')}"
+        )
+        return embed
+
+    async def enable(self, channel):
+        """
+        チャンネルにボードを設置してピン留め
+
+        Args:
+            channel: ボードを設置するチャンネル
+
+        Returns:
+            discord.Message: ボードのメッセージ
+        """
+        await self.disable(channel.id)
+        embed = self.render(await self._sheet_key(channel))
+        message = await channel.send(embed=embed)
+        try:
+            await message.pin()
+        except discord.HTTPException as e:
+            logging.warning(f"ボードのピン留めに失敗しました: {e}")
+        self.boards[channel.id] = message.id
+        self._last_descriptions[channel.id] = embed.description
+        self._save()
+        return message
+
+    async def disable(self, channel_id):
+        """
+        チャンネルのボードを削除
+
+        Args:
+            channel_id (int): チャンネルID
+
+        Returns:
+            bool: ボードが設置されていた場合はTrue
+        """
+        message_id = self.boards.pop(channel_id, None)
+        self._last_descriptions.pop(channel_id, None)
+        if message_id is None:
+            return False
+        self._save()
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.HTTPException as e:
+                logging.warning(f"ボードのメッセージ削除に失敗しました: {e}")
+        return True
+
+    def schedule_update(self, sheet_key):
+        """
+        ボードの更新を予約（予約済みの場合は対象のワークシートを追加するだけ）
+
+        Args:
+            sheet_key (str): 変更があったワークシートのキー
+        """
+        if not self.boards:
+            return
+        self._dirty.add(sheet_key)
+        if self._update_task is None or self._update_task.done():
+            self._update_task = asyncio.create_task(self._debounced_update())
+
+    async def _debounced_update(self):
+        """待機時間の間の変更をまとめてからボードを更新"""
+        # 更新中に発生した変更も取りこぼさないよう、変更がなくなるまで繰り返す
+        while self._dirty:
+            await asyncio.sleep(BOARD_DEBOUNCE)
+            dirty, self._dirty = self._dirty, set()
+            await self.update_all(dirty)
+
+    async def update_all(self, sheet_keys=None):
+        """
+        ボードを現在の内容に更新（表示内容が変わっていなければ何もしない）
+
+        Args:
+            sheet_keys (set, optional): 更新するワークシートのキー（省略時はすべて）
+        """
+        for channel_id, message_id in list(self.boards.items()):
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            try:
+                sheet_key = await self._sheet_key(channel)
+            except Exception as e:
+                logging.warning(f"チャンネル {channel_id} のワークシートを取得できませんでした: {e}")
+                continue
+            if sheet_keys is not None and sheet_key not in sheet_keys:
+                continue
+            embed = self.render(sheet_key)
+            if embed.description == self._last_descriptions.get(channel_id):
+                continue
+            try:
+                await channel.get_partial_message(message_id).edit(embed=embed)
+                # 編集に失敗した場合は次回の更新で再度編集する
+                self._last_descriptions[channel_id] = embed.description
+            except discord.NotFound:
+                logging.warning(f"チャンネル {channel_id} のボードが削除されたため設定を解除します")
+                self.boards.pop(channel_id, None)
+                self._save()
+            except discord.HTTPException as e:
+                logging.error(f"ボードの更新に失敗しました (channel={channel_id}): {e}")
+
+    def on_account_event(self, event, account):
+        """アカウントの借用・返却・ランク更新でボードの更新を予約"""
+        self.schedule_update(account.sheet)
+
+    def on_accounts_loaded(self, sheet, fields, accounts):
+        """アカウント一覧の読み込み（スプレッドシートの直接編集など）でボードの更新を予約"""
+        self.schedule_update(sheet.key)
@@ -0,0 +1,348 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+
+# 集計結果の保存先（SQLite。複数のシャードプロセスで共有する）
+BORROW_STATS_PATH = os.getenv(
+    "BORROW_STATS_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "borrow_stats.db")
+)
+# 集計結果を保存する間隔（秒）
+BORROW_STATS_SAVE_INTERVAL = int(os.getenv("BORROW_STATS_SAVE_INTERVAL", "300"))
+# 他のプロセスが書き込み中の場合に待機する時間（ミリ秒）
+BUSY_TIMEOUT_MS = 5000
+# 時間帯別の集計に使うタイムゾーン
+STATS_TZ = ZoneInfo("Asia/Tokyo")
+
+_saver_task = None
+
+
+class GuildBorrowStats:
+    """サーバーごとの借用の集計値（保存前の増分）"""
+
+    __slots__ = (
+        "since", "borrows", "returns", "auto_returns", "held_seconds",
+        "accounts", "users", "hourly"
+    )
+
+    def __init__(self, since=None):
+        # 集計開始時刻（利用率の分母に使う）
+        self.since = time.time() if since is None else since
+        self.borrows = 0
+        self.returns = 0
+        self.auto_returns = 0
+        # 返却済みの借用の合計借用時間（秒）
+        self.held_seconds = 0.0
+        # アカウントごとの集計 {名前: [借用回数, 合計借用時間, 最終返却時刻]}
+        self.accounts = {}
+        # ユーザーごとの借用回数 {user_id: 回数}
+        self.users = {}
+        # 時間帯（0〜23時）ごとの借用回数
+        self.hourly = [0] * 24
+
+
+class BorrowStats:
+    """
+    借用・返却・自動返却のたびに更新する借用の集計
+
+    ログやスプレッドシートを読み返さずに /stats に答えられるように、
+    イベントごとに集計値の増分だけをメモリに加算し、定期的に共有のSQLiteへ
+    加算する。複数のシャードプロセスが同じファイルに保存しても、互いの集計を
+    上書きしない。上位のアカウント・ユーザーは索引を使って取得する。
+    """
+
+    def __init__(self, path=BORROW_STATS_PATH):
+        """
+        初期化
+
+        Args:
+            path (str): 集計結果の保存先
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # 保存前の増分 {guild_id: GuildBorrowStats}
+        self._pending = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS guild_stats (
+                guild_id INTEGER PRIMARY KEY,
+                since REAL NOT NULL,
+                borrows INTEGER NOT NULL DEFAULT 0,
+                returns INTEGER NOT NULL DEFAULT 0,
+                auto_returns INTEGER NOT NULL DEFAULT 0,
+                held_seconds REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS account_stats (
+                guild_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                borrows INTEGER NOT NULL DEFAULT 0,
+                held_seconds REAL NOT NULL DEFAULT 0,
+                last_returned REAL,
+                PRIMARY KEY (guild_id, name)
+            );
+            CREATE INDEX IF NOT EXISTS account_stats_held
+                ON account_stats (guild_id, held_seconds);
+            CREATE TABLE IF NOT EXISTS user_stats (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                borrows INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
+            );
+            CREATE INDEX IF NOT EXISTS user_stats_borrows
+                ON user_stats (guild_id, borrows);
+            CREATE TABLE IF NOT EXISTS hourly_stats (
+                guild_id INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                borrows INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, hour)
+            );
+            """
+        )
+
+    def _write(self, guilds):
+        """集計値の増分を保存先に加算（トランザクション内で呼び出す）"""
+        for guild_id, stats in guilds.items():
+            self._conn.execute(
+                "INSERT INTO guild_stats "
+                "(guild_id, since, borrows, returns, auto_returns, held_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (guild_id) DO UPDATE SET "
+                "since = MIN(since, excluded.since), "
+                "borrows = borrows + excluded.borrows, "
+                "returns = returns + excluded.returns, "
+                "auto_returns = auto_returns + excluded.auto_returns, "
+                "held_seconds = held_seconds + excluded.held_seconds",
+                (guild_id, stats.since, stats.borrows, stats.returns,
+                 stats.auto_returns, stats.held_seconds)
+            )
+            self._conn.executemany(
+                "INSERT INTO account_stats (guild_id, name, borrows, held_seconds, last_returned) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (guild_id, name) DO UPDATE SET "
+                "borrows = borrows + excluded.borrows, "
+                "held_seconds = held_seconds + excluded.held_seconds, "
+                "last_returned = MAX(COALESCE(last_returned, 0), "
+                "COALESCE(excluded.last_returned, 0))",
+                [(guild_id, name, values[0], values[1], values[2])
+                 for name, values in stats.accounts.items()]
+            )
+            self._conn.executemany(
+                "INSERT INTO user_stats (guild_id, user_id, borrows) VALUES (?, ?, ?) "
+                "ON CONFLICT (guild_id, user_id) DO UPDATE SET "
+                "borrows = borrows + excluded.borrows",
+                [(guild_id, user_id, count) for user_id, count in stats.users.items()]
+            )
+            self._conn.executemany(
+                "INSERT INTO hourly_stats (guild_id, hour, borrows) VALUES (?, ?, ?) "
+                "ON CONFLICT (guild_id, hour) DO UPDATE SET "
+                "borrows = borrows + excluded.borrows",
+                [(guild_id, hour, count) for hour, count in enumerate(stats.hourly) if count]
+            )
+
+    def save(self):
+        """保存前の増分があれば保存先に加算"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write(pending)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # 保存できなかった増分は次回の保存で再度加算する
+                for guild_id, stats in pending.items():
+                    self._pending.setdefault(guild_id, stats)
+                raise
+
+    def _guild(self, guild_id):
+        """サーバーの保存前の増分を取得（なければ作成）"""
+        stats = self._pending.get(guild_id)
+        if stats is None:
+            stats = self._pending[guild_id] = GuildBorrowStats()
+        return stats
+
+    def record_borrow(self, guild_id, user_id, account_name, timestamp=None):
+        """
+        借用を集計に加える
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+            account_name (str): アカウント名
+            timestamp (float, optional): 借用時刻
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            stats = self._guild(guild_id)
+            stats.borrows += 1
+            stats.users[user_id] = stats.users.get(user_id, 0) + 1
+            stats.accounts.setdefault(account_name, [0, 0.0, None])[0] += 1
+            stats.hourly[datetime.datetime.fromtimestamp(timestamp, STATS_TZ).hour] += 1
+
+    def record_return(self, borrow, auto=False, timestamp=None):
+        """
+        返却を集計に加える
+
+        Args:
+            borrow (dict): 借用ストアから取り出した借用情報
+            auto (bool): 自動返却の場合はTrue
+            timestamp (float, optional): 返却時刻
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        held = max(0.0, timestamp - borrow["borrowed_at"])
+        name = borrow["account"]["name"]
+        with self._lock:
+            stats = self._guild(borrow["guild_id"])
+            if auto:
+                stats.auto_returns += 1
+            else:
+                stats.returns += 1
+            stats.held_seconds += held
+            values = stats.accounts.setdefault(name, [0, 0.0, None])
+            values[1] += held
+            values[2] = timestamp
+
+    def summary(self, guild_id, top=5, now=None):
+        """
+        サーバーの集計の概要を取得（SQLiteを読むためイベントループ外で呼び出す）
+
+        利用率の分母（集計開始からの時間）はサーバー内で共通のため、利用率の
+        高いアカウントは合計借用時間の索引から上位だけを読み込む。
+
+        Args:
+            guild_id (int): サーバーID
+            top (int): 上位として取得する件数
+            now (float, optional): 現在時刻
+
+        Returns:
+            dict: 集計の概要
+        """
+        now = time.time() if now is None else now
+        self.save()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT since, borrows, returns, auto_returns, held_seconds "
+                "FROM guild_stats WHERE guild_id = ?",
+                (guild_id,)
+            ).fetchone()
+            since, borrows, returns, auto_returns, held_seconds = row or (now, 0, 0, 0, 0.0)
+            accounts = self._conn.execute(
+                "SELECT name, held_seconds, borrows FROM account_stats "
+                "WHERE guild_id = ? ORDER BY held_seconds DESC LIMIT ?",
+                (guild_id, top)
+            ).fetchall()
+            users = self._conn.execute(
+                "SELECT user_id, borrows FROM user_stats "
+                "WHERE guild_id = ? ORDER BY borrows DESC LIMIT ?",
+                (guild_id, top)
+            ).fetchall()
+            hourly = [0] * 24
+            for hour, count in self._conn.execute(
+                "SELECT hour, borrows FROM hourly_stats WHERE guild_id = ?", (guild_id,)
+            ):
+                hourly[hour] = count
+        elapsed = now - since
+        returned = returns + auto_returns
+        return {
+            "since": since,
+            "borrows": borrows,
+            "returns": returns,
+            "auto_returns": auto_returns,
+            "mean_hold_seconds": held_seconds / returned if returned else 0.0,
+            "top_accounts": [
+                (name, min(1.0, held / elapsed) if elapsed > 0 else 0.0, count)
+                for name, held, count in accounts
+            ],
+            "top_users": [(user_id, count) for user_id, count in users],
+            "hourly": hourly,
+        }
+
+    def user_count(self, guild_id, user_id):
+        """
+        ユーザーの借用回数を取得（SQLiteを読むためイベントループ外で呼び出す）
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+
+        Returns:
+            int: 借用回数
+        """
+        self.save()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT borrows FROM user_stats WHERE guild_id = ? AND user_id = ?",
+                (guild_id, user_id)
+            ).fetchone()
+        return row[0] if row else 0
+
+
+# Bot全体で共有する借用の集計
+_stats = None
+
+
+def get_borrow_stats():
+    """
+    借用の集計を取得（初回呼び出し時に読み込む）
+
+    Returns:
+        BorrowStats: 借用の集計
+    """
+    global _stats
+    if _stats is None:
+        _stats = BorrowStats()
+    return _stats
+
+
+async def _save_loop():
+    """借用の集計を定期的に保存するループ"""
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(BORROW_STATS_SAVE_INTERVAL)
+        try:
+            await loop.run_in_executor(None, get_borrow_stats().save)
+        except Exception as e:
+            logging.error(f"借用集計の保存に失敗しました: {e}")
+
+
+def start_stats_saver():
+    """
+    借用の集計を定期的に保存するタスクを起動（起動済みの場合は何もしない）
+
+    Returns:
+        asyncio.Task: 保存のタスク
+    """
+    global _saver_task
+    if _saver_task is None or _saver_task.done():
+        _saver_task = asyncio.create_task(_save_loop())
+    return _saver_task
+
+
+def render_histogram(hourly):
+    """
+    時間帯別の借用回数を棒グラフの文字列にする
+
+    Args:
+        hourly (list): 0〜23時の借用回数
+
+    Returns:
+        str: 3時間ごとにまとめた棒グラフ
+    """
+    buckets = [sum(hourly[hour:hour + 3]) for hour in range(0, 24, 3)]
+    peak = max(buckets) or 1
+    return "\n".join(
+        f"{hour:02d}-{hour + 2:02d}時 {'█' * round(count * 10 / peak):<10} {count}"
+        for hour, count in zip(range(0, 24, 3), buckets)
+    )
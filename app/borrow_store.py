@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# 借用状態の保存先（複数のシャードプロセスで共有する）
+BORROW_STORE_PATH = os.getenv(
+    "BORROW_STORE_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "borrows.db")
+)
+# 他のプロセスが書き込み中の場合に待機する時間（ミリ秒）
+BUSY_TIMEOUT_MS = 5000
+# 自動返却のために取り出した借用を保持する期間（秒）
+# 処理中にプロセスが停止した場合は、期限切れ後に他のプロセスが取り出し直す
+CLAIM_TIMEOUT = 300
+
+
+class BorrowStore:
+    """
+    アカウントの借用状態と返却期限を保持するSQLiteストア
+
+    WALモードで開くため、同じマシン上の複数のシャードプロセスから同時に
+    読み書きできる。期限切れの借用は claim_expired で1つのプロセスだけが
+    取り出せるため、自動返却が重複して実行されることはない。取り出した借用は
+    スプレッドシートへの書き込みが成功してから complete_claim で削除し、
+    失敗した場合は release_claim で戻して次回の確認で再度取り出す。
+    """
+
+    def __init__(self, path=BORROW_STORE_PATH):
+        """
+        初期化
+
+        Args:
+            path (str): SQLiteファイルのパス
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS borrows (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                channel_id INTEGER,
+                account TEXT NOT NULL,
+                borrowed_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                claimed_until REAL,
+                PRIMARY KEY (guild_id, user_id)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS borrows_expires ON borrows (expires_at)"
+        )
+
+    @staticmethod
+    def _to_dict(row):
+        """テーブルの行を借用情報の辞書に変換"""
+        guild_id, user_id, channel_id, account, borrowed_at, expires_at = row
+        return {
+            "guild_id": guild_id,
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "account": json.loads(account),
+            "borrowed_at": borrowed_at,
+            "expires_at": expires_at,
+        }
+
+    def put(self, guild_id, user_id, channel_id, account, expires_at):
+        """
+        借用を記録
+
+        同じユーザーの借用が残っている場合（自動返却の処理中を含む）は記録しない。
+        置き換えると前の借用が返却されないまま失われるため。
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+            channel_id (int): 借用したチャンネルのID
+            account (dict): アカウント情報
+            expires_at (float): 返却期限（UNIX時刻）
+
+        Returns:
+            bool: 記録できた場合はTrue
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO borrows "
+                "(guild_id, user_id, channel_id, account, borrowed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (guild_id, user_id) DO NOTHING",
+                (guild_id, user_id, channel_id, json.dumps(account, ensure_ascii=False),
+                 time.time(), expires_at)
+            )
+        return cursor.rowcount > 0
+
+    def get(self, guild_id, user_id):
+        """
+        借用情報を取得
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+
+        Returns:
+            dict or None: 借用情報（自動返却の処理中の借用も含む）
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT guild_id, user_id, channel_id, account, borrowed_at, expires_at "
+                "FROM borrows WHERE guild_id = ? AND user_id = ?",
+                (guild_id, user_id)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def pop(self, guild_id, user_id):
+        """
+        借用情報を削除して取得
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+
+        Returns:
+            dict or None: 削除した借用情報（他のプロセスが先に削除した場合や
+                自動返却のために取り出されている場合はNone）
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT guild_id, user_id, channel_id, account, borrowed_at, expires_at "
+                    "FROM borrows WHERE guild_id = ? AND user_id = ? "
+                    "AND (claimed_until IS NULL OR claimed_until <= ?)",
+                    (guild_id, user_id, time.time())
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "DELETE FROM borrows WHERE guild_id = ? AND user_id = ?",
+                        (guild_id, user_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row) if row else None
+
+    def claim_expired(self, now=None, limit=50, timeout=CLAIM_TIMEOUT):
+        """
+        返却期限を過ぎた借用を自動返却のために取り出す
+
+        取り出した借用は削除せずに一定時間ほかのプロセスが取り出したり
+        pop で削除したりできないようにする（get では引き続き見える）。
+        処理が終わったら complete_claim または release_claim を呼ぶこと。
+
+        Args:
+            now (float, optional): 現在時刻（UNIX時刻）
+            limit (int): 一度に取り出す最大件数
+            timeout (float): 取り出した借用を保持する期間（秒）
+
+        Returns:
+            list: 期限切れの借用情報のリスト
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT guild_id, user_id, channel_id, account, borrowed_at, expires_at "
+                    "FROM borrows WHERE expires_at <= ? "
+                    "AND (claimed_until IS NULL OR claimed_until <= ?) "
+                    "ORDER BY expires_at LIMIT ?",
+                    (now, now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE borrows SET claimed_until = ? WHERE guild_id = ? AND user_id = ?",
+                    [(now + timeout, row[0], row[1]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._to_dict(row) for row in rows]
+
+    def complete_claim(self, borrow):
+        """
+        自動返却が終わった借用を削除
+
+        取り出した後に同じユーザーが借り直した場合、新しい借用は削除しない。
+
+        Args:
+            borrow (dict): claim_expired で取り出した借用情報
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM borrows WHERE guild_id = ? AND user_id = ? AND borrowed_at = ?",
+                (borrow["guild_id"], borrow["user_id"], borrow["borrowed_at"])
+            )
+
+    def release_claim(self, borrow):
+        """
+        自動返却できなかった借用を戻す（次回の確認で再度取り出される）
+
+        Args:
+            borrow (dict): claim_expired で取り出した借用情報
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE borrows SET claimed_until = NULL "
+                "WHERE guild_id = ? AND user_id = ? AND borrowed_at = ?",
+                (borrow["guild_id"], borrow["user_id"], borrow["borrowed_at"])
+            )
+
+    def count(self):
+        """
+        借用中の件数を取得
+
+        Returns:
+            int: 借用中の件数
+        """
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM borrows").fetchone()
+        return count
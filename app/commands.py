@@ -1,41 +1,148 @@
+import io
+import time
 import logging
 import asyncio
+import functools
+import datetime
 import discord
 from discord import app_commands
-from .valorant_api import get_valorant_rank
+from .valorant_api import get_valorant_rank, get_current_rank, is_api_available
 from .accounts import (
-    TOKYO_TZ, borrowed_accounts, user_status, 
-    auto_return_account, is_account_borrowed, get_return_time_str
+    TOKYO_TZ, borrow_account, get_borrowed_account, is_account_borrowed,
+    get_return_time_str, reset_borrow,
+    notify_account_event
 )
 from .modals import AccountRegisterModal, RankUpdateModal
+from .rank_refresher import (
+    RANK_FIELDS, mark_refreshed, record_rank_marker, has_rank_changed
+)
+from .spreadsheet import get_cell_value, get_column_map
+from .sheets_client import bulk_priority
 from .kabaneri import kabaneri_command
+from .message_cleanup import stream_cleanup
+from .account_index import INDEX_FIELDS, get_account_index
+from .log_pipeline import bind_log_context
+from .profiler import MAX_PROFILE_SECONDS, capture_profile, is_profiling
+from .rank_history import get_rank_history, render_sparkline
+from .borrow_stats import get_borrow_stats, render_histogram
+from .ranks import TIER_NAMES, RADIANT_TIER, parse_tier
+
+# /remove_comment で一度に確認できるメッセージ数の上限
+MAX_REMOVE_LIMIT = 10000
+# /return_account でモーダル表示前に行う処理全体（借用情報の読み込み・ワークシートの取得・
+# 状態確認・ランク取得）の待ち時間（秒）
+# Discordの応答期限（3秒）内にモーダルを送るため、これを超えた処理は待たない
+RETURN_PREFETCH_TIMEOUT = 2.0
 
 
 # コマンド登録関数
-def register_commands(bot, sheet, sheet_append_row, sheet_update_cell, 
-                      get_all_accounts):
+def register_commands(bot, guild_sheets, sheet_append_row, sheet_update_cell, 
+                      get_all_accounts, availability_board=None, waitlist=None):
     """
     スラッシュコマンドを登録
     
     Args:
         bot: Discordボット
-        sheet: スプレッドシート
-        sheet_append_row: 行追加関数
-        sheet_update_cell: セル更新関数
+        guild_sheets (GuildSheets): サーバーごとのスプレッドシートの対応表
+        sheet_append_row: 行追加関数 (sheet, row_data)
+        sheet_update_cell: セル更新関数 (sheet, row, col, value)
         get_all_accounts: アカウント一覧取得関数
+        availability_board (AvailabilityBoard, optional): 利用可能なアカウントのボード
+        waitlist (Waitlist, optional): 利用可能なアカウントがない場合の待機列
     """
     tree = bot.tree
+
+    async def open_guild_sheet(interaction):
+        """
+        コマンドを実行したサーバーのワークシートを取得（応答を保留した後に呼び出す）
+
+        取得できない場合（スプレッドシートが見つからないなど）はユーザーに通知する。
+
+        Returns:
+            Worksheet or None: ワークシート（取得できなかった場合はNone）
+        """
+        try:
+            return await guild_sheets.for_guild(interaction.guild_id)
+        except Exception as e:
+            logging.error(f"サーバー {interaction.guild_id} のワークシートを取得できませんでした: {e}")
+            await interaction.followup.send(
+                "スプレッドシートを開けませんでした。後でもう一度試してください。",
+                ephemeral=True
+            )
+            return None
+
+    async def guild_context(interaction):
+        """
+        コマンドを実行したサーバーのワークシートを取得（応答を保留した後に呼び出す）
+
+        Returns:
+            tuple or None: (ワークシート, セル更新関数)。取得できなかった場合はNone
+        """
+        sheet = await open_guild_sheet(interaction)
+        if sheet is None:
+            return None
+        return sheet, functools.partial(sheet_update_cell, sheet)
+
+    async def fetch_borrow_rank(account):
+        """
+        貸し出すアカウントのランク情報を取得
+
+        Returns:
+            RankSnapshot or None: ランク情報（取得できなかった場合はNone）
+        """
+        val_username = account.val_username
+        val_tag = account.val_tag
+        if not val_username or not val_tag:
+            logging.warning(
+                f"アカウント借用: ユーザー名またはタグが空 - "
+                f"username: '{val_username}', tag: '{val_tag}'"
+            )
+            return None
+
+        logging.info(f"アカウント借用: Valorantランク情報取得試行 - {val_username}#{val_tag}")
+        rank_info = await get_valorant_rank("ap", val_username, val_tag)
+        if not rank_info:
+            logging.warning(f"アカウント借用: ランク情報取得失敗 - {val_username}#{val_tag}")
+            return None
+        mark_refreshed(account)
+        record_rank_marker(account, rank_info)
+        logging.info(
+            f"アカウント借用: ランク情報取得成功 - {val_username}#{val_tag}, "
+            f"Rank: {rank_info.current_rank}"
+        )
+        return rank_info
     
     # /register コマンド
     @tree.command(name="register", description="新規アカウントを登録します")
     async def register(interaction: discord.Interaction):
-        modal = AccountRegisterModal(sheet_append_row)
+        guild_id = interaction.guild_id
+
+        async def append_to_guild_sheet(row_data):
+            # モーダルは応答期限内に表示する必要があるため、ワークシートは送信時に取得する
+            try:
+                sheet = await guild_sheets.for_guild(guild_id)
+            except Exception as e:
+                logging.error(f"サーバー {guild_id} のワークシートを取得できませんでした: {e}")
+                return False
+            return await sheet_append_row(sheet, row_data)
+
+        modal = AccountRegisterModal(append_to_guild_sheet)
         await interaction.response.send_modal(modal)
 
     # /use_account コマンド（アカウント借用）
     @tree.command(name="use_account", description="アカウントを借りる")
-    async def use_account(interaction: discord.Interaction):
-        if is_account_borrowed(interaction.user.id):
+    @app_commands.describe(
+        account="借りるアカウント（名前・ランク・ELOで検索できます）",
+        min_rank="候補を絞り込むランクの下限",
+        max_rank="候補を絞り込むランクの上限"
+    )
+    async def use_account(
+        interaction: discord.Interaction,
+        account: str,
+        min_rank: str = None,
+        max_rank: str = None
+    ):
+        if await is_account_borrowed(interaction.user.id, interaction.guild_id):
             await interaction.response.send_message(
                 "すでにアカウントを借りています。返却してください。",
                 ephemeral=True
@@ -43,6 +150,10 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
             return
 
         await interaction.response.defer(ephemeral=True)
+        context = await guild_context(interaction)
+        if context is None:
+            return
+        sheet, update_cell = context
 
         try:
             accounts = await get_all_accounts(sheet)
@@ -54,308 +165,245 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
             )
             return
 
+        # 待機列のほかのユーザーに確保されているアカウントは借りられない
+        reserved = await waitlist.reservations(sheet.key) if waitlist is not None else {}
         available_accounts = [
-            {**acc, "row": index + 2}
-            for index, acc in enumerate(accounts)
-            if acc["status"] == "available"
+            acc for acc in accounts
+            if acc.status == "available"
+            and reserved.get(acc.row) in (None, interaction.user.id)
         ]
-
-        if not available_accounts:
+        selected_account = next(
+            (acc for acc in available_accounts if acc.name == account), None
+        )
+        bind_log_context(account=account, sheet=sheet.key)
+        if selected_account is None:
+            if not available_accounts and waitlist is not None and interaction.guild_id:
+                position = await waitlist.join(
+                    interaction.guild_id, interaction.user.id, interaction.channel_id
+                )
+                await interaction.followup.send(
+                    f"利用可能なアカウントがありません。待機列に登録しました（{position}番目）。\n"
+                    "アカウントが返却されたらDMでお知らせします。",
+                    ephemeral=True
+                )
+                return
             await interaction.followup.send(
-                "利用可能なアカウントがありません。",
+                "指定したアカウントは利用できません。候補から選択してください。",
                 ephemeral=True
             )
             return
 
-        options = [
-            discord.SelectOption(label=f"{acc['name']} ({acc['rank']})", value=acc["name"])
-            for acc in available_accounts
-        ]
+        guild_id = interaction.guild.id if interaction.guild else None
+        channel_id = interaction.channel.id if interaction.channel else None
+        if guild_id is None or channel_id is None:
+            await interaction.followup.send(
+                "サーバー情報の取得に失敗しました。管理者に連絡してください。",
+                ephemeral=True
+            )
+            return
 
-        class AccountDropdown(discord.ui.Select):
-            def __init__(self):
-                super().__init__(placeholder="アカウントを選択してください", options=options)
+        # 状態の書き込みとランク情報の取得は互いに依存しないため同時に行う
+        claim_result, rank_info = await asyncio.gather(
+            update_cell(selected_account.row, "status", "borrowed"),
+            fetch_borrow_rank(selected_account),
+            return_exceptions=True
+        )
+        # update_cell は失敗しても例外を送出せずFalseを返す
+        if claim_result is not True:
+            logging.error(f"スプレッドシートの状態更新中にエラーが発生しました: {claim_result!r}")
+            await interaction.followup.send(
+                "アカウントの状態を更新できませんでした。後でもう一度試してください。",
+                ephemeral=True
+            )
+            return
+        if isinstance(rank_info, BaseException):
+            logging.error(f"Valorantランク情報更新エラー: {rank_info}", exc_info=rank_info)
+            rank_info = None
 
-            async def callback(self, interaction: discord.Interaction):
-                # 応答を遅延させる
-                await interaction.response.defer(ephemeral=True)
-                
-                selected_account = next(
-                    acc for acc in available_accounts if acc["name"] == self.values[0]
+        # 借用状態を共有ストアに記録（返却期限を過ぎるといずれかのプロセスが自動返却する）
+        try:
+            expires_at = await borrow_account(
+                interaction.user.id, selected_account, guild_id, channel_id
+            )
+        except Exception as e:
+            logging.error(f"借用状態の記録中にエラーが発生しました: {e}", exc_info=True)
+            expires_at = None
+            message = "アカウントの借用を記録できませんでした。後でもう一度試してください。"
+        else:
+            # 前の借用が残っている（自動返却の処理中など）
+            message = "前に借りたアカウントの返却処理中です。しばらくしてからもう一度試してください。"
+        if expires_at is None:
+            # 記録できなかった借用は返却されないため、スプレッドシートの状態を戻す
+            if not await update_cell(selected_account.row, "status", "available"):
+                logging.error(
+                    f"アカウント借用: 状態を元に戻せませんでした - row: {selected_account.row}"
                 )
-                try:
-                    await sheet_update_cell(selected_account["row"], 5, "borrowed")
-                except Exception as e:
-                    logging.error(f"スプレッドシートの状態更新中にエラーが発生しました: {e}")
-                    await interaction.followup.send(
-                        "アカウントの状態を更新できませんでした。後でもう一度試してください。",
-                        ephemeral=True
-                    )
-                    return
+            await interaction.followup.send(message, ephemeral=True)
+            return
+        notify_account_event("borrow", selected_account)
+        if waitlist is not None:
+            await waitlist.leave(guild_id, interaction.user.id)
 
-                user_status[interaction.user.id] = True
-                borrowed_accounts[interaction.user.id] = {
-                    "account": selected_account,
-                    "task": None,
-                    "guild_id": interaction.guild.id,
-                    "channel_id": interaction.channel.id
-                }
-
-                guild_id = interaction.guild.id if interaction.guild else None
-                channel_id = interaction.channel.id if interaction.channel else None
-                if guild_id is None or channel_id is None:
-                    await interaction.followup.send(
-                        "サーバー情報の取得に失敗しました。管理者に連絡してください。",
-                        ephemeral=True
-                    )
-                    return
+        return_time_str = get_return_time_str()
+
+        # 取得したランクを表示に使い、スプレッドシートへの書き込みは通知と同時に行う
+        rank_auto_updated = rank_info is not None
+        previous_rank = selected_account.rank
+        if rank_info:
+            selected_account.rank = rank_info.current_rank
 
-                # 自動返却タスクを作成
-                task = asyncio.create_task(
-                    auto_return_account(
-                        interaction.user.id, 
-                        selected_account, 
-                        guild_id, 
-                        channel_id,
-                        bot,
-                        sheet_update_cell
+        async def write_rank():
+            if not rank_info or rank_info.current_rank == previous_rank:
+                return
+            try:
+                if not await update_cell(selected_account.row, "rank", rank_info.current_rank):
+                    logging.error(
+                        f"アカウント借用: スプレッドシートのランク更新失敗 - "
+                        f"row: {selected_account.row}, rank: {rank_info.current_rank}"
                     )
+                    return
+                logging.info(
+                    f"アカウント借用: スプレッドシートのランク更新成功 - "
+                    f"row: {selected_account.row}, rank: {rank_info.current_rank}"
+                )
+                notify_account_event("rank_update", selected_account)
+            except Exception as e:
+                logging.error(
+                    f"アカウント借用: スプレッドシートのランク更新エラー - {str(e)}", 
+                    exc_info=True
                 )
-                borrowed_accounts[interaction.user.id]["task"] = task
 
-                return_time_str = get_return_time_str()
-                
-                # Valorantのより詳細なランク情報を取得
-                rank_info = None
-                rank_update_success = False
-                
-                if "val_username" in selected_account and "val_tag" in selected_account:
-                    val_username = selected_account.get("val_username")
-                    val_tag = selected_account.get("val_tag")
-                    
-                    if val_username and val_tag:
-                        logging.info(
-                            f"アカウント借用: Valorantランク情報取得試行 - {val_username}#{val_tag}"
-                        )
-                        
-                        try:
-                            rank_info = get_valorant_rank("ap", val_username, val_tag)
-                            
-                            # 取得に成功した場合はスプレッドシートのランク情報を更新
-                            if rank_info:
-                                logging.info(
-                                    f"アカウント借用: ランク情報取得成功 - {val_username}#{val_tag}, "
-                                    f"Rank: {rank_info['current_rank']}"
-                                )
-                                
-                                try:
-                                    # スプレッドシートのランク列（4列目）を更新
-                                    await sheet_update_cell(
-                                        selected_account["row"], 
-                                        4, 
-                                        rank_info["current_rank"]
-                                    )
-                                    logging.info(
-                                        f"アカウント借用: スプレッドシートのランク更新成功 - "
-                                        f"row: {selected_account['row']}, "
-                                        f"rank: {rank_info['current_rank']}"
-                                    )
-                                    
-                                    # メモリ上のアカウント情報も更新
-                                    selected_account["rank"] = rank_info["current_rank"]
-                                    rank_update_success = True
-                                except Exception as e:
-                                    logging.error(
-                                        f"アカウント借用: スプレッドシートのランク更新エラー - {str(e)}", 
-                                        exc_info=True
-                                    )
-                                    import traceback
-                                    logging.error(traceback.format_exc())
-                            else:
-                                logging.warning(
-                                    f"アカウント借用: ランク情報取得失敗 - {val_username}#{val_tag}"
-                                )
-                        except Exception as e:
-                            logging.error(f"Valorantランク情報更新エラー: {str(e)}", exc_info=True)
-                            import traceback
-                            logging.error(traceback.format_exc())
-                    else:
-                        logging.warning(
-                            f"アカウント借用: ユーザー名またはタグが空 - "
-                            f"username: '{val_username}', tag: '{val_tag}'"
-                        )
-                else:
-                    logging.warning(
-                        "アカウント借用: Valorant情報なし - "
-                        "val_usernameまたはval_tagがアカウント情報に存在しません"
-                    )
-                    logging.debug(f"アカウント情報キー: {list(selected_account.keys())}")
-                
-                # アカウント情報の表示
-                account_details = (
-                    f"**アカウント情報:**\n"
-                    f"**Name:** {selected_account['name']}\n"
-                    f"**ID:** {selected_account['id']}\n"
-                    f"**Password:** {selected_account['password']}\n"
-                    f"**Rank:** {selected_account['rank']}"
+        def build_account_embed(description):
+            """貸し出したアカウントの情報の埋め込みメッセージを作成"""
+            embed = discord.Embed(
+                title=f"アカウント情報: {selected_account.name}",
+                description=description,
+                color=0x00ff00  # 緑色
+            )
+            embed.add_field(
+                name="基本情報",
+                value=(
+                    f"**Name:** {selected_account.name}\n"
+                    f"**ID:** {selected_account.id}\n"
+                    f"**Password:** {selected_account.password}\n"
+                    f"**Rank:** {selected_account.rank}"
+                    f"{' (自動更新済み)' if rank_auto_updated else ''}"
+                ),
+                inline=False
+            )
+            if selected_account.has_valorant_info:
+                embed.add_field(
+                    name="Valorant アカウント",
+                    value=(
+                        f"{selected_account.val_username}#"
+                        f"{selected_account.val_tag}"
+                    ),
+                    inline=False
                 )
-                
-                if rank_update_success:
-                    account_details += " (自動更新済み)"
-                
-                # Valorantユーザー情報を追加
-                if "val_username" in selected_account and "val_tag" in selected_account:
-                    account_details += (
-                        f"\n**Valorant:** {selected_account['val_username']}#"
-                        f"{selected_account['val_tag']}"
-                    )
-                
-                # Valorantの詳細情報がある場合は追加
-                if rank_info:
-                    account_details += (
-                        f"\n\n**Valorant詳細情報:**\n"
-                        f"**現在のランク:** {rank_info['current_rank']}\n"
-                        f"**ティア内ランキング:** {rank_info['tier_ranking']}\n"
-                        f"**最後のゲームでのMMR変化:** {rank_info['mmr_change']}\n"
-                        f"**ELO:** {rank_info['elo']}\n"
-                        f"**過去最高ランク:** {rank_info['highest_rank']} "
-                        f"(シーズン: {rank_info['highest_rank_season']})\n"
-                    )
-                elif "val_username" in selected_account and "val_tag" in selected_account:
-                    account_details += "\n\n**注意:** Valorantの詳細情報を取得できませんでした。"
-                
-                account_details += f"\n**返却期限:** {return_time_str}\n"
-                
-                # DMに詳細情報を埋め込み形式で送信
-                try:
-                    # 埋め込みメッセージを作成
-                    dm_embed = discord.Embed(
-                        title=f"アカウント情報: {selected_account['name']}",
-                        description="アカウントの貸出が完了しました。以下の情報を使用してログインしてください。",
-                        color=0x00ff00  # 緑色
-                    )
-                    
-                    # 基本情報フィールド
-                    dm_embed.add_field(
-                        name="基本情報",
-                        value=(
-                            f"**Name:** {selected_account['name']}\n"
-                            f"**ID:** {selected_account['id']}\n"
-                            f"**Password:** {selected_account['password']}\n"
-                            f"**Rank:** {selected_account['rank']}"
-                            f"{' (自動更新済み)' if rank_update_success else ''}"
-                        ),
-                        inline=False
-                    )
-                    
-                    # Valorantユーザー情報フィールド
-                    if "val_username" in selected_account and "val_tag" in selected_account:
-                        dm_embed.add_field(
-                            name="Valorant アカウント",
-                            value=(
-                                f"{selected_account['val_username']}#"
-                                f"{selected_account['val_tag']}"
-                            ),
-                            inline=False
-                        )
-                    
-                    # Valorantの詳細情報フィールド
-                    if rank_info:
-                        dm_embed.add_field(
-                            name="Valorant詳細情報",
-                            value=(
-                                f"**現在のランク:** {rank_info['current_rank']}\n"
-                                f"**ティア内ランキング:** {rank_info['tier_ranking']}\n"
-                                f"**最後のゲームでのMMR変化:** {rank_info['mmr_change']}\n"
-                                f"**ELO:** {rank_info['elo']}\n"
-                                f"**過去最高ランク:** {rank_info['highest_rank']} "
-                                f"(シーズン: {rank_info['highest_rank_season']})"
-                            ),
-                            inline=False
-                        )
-                    elif "val_username" in selected_account and "val_tag" in selected_account:
-                        dm_embed.add_field(
-                            name="注意",
-                            value="Valorantの詳細情報を取得できませんでした。",
-                            inline=False
-                        )
-                    
-                    # 返却期限
-                    dm_embed.set_footer(text=f"返却期限: {return_time_str}")
-                    
-                    # 埋め込みメッセージをDMで送信
-                    await interaction.user.send(embed=dm_embed)
-                    await interaction.followup.send("アカウント情報をDMに送信しました。", ephemeral=True)
-                except discord.errors.Forbidden:
-                    # DMが送信できない場合は従来通り（埋め込み形式で）
-                    embed = discord.Embed(
-                        title=f"アカウント情報: {selected_account['name']}",
-                        description="**注意:** DMが無効になっているため、このメッセージが公開されることはありません。",
-                        color=0x00ff00
-                    )
-                    
-                    # アカウント情報（DMと同じ内容）
-                    embed.add_field(
-                        name="基本情報",
-                        value=(
-                            f"**Name:** {selected_account['name']}\n"
-                            f"**ID:** {selected_account['id']}\n"
-                            f"**Password:** {selected_account['password']}\n"
-                            f"**Rank:** {selected_account['rank']}"
-                            f"{' (自動更新済み)' if rank_update_success else ''}"
-                        ),
-                        inline=False
-                    )
-                    
-                    if "val_username" in selected_account and "val_tag" in selected_account:
-                        embed.add_field(
-                            name="Valorant アカウント",
-                            value=(
-                                f"{selected_account['val_username']}#"
-                                f"{selected_account['val_tag']}"
-                            ),
-                            inline=False
-                        )
-                    
-                    if rank_info:
-                        embed.add_field(
-                            name="Valorant詳細情報",
-                            value=(
-                                f"**現在のランク:** {rank_info['current_rank']}\n"
-                                f"**ティア内ランキング:** {rank_info['tier_ranking']}\n"
-                                f"**最後のゲームでのMMR変化:** {rank_info['mmr_change']}\n"
-                                f"**ELO:** {rank_info['elo']}\n"
-                                f"**過去最高ランク:** {rank_info['highest_rank']} "
-                                f"(シーズン: {rank_info['highest_rank_season']})"
-                            ),
-                            inline=False
-                        )
-                    elif "val_username" in selected_account and "val_tag" in selected_account:
-                        embed.add_field(
-                            name="注意",
-                            value="Valorantの詳細情報を取得できませんでした。",
-                            inline=False
-                        )
-                    
-                    embed.set_footer(text=f"返却期限: {return_time_str}")
-                    
-                    await interaction.followup.send(embed=embed, ephemeral=True)
-
-                # チャンネルにメンション付きメッセージを埋め込み形式で送信
-                embed = discord.Embed(
-                    title="アカウント借用通知",
-                    description=(
-                        f"{interaction.user.mention} が "
-                        f"**{selected_account['name']}** を借りました！"
+            if rank_info:
+                embed.add_field(
+                    name="Valorant詳細情報",
+                    value=(
+                        f"**現在のランク:** {rank_info.current_rank}\n"
+                        f"**ティア内ランキング:** {rank_info.tier_ranking}\n"
+                        f"**最後のゲームでのMMR変化:** {rank_info.mmr_change}\n"
+                        f"**ELO:** {rank_info.elo}\n"
+                        f"**過去最高ランク:** {rank_info.highest_rank} "
+                        f"(シーズン: {rank_info.highest_rank_season})"
                     ),
-                    color=0x00ff00  # 緑色
+                    inline=False
                 )
-                embed.set_footer(text=f"返却期限: {return_time_str}")
-                await interaction.channel.send(embed=embed)
+            elif selected_account.has_valorant_info:
+                embed.add_field(
+                    name="注意",
+                    value="Valorantの詳細情報を取得できませんでした。",
+                    inline=False
+                )
+            embed.set_footer(text=f"返却期限: {return_time_str}")
+            return embed
 
-        view = discord.ui.View()
-        view.add_item(AccountDropdown())
-        await interaction.followup.send("アカウントを選択してください:", view=view, ephemeral=True)
+        async def send_credentials():
+            try:
+                await interaction.user.send(embed=build_account_embed(
+                    "アカウントの貸出が完了しました。以下の情報を使用してログインしてください。"
+                ))
+                await interaction.followup.send("アカウント情報をDMに送信しました。", ephemeral=True)
+            except discord.HTTPException:
+                # DMが送信できない場合は本人にだけ見える応答で送る
+                await interaction.followup.send(
+                    embed=build_account_embed(
+                        "**注意:** DMが無効になっているため、このメッセージが公開されることはありません。"
+                    ),
+                    ephemeral=True
+                )
+
+        async def send_channel_notice():
+            # チャンネルにメンション付きメッセージを埋め込み形式で送信
+            embed = discord.Embed(
+                title="アカウント借用通知",
+                description=(
+                    f"{interaction.user.mention} が "
+                    f"**{selected_account.name}** を借りました！"
+                ),
+                color=0x00ff00  # 緑色
+            )
+            embed.set_footer(text=f"返却期限: {return_time_str}")
+            await interaction.channel.send(embed=embed)
+
+        # ランクの書き込み・ログイン情報の送信・チャンネルへの通知は並行して行い、
+        # それぞれの失敗はほかの処理に影響させない
+        stages = ("ランクの書き込み", "ログイン情報の送信", "チャンネルへの通知")
+        results = await asyncio.gather(
+            write_rank(), send_credentials(), send_channel_notice(),
+            return_exceptions=True
+        )
+        for stage, result in zip(stages, results):
+            if isinstance(result, BaseException):
+                logging.error(f"アカウント借用: {stage}に失敗しました - {result}", exc_info=result)
+
+    @use_account.autocomplete("account")
+    async def use_account_autocomplete(interaction: discord.Interaction, current: str):
+        try:
+            sheet = await guild_sheets.for_guild(interaction.guild_id)
+            # スプレッドシートが編集されていなければキャッシュ済みの索引をそのまま使う
+            await get_all_accounts(sheet, fields=INDEX_FIELDS)
+            reserved = await waitlist.reservations(sheet.key) if waitlist is not None else {}
+        except Exception as e:
+            logging.warning(f"候補の取得に失敗しました: {e}")
+            return []
+        # 待機列のほかのユーザーに確保されているアカウントは候補に出さない
+        exclude = {row for row, user_id in reserved.items() if user_id != interaction.user.id}
+        return [
+            app_commands.Choice(name=f"{acc.name} ({acc.rank})"[:100], value=acc.name)
+            for acc in get_account_index(sheet.key).search(
+                current, tier_range=tier_range_of(interaction.namespace), exclude=exclude
+            )
+        ]
+
+    @use_account.autocomplete("min_rank")
+    @use_account.autocomplete("max_rank")
+    async def rank_name_autocomplete(interaction: discord.Interaction, current: str):
+        current = current.strip().lower()
+        return [
+            app_commands.Choice(name=name, value=name)
+            for name in TIER_NAMES if current in name.lower()
+        ][:25]
+
+    def tier_range_of(namespace):
+        """
+        入力中のコマンドのランク範囲をティアIDの範囲に変換
+
+        Returns:
+            tuple or None: (下限, 上限)。範囲が指定されていない場合はNone
+        """
+        min_rank = getattr(namespace, "min_rank", None)
+        max_rank = getattr(namespace, "max_rank", None)
+        if not min_rank and not max_rank:
+            return None
+        low = parse_tier(min_rank) if min_rank else None
+        high = parse_tier(max_rank) if max_rank else None
+        low, high = low or 3, high or RADIANT_TIER
+        return (low, high) if low <= high else (high, low)
 
     # /update_ranks コマンド
     @tree.command(
@@ -371,9 +419,14 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
             return
 
         await interaction.response.defer(ephemeral=True)
+        context = await guild_context(interaction)
+        if context is None:
+            return
+        sheet, update_cell = context
         
         try:
-            accounts = await get_all_accounts(sheet)
+            with bulk_priority():
+                accounts = await get_all_accounts(sheet, fields=RANK_FIELDS)
         except Exception as e:
             logging.error(f"スプレッドシートからデータ取得中にエラーが発生しました: {e}")
             await interaction.followup.send(
@@ -385,9 +438,7 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
         # ステータスパラメータが指定されている場合はフィルタリング
         if status:
             filtered_accounts = [
-                {**acc, "row": index + 2}
-                for index, acc in enumerate(accounts)
-                if acc["status"].lower() == status.lower()
+                acc for acc in accounts if acc.status.lower() == status.lower()
             ]
             
             if not filtered_accounts:
@@ -399,7 +450,7 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
             target_accounts = filtered_accounts
         else:
             # ステータスが指定されていない場合はすべてのアカウント
-            target_accounts = [{**acc, "row": index + 2} for index, acc in enumerate(accounts)]
+            target_accounts = accounts
         
         if not target_accounts:
             await interaction.followup.send("更新対象のアカウントがありません。", ephemeral=True)
@@ -413,6 +464,7 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
         success_count = 0
         fail_count = 0
         no_val_info_count = 0
+        skipped_count = 0
         
         # 処理状況表示のためのプログレスメッセージ
         progress_message = await interaction.followup.send(
@@ -421,8 +473,17 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
         )
         
         updated_accounts = []
+        aborted_count = 0
         
         for i, account in enumerate(target_accounts):
+            # APIが一時停止中の場合は残りのアカウントへのリクエストを中止
+            if not is_api_available():
+                aborted_count = len(target_accounts) - i
+                logging.warning(
+                    f"一括ランク更新: Valorant APIが一時停止中のため残り{aborted_count}件を中止します"
+                )
+                break
+
             # 10%完了ごとに進捗を更新
             if (i % max(1, len(target_accounts) // 10)) == 0 or i == len(target_accounts) - 1:
                 progress_percent = int((i / len(target_accounts)) * 100)
@@ -433,38 +494,48 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
                 except:
                     pass
             
-            if (
-                "val_username" not in account or 
-                "val_tag" not in account or 
-                not account.get("val_username") or 
-                not account.get("val_tag")
-            ):
+            if not account.has_valorant_info:
                 no_val_info_count += 1
                 continue
             
-            val_username = account.get("val_username")
-            val_tag = account.get("val_tag")
+            val_username = account.val_username
+            val_tag = account.val_tag
             
             logging.info(f"一括ランク更新: {val_username}#{val_tag} の情報取得中...")
             
             try:
-                rank_info = get_valorant_rank("ap", val_username, val_tag)
+                # MMR履歴で試合の有無を確認し、変わっていた場合だけ詳細情報を取得する
+                rank_info = await get_current_rank(
+                    "ap", val_username, val_tag, retries=2
+                )
                 
                 if rank_info:
-                    old_rank = account.get("rank", "Unknown")
-                    new_rank = rank_info["current_rank"]
+                    rank_changed = has_rank_changed(account, rank_info)
+                    mark_refreshed(account)
+                    record_rank_marker(account, rank_info)
+                    old_rank = (account.rank or "Unknown")
+                    new_rank = rank_info.current_rank
+                    # 前回の取得以降に試合をしておらずランクも同じならシート更新を省略
+                    if not rank_changed and old_rank == new_rank:
+                        skipped_count += 1
                     
                     # ランクが変わった場合のみスプレッドシートを更新（APIリクエスト削減のため）
                     if old_rank != new_rank:
-                        await sheet_update_cell(
-                            account["row"], 4, new_rank
-                        )
+                        with bulk_priority():
+                            written = await update_cell(
+                                account.row, "rank", new_rank
+                            )
+                        if not written:
+                            fail_count += 1
+                            await asyncio.sleep(0.5)
+                            continue
                         logging.info(
                             f"ランク更新: {val_username}#{val_tag} - {old_rank} -> {new_rank}"
                         )
-                        account["rank"] = new_rank
+                        account.rank = new_rank
+                        notify_account_event("rank_update", account)
                         updated_accounts.append({
-                            "name": account["name"],
+                            "name": account.name,
                             "old_rank": old_rank,
                             "new_rank": new_rank
                         })
@@ -493,6 +564,14 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
             f"- 失敗: {fail_count}件\n"
             f"- Valorant情報なし: {no_val_info_count}件\n"
         )
+        if aborted_count:
+            summary += f"- API一時停止により中止: {aborted_count}件\n"
+        checked_count = len(target_accounts) - no_val_info_count - aborted_count
+        if checked_count > 0:
+            summary += (
+                f"- 変更なし（スキップ）: {skipped_count}件 "
+                f"({skipped_count * 100 // checked_count}%)\n"
+            )
         
         # ランクが変更されたアカウントがある場合はリストを表示
         if updated_accounts:
@@ -526,44 +605,76 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
     # /return_account コマンド（アカウント返却）
     @tree.command(name="return_account", description="アカウントを返却する")
     async def return_account(interaction: discord.Interaction):
-        if interaction.user.id not in borrowed_accounts:
+        # モーダルは最初の応答でしか送れないため、応答までの処理全体で1つの期限を共有する
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + RETURN_PREFETCH_TIMEOUT
+
+        def remaining():
+            return max(0.0, deadline - loop.time())
+
+        try:
+            account_info = await asyncio.wait_for(
+                get_borrowed_account(interaction.user.id, interaction.guild_id), remaining()
+            )
+        except Exception as e:
+            logging.error(f"借用情報を読み込めませんでした: {e!r}")
+            await interaction.response.send_message(
+                "借用情報を読み込めませんでした。後でもう一度試してください。",
+                ephemeral=True
+            )
+            return
+        if account_info is None:
             await interaction.response.send_message("返却するアカウントがありません。", ephemeral=True)
             return
 
-        account_info = borrowed_accounts.get(interaction.user.id)
         account = account_info["account"]
-        task = account_info["task"]
         guild_id = account_info.get("guild_id")
         channel_id = account_info.get("channel_id")
 
-        # 状態チェック（不整合の場合はリセット）
+        # 借用後にサーバーの設定が変わっていても、借りたアカウントのワークシートに書き込む
         try:
-            cell_status = sheet.cell(account["row"], 5).value
-            if not account or cell_status != "borrowed":
-                borrowed_accounts.pop(interaction.user.id, None)
-                user_status.pop(interaction.user.id, None)
-                if task:
-                    task.cancel()
-                await interaction.response.send_message(
-                    "アカウントの借用状態が不整合でしたが、自動的にリセットしました。再度借用してください。",
-                    ephemeral=True
-                )
-                return
+            sheet = await asyncio.wait_for(
+                guild_sheets.for_account(account.sheet, guild_id), remaining()
+            )
         except Exception as e:
-            logging.error(f"スプレッドシートからの状態確認エラー: {e}")
-            # エラーが発生しても処理は継続
+            logging.error(f"返却するアカウントのワークシートを取得できませんでした: {e!r}")
+            await interaction.response.send_message(
+                "スプレッドシートを開けませんでした。後でもう一度試してください。",
+                ephemeral=True
+            )
+            return
+        update_cell = functools.partial(sheet_update_cell, sheet)
+        bind_log_context(account=account.name, sheet=sheet.key)
 
-        if task:
-            task.cancel()
+        # 状態チェックとランク取得を並行して行う（期限内に終わらなければ諦める）
+        cell_status, rank_info = await asyncio.gather(
+            asyncio.wait_for(get_cell_value(sheet, account.row, "status"), remaining()),
+            asyncio.wait_for(RankUpdateModal.fetch_rank(account), remaining()),
+            return_exceptions=True
+        )
 
+        # 状態チェック（不整合の場合はリセット）
+        if isinstance(cell_status, BaseException):
+            logging.error(f"スプレッドシートからの状態確認エラー: {cell_status!r}")
+            # エラーが発生しても処理は継続
+        elif cell_status != "borrowed":
+            await interaction.response.send_message(
+                "アカウントの借用状態が不整合でしたが、自動的にリセットしました。再度借用してください。",
+                ephemeral=True
+            )
+            await reset_borrow(interaction.user.id, guild_id)
+            return
+
+        if isinstance(rank_info, BaseException):
+            logging.warning(f"返却時のランク取得に失敗しました: {rank_info!r}")
+            rank_info = None
         modal = RankUpdateModal(
             account, 
-            sheet_update_cell, 
-            borrowed_accounts, 
-            user_status, 
+            update_cell, 
             guild_id, 
             channel_id, 
-            bot
+            bot,
+            rank_info
         )
         await interaction.response.send_modal(modal)
 
@@ -572,7 +683,15 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
         name="remove_comment", 
         description="コードブロック、画像、ファイルを除くコメントを削除します。"
     )
-    async def remove_comment(interaction: discord.Interaction):
+    @app_commands.describe(
+        limit="確認するメッセージ数の上限（省略時は100件、daysを指定した場合は無制限）",
+        days="直近何日分のメッセージを対象にするか"
+    )
+    async def remove_comment(
+        interaction: discord.Interaction,
+        limit: app_commands.Range[int, 1, MAX_REMOVE_LIMIT] = None,
+        days: app_commands.Range[int, 1, 3650] = None
+    ):
         if not interaction.user.guild_permissions.manage_messages:
             await interaction.response.send_message(
                 "このコマンドを使用する権限がありません。", 
@@ -582,41 +701,38 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
 
         await interaction.response.defer()
 
-        channel = interaction.channel
-        import datetime
-        now = datetime.datetime.now(datetime.timezone.utc)
-        bulk_deletable_messages = []
-        async_deletable_messages = []
+        if limit is None and days is None:
+            limit = 100
+        after = None
+        if days is not None:
+            after = discord.utils.utcnow() - datetime.timedelta(days=days)
 
-        async for message in channel.history(limit=100):
-            if not message.attachments and "```" not in message.content and not message.embeds:
-                if (now - message.created_at).days <= 14:
-                    bulk_deletable_messages.append(message)
-                else:
-                    async_deletable_messages.append(message)
+        # 進捗表示に使う応答メッセージ自体は削除しない
+        skip_ids = ()
+        try:
+            skip_ids = ((await interaction.original_response()).id,)
+        except discord.HTTPException:
+            pass
 
-        bulk_deleted_count = 0
-        if bulk_deletable_messages:
-            try:
-                await channel.delete_messages(bulk_deletable_messages)
-                bulk_deleted_count = len(bulk_deletable_messages)
-            except Exception as e:
-                logging.error(f"一括削除中にエラーが発生しました: {e}")
+        async def show_progress(job):
+            await interaction.edit_original_response(content=job.progress_text())
 
-        async_deleted_count = 0
-        for message in async_deletable_messages:
-            try:
-                await message.delete()
-                async_deleted_count += 1
-                await asyncio.sleep(0.5)
-            except Exception as e:
-                logging.error(f"個別削除中にエラーが発生しました: {e}")
+        job = await stream_cleanup(
+            interaction.channel, limit=limit, after=after,
+            skip_ids=skip_ids, on_progress=show_progress
+        )
 
-        total_deleted = bulk_deleted_count + async_deleted_count
-        await interaction.followup.send(
-            f"削除が完了しました！\n- 一括削除: {bulk_deleted_count} 件\n"
-            f"- 個別削除: {async_deleted_count} 件\n- 合計: {total_deleted} 件"
+        result = (
+            f"削除が完了しました！\n- 確認: {job.scanned} 件\n"
+            f"- 一括削除: {job.bulk_deleted} 件\n"
+            f"- 個別削除: {job.single_deleted} 件\n- 合計: {job.total_deleted} 件"
         )
+        if job.failed:
+            result += f"\n- 削除失敗: {job.failed} 件"
+        try:
+            await interaction.edit_original_response(content=result)
+        except discord.HTTPException:
+            await interaction.followup.send(result)
 
     # /reset_borrowed コマンド（管理者専用：借用状態の手動リセット）
     @tree.command(
@@ -633,12 +749,7 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
 
         try:
             user_id_int = int(user_id)
-            if user_id_int in borrowed_accounts:
-                account_info = borrowed_accounts.pop(user_id_int)
-                user_status.pop(user_id_int, None)
-                task = account_info.get("task")
-                if task:
-                    task.cancel()
+            if await reset_borrow(user_id_int, interaction.guild_id) is not None:
                 await interaction.response.send_message(
                     f"ユーザーID {user_id} の借用状態をリセットしました。", 
                     ephemeral=True
@@ -654,6 +765,329 @@ def register_commands(bot, sheet, sheet_append_row, sheet_update_cell,
                 ephemeral=True
             )
 
+    # /availability_board コマンド（利用可能なアカウントのボードを設置・解除）
+    @tree.command(
+        name="availability_board",
+        description="利用可能なアカウントの一覧をこのチャンネルにピン留めします"
+    )
+    @app_commands.describe(enable="Falseを指定するとこのチャンネルのボードを解除します")
+    async def availability_board_command(interaction: discord.Interaction, enable: bool = True):
+        if not interaction.user.guild_permissions.manage_messages:
+            await interaction.response.send_message(
+                "このコマンドを使用する権限がありません。", 
+                ephemeral=True
+            )
+            return
+        if availability_board is None:
+            await interaction.response.send_message(
+                "ボード機能は利用できません。", 
+                ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        if not enable:
+            if await availability_board.disable(interaction.channel.id):
+                await interaction.followup.send("このチャンネルのボードを解除しました。", ephemeral=True)
+            else:
+                await interaction.followup.send("このチャンネルにはボードがありません。", ephemeral=True)
+            return
+
+        sheet = await open_guild_sheet(interaction)
+        if sheet is None:
+            return
+
+        try:
+            # 索引を最新の状態にしてから設置する
+            await get_all_accounts(sheet, fields=INDEX_FIELDS)
+            await availability_board.enable(interaction.channel)
+        except discord.HTTPException as e:
+            logging.error(f"ボードの設置に失敗しました: {e}")
+            await interaction.followup.send(
+                "ボードを設置できませんでした。Botの権限を確認してください。", 
+                ephemeral=True
+            )
+            return
+        await interaction.followup.send(
+            "このチャンネルにボードを設置しました。借用・返却のたびに自動で更新されます。",
+            ephemeral=True
+        )
+
+    # /configure_sheet コマンド（管理者専用：このサーバーが使用するスプレッドシートの設定）
+    @tree.command(
+        name="configure_sheet",
+        description="このサーバーが使用するアカウント用スプレッドシートを設定します（Botのオーナー専用）"
+    )
+    @app_commands.describe(
+        spreadsheet="スプレッドシート名（Botのサービスアカウントに共有されている必要があります）",
+        worksheet="ワークシートの番号（0始まり）"
+    )
+    async def configure_sheet(
+        interaction: discord.Interaction,
+        spreadsheet: str,
+        worksheet: app_commands.Range[int, 0, 199] = 0
+    ):
+        # サービスアカウントに共有されたスプレッドシートは他のサーバーのものも開けるため、
+        # サーバーの管理者ではなくBotの運用者だけが設定できる
+        if not await bot.is_owner(interaction.user):
+            await interaction.response.send_message(
+                "このコマンドを使用する権限がありません。", 
+                ephemeral=True
+            )
+            return
+        if interaction.guild_id is None:
+            await interaction.response.send_message(
+                "このコマンドはサーバー内でのみ使用できます。", 
+                ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        # 開けることとアカウント用のヘッダーがあることを確認してから設定を保存する
+        try:
+            sheet = await guild_sheets.worksheet_for(spreadsheet, worksheet)
+            column_map = await get_column_map(sheet)
+        except Exception as e:
+            logging.error(f"スプレッドシート {spreadsheet} を開けませんでした: {e}")
+            await interaction.followup.send(
+                f"スプレッドシート **{spreadsheet}**（ワークシート {worksheet}）を開けませんでした。"
+                "名前とサービスアカウントへの共有を確認してください。",
+                ephemeral=True
+            )
+            return
+        if "name" not in column_map or "status" not in column_map:
+            await interaction.followup.send(
+                f"スプレッドシート **{spreadsheet}**（ワークシート {worksheet}）に"
+                "name・status の列がありません。設定は変更していません。",
+                ephemeral=True
+            )
+            return
+        guild_sheets.configure(interaction.guild_id, spreadsheet, worksheet)
+        accounts = await get_all_accounts(sheet, fields=INDEX_FIELDS)
+        await interaction.followup.send(
+            f"このサーバーのスプレッドシートを **{spreadsheet}**（ワークシート {worksheet}）に"
+            f"設定しました。読み込んだアカウント: {len(accounts)}件",
+            ephemeral=True
+        )
+
+    # /waitlist コマンド（待機列の確認・解除）
+    @tree.command(name="waitlist", description="アカウントの待機列での順番を確認します")
+    @app_commands.describe(leave="Trueを指定すると待機列から抜けます")
+    async def waitlist_command(interaction: discord.Interaction, leave: bool = False):
+        if waitlist is None:
+            await interaction.response.send_message("待機列は利用できません。", ephemeral=True)
+            return
+        if leave:
+            if await waitlist.leave(interaction.guild_id, interaction.user.id):
+                message = "待機列から抜けました。"
+            else:
+                message = "待機列に並んでいません。"
+        else:
+            position = await waitlist.position(interaction.guild_id, interaction.user.id)
+            if position:
+                message = f"待機列の {position} 番目です。"
+            else:
+                message = "待機列に並んでいません。"
+        await interaction.response.send_message(message, ephemeral=True)
+
+    # /leaderboard コマンド（レーティング順のランキング）
+    @tree.command(name="leaderboard", description="アカウントをランクの高い順に表示します")
+    @app_commands.describe(
+        limit="表示する件数",
+        available_only="利用可能なアカウントのみを表示するか"
+    )
+    async def leaderboard(
+        interaction: discord.Interaction,
+        limit: app_commands.Range[int, 1, 25] = 10,
+        available_only: bool = False
+    ):
+        await interaction.response.defer(ephemeral=True)
+        sheet = await open_guild_sheet(interaction)
+        if sheet is None:
+            return
+        # スプレッドシートが編集されていなければキャッシュ済みの索引をそのまま使う
+        await get_all_accounts(sheet, fields=INDEX_FIELDS)
+        entries = get_account_index(sheet.key).leaderboard(limit, available_only)
+        if not entries:
+            await interaction.followup.send(
+                "ランク情報のあるアカウントがありません。", ephemeral=True
+            )
+            return
+
+        lines = []
+        for position, (acc, value) in enumerate(entries, start=1):
+            status = "" if acc.status == "available" else "（借用中）"
+            rank = acc.rank or "不明"
+            lines.append(f"**{position}.** {acc.name} - {rank} / {value}{status}")
+        embed = discord.Embed(
+            title="ランキング" + ("（利用可能なアカウント）" if available_only else ""),
+            description="\n".join(lines),
+            color=discord.Color.gold()
+        )
+        embed.set_footer(text="ELOが未取得のアカウントはランクから推定した値を表示しています")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    # /stats コマンド（借用の集計を表示）
+    @tree.command(name="stats", description="アカウントの借用状況の集計を表示します")
+    @app_commands.describe(user="指定するとそのユーザーの借用回数を表示します")
+    async def stats(interaction: discord.Interaction, user: discord.Member = None):
+        borrow_stats = get_borrow_stats()
+        loop = asyncio.get_running_loop()
+        if user is not None:
+            count = await loop.run_in_executor(
+                None, borrow_stats.user_count, interaction.guild_id, user.id
+            )
+            await interaction.response.send_message(
+                f"{user.mention} の借用回数: **{count}** 回", ephemeral=True
+            )
+            return
+
+        summary = await loop.run_in_executor(None, borrow_stats.summary, interaction.guild_id)
+        since = datetime.datetime.fromtimestamp(summary["since"], TOKYO_TZ)
+        mean_minutes = round(summary["mean_hold_seconds"] / 60)
+        embed = discord.Embed(
+            title="借用状況の集計",
+            description=(
+                f"借用: **{summary['borrows']}** 回 / 返却: **{summary['returns']}** 回 / "
+                f"自動返却: **{summary['auto_returns']}** 回\n"
+                f"平均借用時間: **{mean_minutes // 60}時間{mean_minutes % 60}分**"
+            ),
+            color=discord.Color.blue()
+        )
+        embed.add_field(
+            name="利用率の高いアカウント",
+            value="\n".join(
+                f"{name}: {rate:.0%}（{count}回）"
+                for name, rate, count in summary["top_accounts"]
+            ) or "なし",
+            inline=True
+        )
+        embed.add_field(
+            name="借用回数の多いユーザー",
+            value="\n".join(
+                f"<@{user_id}>: {count}回" for user_id, count in summary["top_users"]
+            ) or "なし",
+            inline=True
+        )
+        embed.add_field(
+            name="時間帯別の借用回数",
+            value=f"```\n{render_histogram(summary['hourly'])}\n```",
+            inline=False
+        )
+        embed.set_footer(text=f"集計開始: {since:%Y-%m-%d %H:%M}")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    # /rank_history コマンド（ランクの推移を表示）
+    @tree.command(name="rank_history", description="アカウントのランクの推移を表示します")
+    @app_commands.describe(account="アカウント名", days="直近何日分の推移を表示するか")
+    async def rank_history(
+        interaction: discord.Interaction,
+        account: str,
+        days: app_commands.Range[int, 1, 3650] = 30
+    ):
+        await interaction.response.defer(ephemeral=True)
+        sheet = await open_guild_sheet(interaction)
+        if sheet is None:
+            return
+        accounts = await get_all_accounts(sheet, fields=RANK_FIELDS)
+        target = next(
+            (acc for acc in accounts if acc.name.lower() == account.lower()), None
+        )
+        if target is None or not target.val_username or not target.val_tag:
+            await interaction.followup.send(
+                f"アカウント **{account}** のValorant情報が見つかりません。",
+                ephemeral=True
+            )
+            return
+
+        key = f"{target.val_username}#{target.val_tag}".lower()
+        since = time.time() - days * 86400
+        # 期間の開始位置は二分探索で求めるため、古い記録は読み込まない
+        observations = await asyncio.get_running_loop().run_in_executor(
+            None, get_rank_history().query, key, since
+        )
+        if not observations:
+            await interaction.followup.send(
+                f"**{target.name}** の直近{days}日間のランク記録はありません。",
+                ephemeral=True
+            )
+            return
+
+        first, last = observations[0], observations[-1]
+        elos = [observation.elo for observation in observations]
+        change = last.elo - first.elo
+        embed = discord.Embed(
+            title=f"{target.name} のランク推移（直近{days}日間）",
+            description=f"`{render_sparkline(observations)}`",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="現在のランク", value=target.rank or "不明", inline=True)
+        embed.add_field(name="ELO", value=f"{first.elo} → {last.elo} ({change:+d})", inline=True)
+        embed.add_field(name="最高 / 最低", value=f"{max(elos)} / {min(elos)}", inline=True)
+        embed.set_footer(
+            text=f"記録: {len(observations)}件 / "
+                 f"{datetime.datetime.fromtimestamp(first.timestamp, TOKYO_TZ):%Y-%m-%d %H:%M} から"
+        )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @rank_history.autocomplete("account")
+    async def rank_history_autocomplete(interaction: discord.Interaction, current: str):
+        try:
+            sheet = await guild_sheets.for_guild(interaction.guild_id)
+            accounts = await get_all_accounts(sheet, fields=RANK_FIELDS)
+        except Exception as e:
+            logging.warning(f"候補の取得に失敗しました: {e}")
+            return []
+        current = current.lower()
+        return [
+            app_commands.Choice(name=f"{acc.name} ({acc.rank})"[:100], value=acc.name)
+            for acc in accounts
+            if acc.name and acc.val_username and current in acc.name.lower()
+        ][:25]
+
+    # /profile コマンド（管理者専用：実行中のBotのプロファイルを取得）
+    @tree.command(
+        name="profile",
+        description="実行中のBotのCPU・メモリのプロファイルを取得します（管理者専用）"
+    )
+    @app_commands.describe(
+        seconds="プロファイルを取得する時間（秒）",
+        top="レポートに含める上位の件数"
+    )
+    async def profile(
+        interaction: discord.Interaction,
+        seconds: app_commands.Range[int, 1, MAX_PROFILE_SECONDS] = 10,
+        top: app_commands.Range[int, 5, 100] = 20
+    ):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message(
+                "このコマンドを使用する権限がありません。", 
+                ephemeral=True
+            )
+            return
+        if is_profiling():
+            await interaction.response.send_message(
+                "ほかのプロファイルを取得中です。終わってから実行してください。",
+                ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            artifacts = await capture_profile(seconds, top)
+        except RuntimeError as e:
+            await interaction.followup.send(str(e), ephemeral=True)
+            return
+        await interaction.followup.send(
+            f"{seconds}秒間のプロファイルを取得しました。"
+            "`.pstats` は `python -m pstats` や snakeviz で開けます。",
+            files=[
+                discord.File(io.BytesIO(data), filename=filename)
+                for filename, data in artifacts.items()
+            ],
+            ephemeral=True
+        )
+
     # /kabaneri コマンド
     @tree.command(name="kabaneri", description="六根清浄！")
     async def kabaneri(interaction: discord.Interaction):
@@ -0,0 +1,338 @@
+import os
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from .spreadsheet import create_sheets_client
+
+# サーバーごとのスプレッドシート設定の保存先
+GUILD_CONFIG_PATH = os.getenv(
+    "GUILD_CONFIG_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "guilds.json")
+)
+# 設定のないサーバーが使用するスプレッドシート
+DEFAULT_SPREADSHEET = os.getenv("SPREADSHEET_NAME", "Accounts")
+DEFAULT_CREDENTIALS_ENV = "CREDENTIALS_JSON"
+# 同時に開いておくAPIクライアント・ワークシートの最大数
+SHEET_CACHE_SIZE = int(os.getenv("SHEET_CACHE_SIZE", "16"))
+# 対応しているバックエンド
+SUPPORTED_BACKENDS = ("sheets",)
+
+
+class LRUCache:
+    """
+    最近使用した順に一定数だけ値を保持するキャッシュ
+
+    上限を超えた場合は最も長く使われていないものから削除し、削除時の関数を呼ぶ。
+    削除時の関数がFalseを返した値（使用中など）は残して次の候補を削除する。
+    """
+
+    def __init__(self, capacity, on_evict=None):
+        """
+        初期化
+
+        Args:
+            capacity (int): 保持する値の最大数
+            on_evict (optional): (key, value) を受け取る削除時の関数
+        """
+        self.capacity = max(1, capacity)
+        self.on_evict = on_evict
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        """
+        値を取得（最近使用したものとして扱う）
+
+        Args:
+            key: キー
+
+        Returns:
+            値（存在しない場合はNone）
+        """
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """
+        値を追加し、上限を超えた分を削除
+
+        Args:
+            key: キー
+            value: 値
+        """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        for old_key in list(self._items):
+            if len(self._items) <= self.capacity:
+                break
+            if old_key == key:
+                continue
+            old_value = self._items[old_key]
+            if self.on_evict is not None and self.on_evict(old_key, old_value) is False:
+                continue
+            del self._items[old_key]
+
+    def values(self):
+        """保持している値のリスト"""
+        return list(self._items.values())
+
+
+class GuildSheets:
+    """
+    サーバー（ギルド）ごとのアカウント用スプレッドシートの対応表
+
+    設定ファイルでサーバーごとにスプレッドシート名・ワークシート番号・
+    クレデンシャルの環境変数名を指定できる。設定のないサーバーは共通の
+    スプレッドシートを使用する。APIクライアントはクレデンシャルごと、
+    ワークシートはスプレッドシートごとにLRUキャッシュで保持する。
+    ワークシートはクレデンシャルとスプレッドシートのIDで識別し、スプレッドシート名
+    からIDへの対応はクレデンシャルごとに一度だけ問い合わせて保持する。
+    """
+
+    def __init__(self, path=GUILD_CONFIG_PATH, capacity=SHEET_CACHE_SIZE):
+        """
+        初期化
+
+        Args:
+            path (str): 設定ファイルのパス
+            capacity (int): 同時に開いておくクライアント・ワークシートの最大数
+        """
+        self.path = path
+        # {guild_id: {"backend": str, "spreadsheet": str, "worksheet": int, "credentials_env": str}}
+        self.config = {}
+        self._clients = LRUCache(capacity, on_evict=self._evict_client)
+        self._worksheets = LRUCache(capacity)
+        # {(クレデンシャルの環境変数名, スプレッドシート名): スプレッドシートのID}
+        self._spreadsheet_ids = {}
+        self._load()
+
+    def _load(self):
+        """設定ファイルを読み込む"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logging.error(f"サーバー設定の読み込みに失敗しました: {e}")
+            return
+        for guild_id, entry in data.items():
+            backend = entry.get("backend", "sheets")
+            if backend not in SUPPORTED_BACKENDS:
+                logging.error(f"サーバー {guild_id} のバックエンド {backend} には対応していません")
+                continue
+            self.config[int(guild_id)] = entry
+
+    def _save(self):
+        """設定ファイルを保存"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({str(guild_id): entry for guild_id, entry in self.config.items()}, f,
+                      ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+    def _spec(self, guild_id):
+        """サーバーが使用する (クレデンシャルの環境変数名, スプレッドシート名, ワークシート番号)"""
+        entry = self.config.get(guild_id, {})
+        return (
+            entry.get("credentials_env", DEFAULT_CREDENTIALS_ENV),
+            entry.get("spreadsheet", DEFAULT_SPREADSHEET),
+            int(entry.get("worksheet", 0)),
+        )
+
+    @staticmethod
+    def _evict_client(credentials_env, client):
+        """使用中でなければクライアントを閉じてキャッシュから削除する"""
+        stats = client.scheduler.stats()
+        if any(stats["in_flight"].values()) or any(stats["queued"].values()):
+            return False
+        asyncio.ensure_future(client.close())
+        logging.info(f"Google APIクライアント（{credentials_env}）をキャッシュから削除しました")
+        return True
+
+    def _client(self, credentials_env):
+        """クレデンシャルごとのAPIクライアントを取得（なければ作成）"""
+        client = self._clients.get(credentials_env)
+        if client is None:
+            client = create_sheets_client(credentials_env)
+            self._clients.put(credentials_env, client)
+        return client
+
+    async def _spreadsheet_id(self, credentials_env, spreadsheet_name):
+        """スプレッドシート名からIDを取得（取得済みの場合は問い合わせない）"""
+        key = (credentials_env, spreadsheet_name)
+        spreadsheet_id = self._spreadsheet_ids.get(key)
+        if spreadsheet_id is None:
+            client = self._client(credentials_env)
+            spreadsheet_id = await client.find_spreadsheet_id(spreadsheet_name)
+            self._spreadsheet_ids[key] = spreadsheet_id
+        return spreadsheet_id
+
+    async def for_guild(self, guild_id):
+        """
+        サーバーのアカウント用ワークシートを取得
+
+        Args:
+            guild_id (int or None): サーバーID（DMなどの場合はNone）
+
+        Returns:
+            Worksheet: ワークシート
+
+        Raises:
+            SheetsAPIError: スプレッドシートが見つからない場合など
+        """
+        credentials_env, spreadsheet_name, index = self._spec(guild_id)
+        return await self.worksheet_for(spreadsheet_name, index, credentials_env)
+
+    async def worksheet_for(self, spreadsheet_name, index=0, credentials_env=None):
+        """
+        スプレッドシート名とワークシート番号からワークシートを取得（設定は変更しない）
+
+        Args:
+            spreadsheet_name (str): スプレッドシート名
+            index (int): ワークシートの番号（0始まり）
+            credentials_env (str, optional): クレデンシャルを格納した環境変数名
+
+        Returns:
+            Worksheet: ワークシート
+
+        Raises:
+            SheetsAPIError: スプレッドシートが見つからない場合など
+        """
+        credentials_env = credentials_env or DEFAULT_CREDENTIALS_ENV
+        spreadsheet_id = await self._spreadsheet_id(credentials_env, spreadsheet_name)
+        return self.for_key(f"{credentials_env}/{spreadsheet_id}/{index}")
+
+    def for_key(self, sheet_key):
+        """
+        ワークシートのキー（Worksheet.key）からワークシートを取得
+
+        Args:
+            sheet_key (str): "クレデンシャルの環境変数名/スプレッドシートのID/番号" 形式のキー
+
+        Returns:
+            Worksheet: ワークシート
+
+        Raises:
+            ValueError: キーの形式が正しくない場合
+        """
+        parts = sheet_key.split("/") if sheet_key else []
+        if len(parts) != 3 or not parts[2].isdigit():
+            raise ValueError(f"ワークシートのキーの形式が正しくありません: {sheet_key}")
+        credentials_env, spreadsheet_id, index = parts
+        worksheet = self._worksheets.get(sheet_key)
+        client = self._client(credentials_env)
+        if worksheet is None or worksheet.client is not client:
+            worksheet = client.worksheet(spreadsheet_id, int(index))
+            self._worksheets.put(sheet_key, worksheet)
+        return worksheet
+
+    async def for_account(self, sheet_key, guild_id):
+        """
+        アカウントの読み込み元のワークシートを取得
+
+        借用中にサーバーの設定が変わっても、借用したアカウントのワークシートに書き込む。
+        キーが記録されていない（古い形式の）場合はサーバーのワークシートを使用する。
+
+        Args:
+            sheet_key (str or None): アカウントに記録されたワークシートのキー
+            guild_id (int or None): サーバーID
+
+        Returns:
+            Worksheet: ワークシート
+        """
+        if sheet_key:
+            try:
+                return self.for_key(sheet_key)
+            except ValueError as e:
+                logging.warning(f"{e}（サーバーのワークシートを使用します）")
+        return await self.for_guild(guild_id)
+
+    def configure(self, guild_id, spreadsheet_name, index=0, credentials_env=None):
+        """
+        サーバーが使用するスプレッドシートを設定して保存
+
+        開けることを worksheet_for などで確認してから呼び出すこと。
+
+        Args:
+            guild_id (int): サーバーID
+            spreadsheet_name (str): スプレッドシート名
+            index (int): ワークシートの番号（0始まり）
+            credentials_env (str, optional): クレデンシャルを格納した環境変数名
+        """
+        entry = {"backend": "sheets", "spreadsheet": spreadsheet_name, "worksheet": index}
+        if credentials_env:
+            entry["credentials_env"] = credentials_env
+        self.config[guild_id] = entry
+        self._save()
+
+    async def guilds_for_sheet(self, sheet_key, guild_ids):
+        """
+        指定したワークシートを使用しているサーバーを絞り込む
+
+        Args:
+            sheet_key (str): ワークシートのキー
+            guild_ids (iterable): 候補のサーバーID
+
+        Returns:
+            list: ワークシートを使用しているサーバーID
+        """
+        matched = []
+        for guild_id in guild_ids:
+            try:
+                sheet = await self.for_guild(guild_id)
+            except Exception as e:
+                logging.warning(f"サーバー {guild_id} のワークシートを取得できませんでした: {e}")
+                continue
+            if sheet.key == sheet_key:
+                matched.append(guild_id)
+        return matched
+
+    async def configured_sheets(self):
+        """
+        設定済みのサーバーと共通のスプレッドシートのワークシートを重複なく取得
+
+        取得できないワークシート（スプレッドシートが見つからないなど）は除く。
+
+        Returns:
+            list: ワークシートのリスト
+        """
+        sheets = {}
+        for guild_id in [None] + list(self.config):
+            try:
+                sheet = await self.for_guild(guild_id)
+            except Exception as e:
+                logging.error(f"サーバー {guild_id} のワークシートを取得できませんでした: {e}")
+                continue
+            sheets.setdefault(sheet.key, sheet)
+        return list(sheets.values())
+
+    def request_stats(self):
+        """
+        クライアントごとのリクエスト状況を取得
+
+        Returns:
+            dict: {"clients", "worksheets", "requests", "quota"}
+        """
+        return {
+            "clients": len(self._clients),
+            "worksheets": len(self._worksheets),
+            "requests": {
+                f"client{number}": client.scheduler.stats()
+                for number, client in enumerate(self._clients.values())
+            },
+            "quota": {
+                f"client{number}": client.quota.stats()
+                for number, client in enumerate(self._clients.values())
+            },
+        }
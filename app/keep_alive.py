@@ -1,9 +1,23 @@
 import os
 import threading
-from flask import Flask
+from flask import Flask, jsonify
 
 app = Flask('')
 
+# /metrics で公開する値の取得関数 {名前: 関数}
+_metrics_providers = {}
+
+
+def register_metrics(name, provider):
+    """
+    /metrics エンドポイントで公開する値を登録
+
+    Args:
+        name (str): 項目名
+        provider: JSONに変換できる値を返す引数なしの関数
+    """
+    _metrics_providers[name] = provider
+
 @app.route('/')
 def home():
     return "Bot is alive!"
@@ -12,8 +26,19 @@ def home():
 def health_check():
     return "OK", 200
 
+@app.route('/metrics')
+def metrics():
+    result = {}
+    for name, provider in list(_metrics_providers.items()):
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return jsonify(result)
+
 def run():
-    app.run(host='0.0.0.0', port=8080)
+    # 同じマシンで複数のシャードプロセスを動かす場合は PORT を分ける
+    app.run(host='0.0.0.0', port=int(os.getenv("PORT", "8080")))
 
 def keep_alive():
     """
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import logging.handlers
+import discord
+from discord import app_commands
+
+# ログの出力形式（"json" または "text"）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# 出力するログのレベル
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# 同じ箇所からのINFO以下のログを集計する期間（秒）
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+# 期間内に同じ箇所から出力するINFO以下のログの件数（これを超えた分は間引く。0で間引かない）
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+
+# JSONに含める LogRecord の属性（extra で渡された値やコンテキストの値）
+CONTEXT_FIELDS = (
+    "interaction_id", "command", "user_id", "guild_id", "channel_id",
+    "account", "sheet", "sampled_out",
+)
+
+# 実行中のコマンドのログ用コンテキスト
+_log_context = contextvars.ContextVar("log_context", default=None)
+_listener = None
+
+
+def bind_log_context(**fields):
+    """
+    現在のタスクのログにフィールドを追加
+
+    Args:
+        **fields: ログに含める値（例: account="名前"）
+    """
+    context = dict(_log_context.get() or {})
+    context.update(fields)
+    _log_context.set(context)
+
+
+class ContextFilter(logging.Filter):
+    """実行中のコマンドのコンテキストをログのレコードに付与する"""
+
+    def filter(self, record):
+        context = _log_context.get()
+        if context:
+            for field, value in context.items():
+                if not hasattr(record, field):
+                    setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    ログの出力箇所ごとにINFO以下のログを間引く
+
+    期間ごとに最初の LOG_SAMPLE_BURST 件だけを出力し、間引いた件数は
+    次の期間の最初のログに sampled_out として付与する。WARNING 以上は間引かない。
+    """
+
+    def __init__(self, window=LOG_SAMPLE_WINDOW, burst=LOG_SAMPLE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._lock = threading.Lock()
+        # {(ファイル, 行番号): [期間の開始時刻, 出力件数, 間引いた件数]}
+        self._sites = {}
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                dropped = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+                if dropped:
+                    record.sampled_out = dropped
+                return True
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """ログを1行のJSONに変換する"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _PreformattedQueueHandler(logging.handlers.QueueHandler):
+    """
+    メッセージの組み立てだけを呼び出し元で行い、書き込みは別スレッドに任せる
+
+    標準の QueueHandler は例外のトレースバックを呼び出し元で文字列にするが、
+    それもコストがかかるため、例外情報はそのまま書き込み側に渡す。
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging():
+    """
+    ログをキュー経由で別スレッドから出力するように設定
+
+    イベントループのスレッドではレコードをキューに入れるだけにし、
+    整形と標準出力への書き込みはバックグラウンドのスレッドで行う。
+
+    Returns:
+        logging.handlers.QueueListener: 書き込みを行うリスナー
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    handler = _PreformattedQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # 終了時にキューに残ったログを書き出す
+    atexit.register(_listener.stop)
+    return _listener
+
+
+class LoggingCommandTree(app_commands.CommandTree):
+    """コマンドの実行中のログにインタラクションの情報を付与するコマンドツリー"""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        command = interaction.command
+        bind_log_context(
+            interaction_id=interaction.id,
+            command=command.qualified_name if command else None,
+            user_id=interaction.user.id if interaction.user else None,
+            guild_id=interaction.guild_id,
+            channel_id=interaction.channel_id,
+        )
+        return True
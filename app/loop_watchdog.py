@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import collections
+
+# イベントループの遅延がこの秒数を超えたら停止として報告する（未設定の場合は監視しない）
+LOOP_WATCHDOG_THRESHOLD = os.getenv("LOOP_WATCHDOG_THRESHOLD")
+# イベントループの応答を確認する間隔（秒）
+LOOP_WATCHDOG_INTERVAL = float(os.getenv("LOOP_WATCHDOG_INTERVAL", "0.1"))
+# 報告に含めるスタックの深さ
+STACK_LIMIT = 12
+
+# このパッケージのディレクトリ（呼び出し箇所の特定に使う）
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# コマンドやUIの処理が書かれているファイル
+_HANDLER_FILES = ("commands.py", "modals.py", "kabaneri.py")
+
+
+class LoopWatchdog:
+    """
+    別スレッドからイベントループの遅延を測定し、停止の原因となった呼び出しを特定する
+
+    イベントループ上のタスクが一定間隔で時刻を記録し、監視スレッドは記録が
+    途絶えた時間を遅延として測定する。遅延がしきい値を超えると、その時点の
+    イベントループのスレッドのスタックを取得し、ブロックしている呼び出し箇所と
+    それを呼び出したコマンドの処理を報告する。
+    """
+
+    def __init__(self, threshold, interval=LOOP_WATCHDOG_INTERVAL):
+        """
+        初期化
+
+        Args:
+            threshold (float): 停止として報告する遅延（秒）
+            interval (float): 応答を確認する間隔（秒）
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+        self._lock = threading.Lock()
+        self.stalls = 0
+        self.max_lag = 0.0
+        # 呼び出し箇所ごとの停止回数
+        self.call_sites = collections.Counter()
+        self._task = None
+        self._thread = None
+
+    async def _heartbeat(self):
+        """イベントループ上で一定間隔で時刻を記録する"""
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """
+        監視を開始（イベントループ上から呼び出す。開始済みの場合は何もしない）
+        """
+        if self._thread is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logging.info(f"イベントループの監視を開始しました（しきい値: {self.threshold}秒）")
+
+    def _watch(self):
+        """監視スレッドの処理"""
+        while True:
+            time.sleep(self.interval)
+            beat = self._last_beat
+            if self._reported_beat is not None and beat != self._reported_beat:
+                # 報告済みの停止が解消したら、停止していた時間全体を記録する
+                self._resolve(beat - self._reported_beat - self.interval)
+            lag = time.monotonic() - beat - self.interval
+            if lag < self.threshold or beat == self._reported_beat:
+                continue
+            # 同じ停止は1回だけ報告する
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            try:
+                self._report(lag, traceback.extract_stack(frame))
+            except Exception as e:
+                logging.error(f"イベントループの停止の報告に失敗しました: {e}")
+            finally:
+                del frame
+
+    def _resolve(self, duration):
+        """停止の解消を記録"""
+        self._reported_beat = None
+        with self._lock:
+            self.max_lag = max(self.max_lag, duration)
+        logging.warning(f"イベントループの停止が解消しました（{duration:.3f}秒）")
+
+    @staticmethod
+    def _locate(stack):
+        """
+        スタックからブロックしている呼び出し箇所とコマンドの処理を特定
+
+        Args:
+            stack (traceback.StackSummary): イベントループのスレッドのスタック
+
+        Returns:
+            tuple: (呼び出し箇所, コマンドの処理)。見つからない場合はNone
+        """
+        app_frames = [frame for frame in stack if frame.filename.startswith(_APP_DIR)]
+        call_site = handler = None
+        if app_frames:
+            innermost = app_frames[-1]
+            call_site = f"{os.path.basename(innermost.filename)}:{innermost.lineno} {innermost.name}"
+        for frame in app_frames:
+            if os.path.basename(frame.filename) in _HANDLER_FILES:
+                handler = f"{os.path.basename(frame.filename)}:{frame.name}"
+                break
+        return call_site, handler
+
+    def _report(self, lag, stack):
+        """停止を記録してログに出力"""
+        call_site, handler = self._locate(stack)
+        blocking = stack[-1]
+        with self._lock:
+            self.stalls += 1
+            self.max_lag = max(self.max_lag, lag)
+            self.call_sites[call_site or f"{blocking.filename}:{blocking.lineno}"] += 1
+        logging.warning(
+            f"イベントループが {lag:.3f}秒 停止しています: "
+            f"呼び出し箇所={call_site or '不明'}, コマンド={handler or '不明'}, "
+            f"ブロック中の処理={blocking.filename}:{blocking.lineno} {blocking.name}\n"
+            + "".join(traceback.format_list(stack[-STACK_LIMIT:]))
+        )
+
+    def stats(self):
+        """
+        監視の統計情報を取得
+
+        Returns:
+            dict: 停止回数、最大遅延、呼び出し箇所ごとの停止回数
+        """
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "stalls": self.stalls,
+                "max_lag": round(self.max_lag, 3),
+                "call_sites": dict(self.call_sites.most_common(20)),
+            }
+
+
+# Bot全体で使用する監視（LOOP_WATCHDOG_THRESHOLD を設定した場合のみ作成）
+_watchdog = None
+
+
+def get_loop_watchdog():
+    """
+    イベントループの監視を取得
+
+    Returns:
+        LoopWatchdog or None: 監視（無効な場合はNone）
+    """
+    global _watchdog
+    if _watchdog is None and LOOP_WATCHDOG_THRESHOLD:
+        _watchdog = LoopWatchdog(float(LOOP_WATCHDOG_THRESHOLD))
+    return _watchdog
@@ -11,21 +11,46 @@ load_dotenv()
 # 自作モジュールのインポート（絶対パスでインポート）
 from app import valorant_api
 from app import spreadsheet
-from app.accounts import TOKYO_TZ
+from app.accounts import (
+    TOKYO_TZ, add_account_listener, get_borrow_store, start_expiry_sweeper
+)
+from app import account_index
+from app.account_index import INDEX_FIELDS
+from app.guild_sheets import GuildSheets
+from app.availability_board import AvailabilityBoard
+from app.waitlist import Waitlist
+from app import warm_snapshot
+from app.borrow_stats import get_borrow_stats, start_stats_saver
 from app import commands as cmd
-from app.keep_alive import keep_alive
+from app.rank_refresher import start_rank_refresher
+from app.keep_alive import keep_alive, register_metrics
+from app.loop_watchdog import get_loop_watchdog
+from app.log_pipeline import LoggingCommandTree, setup_logging
 
 # -------------------------------
-# ログの設定
-logging.basicConfig(level=logging.INFO)
+# ログの設定（書き込みはバックグラウンドのスレッドで行う）
+setup_logging()
 
 # -------------------------------
 # Valorant API の設定
 valorant_api.setup_api()
 
 # -------------------------------
-# Googleスプレッドシートの初期化
-sheet = spreadsheet.init_spreadsheet()
+# Googleスプレッドシートの初期化（サーバーごとのスプレッドシートは最初の使用時に開く）
+guild_sheets = GuildSheets()
+register_metrics("sheets", guild_sheets.request_stats)
+register_metrics("borrows", lambda: {"active": get_borrow_store().count()})
+register_metrics(
+    "sheet_journal", lambda: {"pending": spreadsheet.get_journal().pending_count()}
+)
+# イベントループの停止の監視（LOOP_WATCHDOG_THRESHOLD を設定した場合のみ）
+loop_watchdog = get_loop_watchdog()
+if loop_watchdog is not None:
+    register_metrics("loop_watchdog", loop_watchdog.stats)
+
+# アカウント検索用の索引をスプレッドシートの読み込みと借用・返却に追従させる
+spreadsheet.add_load_listener(account_index.on_accounts_loaded)
+add_account_listener(account_index.on_account_event)
 
 # -------------------------------
 # Discord Bot の設定
@@ -35,7 +60,51 @@ intents.message_content = True
 intents.guilds = True
 intents.members = True       # メンバー情報取得用
 intents.voice_states = True  # ボイス関連イベント用
-bot = commands.Bot(command_prefix="/", intents=intents)
+
+def parse_shard_ids(value):
+    """
+    シャードIDの指定を解析
+
+    Args:
+        value (str): "0-3" のような範囲、または "0,2,4" のようなカンマ区切り
+
+    Returns:
+        list or None: シャードIDのリスト（指定がない場合はNone）
+    """
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(","):
+        first, _, last = part.strip().partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
+
+
+# シャード構成（SHARD_COUNT を指定した場合のみシャーディングする）
+# 複数のプロセスで分担する場合は、各プロセスに担当する SHARD_IDS を指定する
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS"))
+
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix="/",
+        intents=intents,
+        shard_count=int(SHARD_COUNT),
+        shard_ids=SHARD_IDS,
+        tree_cls=LoggingCommandTree
+    )
+    logging.info(f"シャードモードで起動します: 全{SHARD_COUNT}シャード, 担当 {SHARD_IDS or 'すべて'}")
+else:
+    bot = commands.Bot(command_prefix="/", intents=intents, tree_cls=LoggingCommandTree)
+
+# 利用可能なアカウントのボード（索引の後に更新されるように登録する）
+availability_board = AvailabilityBoard(bot, guild_sheets)
+spreadsheet.add_load_listener(availability_board.on_accounts_loaded)
+add_account_listener(availability_board.on_account_event)
+
+# 利用可能なアカウントがない場合の待機列（返却・自動返却で先頭のユーザーに通知する）
+waitlist = Waitlist(bot, guild_sheets)
+add_account_listener(waitlist.on_account_event)
 
 # -------------------------------
 # Flask アプリケーション（ヘルスチェック用）
@@ -51,16 +120,51 @@ def run_flask():
 # Bot準備完了時の処理
 @bot.event
 async def on_ready():
+    if loop_watchdog is not None:
+        loop_watchdog.start()
+
+    # 各サーバーのワークシートを開く（スプレッドシート名からIDを取得）
+    sheets = await guild_sheets.configured_sheets()
+    # ジャーナルの再適用では、開かれていないワークシートもキーから開く
+    spreadsheet.set_worksheet_resolver(guild_sheets.for_key)
+    # 前回終了時のキャッシュを復元（スプレッドシートが編集されていなければ再ダウンロードしない）
+    warm_snapshot.restore_snapshot(sheets)
+
     # スラッシュコマンドの登録
     tree = cmd.register_commands(
         bot, 
-        sheet, 
-        lambda row_data: spreadsheet.append_row(sheet, row_data),
-        lambda row, col, value: spreadsheet.update_cell(sheet, row, col, value),
-        lambda sht: spreadsheet.get_all_accounts(sht)
+        guild_sheets, 
+        spreadsheet.append_row,
+        spreadsheet.update_cell,
+        spreadsheet.get_all_accounts,
+        availability_board,
+        waitlist
     )
     
     await tree.sync()
+
+    for sheet in sheets:
+        # Google Sheets API の接続プールとアクセストークンを準備
+        await sheet.client.start()
+        # 前回の起動時に適用できなかった書き込みを再適用
+        spreadsheet.start_journal_replay(sheet)
+        # 設置済みのボードがあれば索引を読み込んで最新の状態にする
+        if availability_board.boards:
+            await spreadsheet.get_all_accounts(sheet, fields=INDEX_FIELDS)
+
+    # 返却期限を過ぎた借用の自動返却を開始（どのシャードの借用も処理する）
+    start_expiry_sweeper(bot, guild_sheets.for_account, spreadsheet.update_cell)
+    # 借用の集計を定期的に保存
+    start_stats_saver()
+    # キャッシュのスナップショットを定期的に保存
+    warm_snapshot.start_snapshot_saver()
+
+    # バックグラウンドでのランク更新を開始
+    start_rank_refresher(
+        guild_sheets.configured_sheets,
+        spreadsheet.get_all_accounts,
+        spreadsheet.update_cell
+    )
     logging.info(f"Logged in as {bot.user}")
 
 # -------------------------------
@@ -71,7 +175,11 @@ def main():
     
     # Botを起動
     TOKEN = os.getenv("TOKEN")
-    bot.run(TOKEN)
+    # discord.py 独自のログ設定は使わず、setup_logging のパイプラインに流す
+    bot.run(TOKEN, log_handler=None)
+    # 最後の保存以降の集計を書き出す
+    get_borrow_stats().save()
+    warm_snapshot.write_snapshot(warm_snapshot.build_snapshot())
 
 if __name__ == "__main__":
     main()
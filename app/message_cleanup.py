@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+import discord
+
+# 一括削除できるメッセージの最大経過時間（Discordの制限は14日。境界での失敗を避けるため少し短くする）
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)
+# 1回の一括削除で送信するメッセージ数の上限（Discordの制限）
+BULK_DELETE_CHUNK = 100
+# 個別削除の最短間隔（秒）
+SINGLE_DELETE_INTERVAL = float(os.getenv("REMOVE_COMMENT_DELETE_INTERVAL", "0.5"))
+# レート制限を受けた場合の個別削除の最大間隔（秒）
+SINGLE_DELETE_MAX_INTERVAL = 10.0
+# 進捗メッセージを更新する間隔（秒）
+PROGRESS_INTERVAL = 3.0
+
+
+def is_removable(message):
+    """
+    削除対象のコメントか判定（コードブロック、画像・ファイル、埋め込みを含むものは残す）
+
+    Args:
+        message (discord.Message): 判定するメッセージ
+
+    Returns:
+        bool: 削除対象の場合はTrue
+    """
+    return not message.attachments and "```" not in message.content and not message.embeds
+
+
+class CleanupJob:
+    """1回のコメント削除の進捗"""
+
+    def __init__(self, channel):
+        """
+        初期化
+
+        Args:
+            channel: 削除対象のチャンネル
+        """
+        self.channel = channel
+        self.scanned = 0
+        self.bulk_deleted = 0
+        self.single_deleted = 0
+        self.failed = 0
+        self.queued = 0
+        self.scan_finished = False
+        self._done = asyncio.Event()
+
+    @property
+    def total_deleted(self):
+        """削除した件数の合計"""
+        return self.bulk_deleted + self.single_deleted
+
+    def single_done(self, deleted):
+        """
+        個別削除の1件分の結果を記録
+
+        Args:
+            deleted (bool): 削除できた場合はTrue
+        """
+        self.queued -= 1
+        if deleted:
+            self.single_deleted += 1
+        else:
+            self.failed += 1
+        self._check_done()
+
+    def _check_done(self):
+        """走査が終わり個別削除も残っていなければ完了にする"""
+        if self.scan_finished and self.queued == 0:
+            self._done.set()
+
+    async def wait(self):
+        """履歴の走査と個別削除がすべて終わるまで待機"""
+        self.scan_finished = True
+        self._check_done()
+        await self._done.wait()
+
+    def progress_text(self):
+        """
+        進捗表示用の文字列を作成
+
+        Returns:
+            str: 進捗の文字列
+        """
+        state = "走査中" if not self.scan_finished else "個別削除中"
+        return (
+            f"コメント削除中...（{state}）\n"
+            f"- 確認済み: {self.scanned} 件\n"
+            f"- 一括削除: {self.bulk_deleted} 件\n"
+            f"- 個別削除: {self.single_deleted} 件（残り {self.queued} 件）"
+        )
+
+
+# 個別削除のキュー [(CleanupJob, メッセージID)]
+_delete_queue = None
+_delete_worker = None
+
+
+def _enqueue_single_delete(job, message_id):
+    """14日より古いメッセージを個別削除のキューに追加"""
+    global _delete_queue, _delete_worker
+    if _delete_queue is None:
+        _delete_queue = asyncio.Queue()
+    if _delete_worker is None or _delete_worker.done():
+        _delete_worker = asyncio.create_task(_single_delete_loop())
+    job.queued += 1
+    _delete_queue.put_nowait((job, message_id))
+
+
+async def _single_delete_loop():
+    """
+    個別削除のキューを1件ずつ処理するワーカー
+
+    すべてのコマンド実行で1つのワーカーを共有し、同時に複数のチャンネルを
+    削除してもAPIへの送信間隔が狭まらないようにする。レート制限を受けた場合は
+    間隔を広げ、成功が続けば元の間隔に戻す。
+    """
+    interval = SINGLE_DELETE_INTERVAL
+    while True:
+        job, message_id = await _delete_queue.get()
+        started = time.monotonic()
+        deleted = False
+        try:
+            await job.channel.get_partial_message(message_id).delete()
+            deleted = True
+            interval = max(SINGLE_DELETE_INTERVAL, interval * 0.8)
+        except discord.NotFound:
+            # 既に削除されている
+            deleted = True
+        except discord.HTTPException as e:
+            if e.status == 429:
+                interval = min(SINGLE_DELETE_MAX_INTERVAL, interval * 2)
+                logging.warning(f"個別削除がレート制限を受けました。間隔を {interval:.1f} 秒にします")
+            else:
+                logging.error(f"個別削除中にエラーが発生しました: {e}")
+        except Exception as e:
+            logging.error(f"個別削除中にエラーが発生しました: {e}")
+        finally:
+            job.single_done(deleted)
+            _delete_queue.task_done()
+
+        # discord.py がレート制限で待機した場合はその分を間隔に含める
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+async def _flush_bulk(job, message_ids):
+    """一括削除のバッファを送信"""
+    if not message_ids:
+        return
+    try:
+        await job.channel.delete_messages([discord.Object(id=i) for i in message_ids])
+        job.bulk_deleted += len(message_ids)
+    except discord.HTTPException as e:
+        logging.error(f"一括削除中にエラーが発生しました: {e}")
+        # 一括削除できなかったものは個別削除に回す
+        for message_id in message_ids:
+            _enqueue_single_delete(job, message_id)
+    message_ids.clear()
+
+
+async def stream_cleanup(channel, limit=None, after=None, skip_ids=(), on_progress=None):
+    """
+    チャンネルの履歴を新しい順に走査しながらコメントを削除
+
+    メッセージは100件ずつ一括削除し、14日より古いものは個別削除のキューに送る。
+    保持するのはメッセージIDのみのため、大量の履歴でもメモリ使用量は一定。
+
+    Args:
+        channel: 削除対象のチャンネル
+        limit (int, optional): 確認するメッセージ数の上限（Noneの場合は無制限）
+        after (datetime, optional): これより新しいメッセージのみを対象にする
+        skip_ids (iterable): 削除しないメッセージのID
+        on_progress (optional): 進捗を受け取るコルーチン関数 (CleanupJob) -> None
+
+    Returns:
+        CleanupJob: 完了した削除の結果
+    """
+    job = CleanupJob(channel)
+    skip_ids = set(skip_ids)
+    bulk_cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    pending_bulk = []
+    last_progress = time.monotonic()
+
+    async def report():
+        nonlocal last_progress
+        if on_progress and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+            last_progress = time.monotonic()
+            try:
+                await on_progress(job)
+            except Exception as e:
+                logging.warning(f"進捗の更新に失敗しました: {e}")
+
+    async for message in channel.history(limit=limit, after=after, oldest_first=False):
+        job.scanned += 1
+        if message.id in skip_ids or not is_removable(message):
+            continue
+        if message.created_at > bulk_cutoff:
+            pending_bulk.append(message.id)
+            if len(pending_bulk) >= BULK_DELETE_CHUNK:
+                await _flush_bulk(job, pending_bulk)
+        else:
+            _enqueue_single_delete(job, message.id)
+        await report()
+
+    await _flush_bulk(job, pending_bulk)
+
+    waiter = asyncio.create_task(job.wait())
+    while not waiter.done():
+        await asyncio.wait({waiter}, timeout=PROGRESS_INTERVAL)
+        await report()
+    return job
@@ -2,6 +2,8 @@ import logging
 import asyncio
 import discord
 from .valorant_api import get_valorant_rank
+from .rank_refresher import mark_refreshed, mark_returned, record_rank_marker
+from .accounts import notify_account_event, return_account
 
 
 class AccountRegisterModal(discord.ui.Modal):
@@ -67,11 +69,11 @@ class AccountRegisterModal(discord.ui.Modal):
         logging.info(
             f"アカウント登録: Valorantランク情報取得試行 - {val_username}#{val_tag}"
         )
-        rank_info = get_valorant_rank("ap", val_username, val_tag)
+        rank_info = await get_valorant_rank("ap", val_username, val_tag)
         rank = "Unknown"
         
         if rank_info:
-            rank = rank_info["current_rank"]
+            rank = rank_info.current_rank
             logging.info(
                 f"アカウント登録: ランク情報取得成功 - {val_username}#{val_tag}, Rank: {rank}"
             )
@@ -107,11 +109,11 @@ class AccountRegisterModal(discord.ui.Modal):
             if rank_info:
                 response_message += (
                     f"\n\n**Valorant詳細情報:**\n"
-                    f"**ティア内ランキング:** {rank_info['tier_ranking']}\n"
-                    f"**最後のゲームでのMMR変化:** {rank_info['mmr_change']}\n"
-                    f"**ELO:** {rank_info['elo']}\n"
-                    f"**過去最高ランク:** {rank_info['highest_rank']} "
-                    f"(シーズン: {rank_info['highest_rank_season']})"
+                    f"**ティア内ランキング:** {rank_info.tier_ranking}\n"
+                    f"**最後のゲームでのMMR変化:** {rank_info.mmr_change}\n"
+                    f"**ELO:** {rank_info.elo}\n"
+                    f"**過去最高ランク:** {rank_info.highest_rank} "
+                    f"(シーズン: {rank_info.highest_rank_season})"
                 )
                 
             await interaction.response.send_message(
@@ -122,8 +124,6 @@ class AccountRegisterModal(discord.ui.Modal):
         except Exception as e:
             error_msg = f"スプレッドシートへの書き込みエラー: {str(e)}"
             logging.error(error_msg, exc_info=True)
-            import traceback
-            logging.error(traceback.format_exc())
             await interaction.response.send_message(
                 f"アカウントの登録に失敗しました。\nエラー: {str(e)}",
                 ephemeral=True
@@ -134,73 +134,31 @@ class AccountRegisterModal(discord.ui.Modal):
 class RankUpdateModal(discord.ui.Modal):
     """ランク更新用モーダル"""
     
-    def __init__(self, account, sheet_update_cell, borrowed_accounts, user_status, 
-                 guild_id, channel_id, bot):
+    def __init__(self, account, sheet_update_cell, guild_id, channel_id, bot, 
+                 rank_info=None):
         """
         初期化
         
         Args:
             account: アカウント情報
             sheet_update_cell: スプレッドシートのセルを更新する関数
-            borrowed_accounts: 借りているアカウント管理辞書
-            user_status: ユーザー状態管理辞書
             guild_id: サーバーID
             channel_id: チャンネルID
             bot: Discordボット
+            rank_info: fetch_rank で自動取得したランク情報（取得できなかった場合はNone）
         """
         super().__init__(title="ランク更新")
         
         self.account = account
         self.sheet_update_cell = sheet_update_cell
-        self.borrowed_accounts = borrowed_accounts
-        self.user_status = user_status
         self.guild_id = guild_id
         self.channel_id = channel_id
         self.bot = bot
         
-        # ランクの自動取得を試みる
-        auto_rank = account["rank"]
-        self.rank_info = None
-        self.rank_fetch_success = False
-        
-        if "val_username" in account and "val_tag" in account:
-            val_username = account.get("val_username")
-            val_tag = account.get("val_tag")
-            
-            if val_username and val_tag:
-                logging.info(
-                    f"アカウント返却: Valorantランク情報取得試行 - {val_username}#{val_tag}"
-                )
-                
-                try:
-                    self.rank_info = get_valorant_rank("ap", val_username, val_tag)
-                    if self.rank_info:
-                        auto_rank = self.rank_info["current_rank"]
-                        self.rank_fetch_success = True
-                        logging.info(
-                            f"アカウント返却: ランク情報取得成功 - {val_username}#{val_tag}, "
-                            f"Rank: {auto_rank}"
-                        )
-                    else:
-                        logging.warning(
-                            f"アカウント返却: ランク情報取得失敗 - {val_username}#{val_tag}"
-                        )
-                except Exception as e:
-                    logging.error(f"返却時のValorantランク情報取得エラー: {str(e)}", 
-                                  exc_info=True)
-                    import traceback
-                    logging.error(traceback.format_exc())
-            else:
-                logging.warning(
-                    f"アカウント返却: ユーザー名またはタグが空 - username: '{val_username}', "
-                    f"tag: '{val_tag}'"
-                )
-        else:
-            logging.warning(
-                "アカウント返却: Valorant情報なし - val_usernameまたはval_tagが"
-                "アカウント情報に存在しません"
-            )
-            logging.debug(f"アカウント情報キー: {list(account.keys())}")
+        # 自動取得したランクがあればデフォルト値として使用
+        self.rank_info = rank_info
+        self.rank_fetch_success = rank_info is not None
+        auto_rank = rank_info.current_rank if rank_info else account.rank
         
         # 手動入力欄にデフォルト値として自動取得したランクを設定
         self.add_item(discord.ui.TextInput(
@@ -210,6 +168,44 @@ class RankUpdateModal(discord.ui.Modal):
             custom_id="new-rank",
             required=True
         ))
+
+    @staticmethod
+    async def fetch_rank(account):
+        """
+        返却するアカウントのランク情報を自動取得
+        
+        Args:
+            account: アカウント情報
+            
+        Returns:
+            RankSnapshot or None: ランク情報。取得できなかった場合はNone
+        """
+        val_username = account.val_username
+        val_tag = account.val_tag
+        if not val_username or not val_tag:
+            logging.warning(
+                f"アカウント返却: ユーザー名またはタグが空 - username: '{val_username}', "
+                f"tag: '{val_tag}'"
+            )
+            return None
+
+        logging.info(
+            f"アカウント返却: Valorantランク情報取得試行 - {val_username}#{val_tag}"
+        )
+        rank_info = await get_valorant_rank("ap", val_username, val_tag)
+        if not rank_info:
+            logging.warning(
+                f"アカウント返却: ランク情報取得失敗 - {val_username}#{val_tag}"
+            )
+            return None
+
+        mark_refreshed(account)
+        record_rank_marker(account, rank_info)
+        logging.info(
+            f"アカウント返却: ランク情報取得成功 - {val_username}#{val_tag}, "
+            f"Rank: {rank_info.current_rank}"
+        )
+        return rank_info
         
     async def on_submit(self, interaction: discord.Interaction):
         from .accounts import TOKYO_TZ
@@ -220,24 +216,26 @@ class RankUpdateModal(discord.ui.Modal):
         
         # 入力値のチェック
         if not new_rank:
-            new_rank = self.account["rank"]
+            new_rank = self.account.rank
             logging.warning("アカウント返却: 新しいランクが空のため、現在のランクを使用")
         
         # ランク情報に変更があれば更新
-        if new_rank != self.account["rank"]:
+        if new_rank != self.account.rank:
             logging.info(
-                f"アカウント返却: ランク更新 - 古い: {self.account['rank']}, 新しい: {new_rank}"
+                f"アカウント返却: ランク更新 - 古い: {self.account.rank}, 新しい: {new_rank}"
             )
             try:
                 result = await self.sheet_update_cell(
-                    self.account["row"], 4, new_rank
+                    self.account.row, "rank", new_rank
                 )
                 if result:
                     logging.info(
                         f"アカウント返却: スプレッドシートのランク更新成功 - "
-                        f"row: {self.account['row']}, rank: {new_rank}"
+                        f"row: {self.account.row}, rank: {new_rank}"
                     )
                     rank_updated = True
+                    self.account.rank = new_rank
+                    notify_account_event("rank_update", self.account)
                 else:
                     await interaction.response.send_message(
                         "ランクの更新に失敗しました。後でもう一度試してください。",
@@ -247,8 +245,6 @@ class RankUpdateModal(discord.ui.Modal):
             except Exception as e:
                 error_msg = f"スプレッドシートのランクセル更新中にエラーが発生しました: {str(e)}"
                 logging.error(error_msg, exc_info=True)
-                import traceback
-                logging.error(traceback.format_exc())
                 await interaction.response.send_message(
                     f"ランクの更新に失敗しました。後でもう一度試してください。\nエラー: {str(e)}",
                     ephemeral=True
@@ -258,11 +254,11 @@ class RankUpdateModal(discord.ui.Modal):
         # アカウント状態を "available" に更新
         try:
             result = await self.sheet_update_cell(
-                self.account["row"], 5, "available"
+                self.account.row, "status", "available"
             )
             if result:
                 logging.info(
-                    f"アカウント返却: ステータス更新成功 - row: {self.account['row']}, "
+                    f"アカウント返却: ステータス更新成功 - row: {self.account.row}, "
                     f"status: available"
                 )
             else:
@@ -274,8 +270,6 @@ class RankUpdateModal(discord.ui.Modal):
         except Exception as e:
             error_msg = f"スプレッドシートの状態更新中にエラーが発生しました: {str(e)}"
             logging.error(error_msg, exc_info=True)
-            import traceback
-            logging.error(traceback.format_exc())
             await interaction.response.send_message(
                 f"アカウントの状態を更新できませんでした。後でもう一度試してください。\nエラー: {str(e)}",
                 ephemeral=True
@@ -284,9 +278,13 @@ class RankUpdateModal(discord.ui.Modal):
 
         # ユーザーの借用状態をクリア
         user_id = interaction.user.id
-        self.borrowed_accounts.pop(user_id, None)
-        self.user_status.pop(user_id, None)
-        logging.info(f"アカウント返却: ユーザーID {user_id} の借用状態をクリア")
+        if await return_account(user_id, self.guild_id) is not None:
+            logging.info(f"アカウント返却: ユーザーID {user_id} の借用状態をクリア")
+            mark_returned(self.account)
+            notify_account_event("return", self.account)
+        else:
+            # 自動返却の処理中などで既に借用状態がない（返却の通知はそちらで行う）
+            logging.info(f"アカウント返却: ユーザーID {user_id} の借用状態は既にありません")
         
         # メッセージ送信のためにギルド、チャンネル、ユーザー情報を取得
         guild = self.bot.get_guild(self.guild_id)
@@ -318,7 +316,7 @@ class RankUpdateModal(discord.ui.Modal):
             rank_status = " (手動更新)"
             
         reply_message = (
-            f"アカウント **{self.account['name']}** を返却しました。\n"
+            f"アカウント **{self.account.name}** を返却しました。\n"
             f"**新しいランク:** {new_rank}{rank_status}"
         )
         
@@ -326,11 +324,11 @@ class RankUpdateModal(discord.ui.Modal):
         if self.rank_info:
             rank_details = (
                 f"\n\n**Valorant詳細情報:**\n"
-                f"**ティア内ランキング:** {self.rank_info['tier_ranking']}\n"
-                f"**最後のゲームでのMMR変化:** {self.rank_info['mmr_change']}\n"
-                f"**ELO:** {self.rank_info['elo']}\n"
-                f"**過去最高ランク:** {self.rank_info['highest_rank']} "
-                f"(シーズン: {self.rank_info['highest_rank_season']})"
+                f"**ティア内ランキング:** {self.rank_info.tier_ranking}\n"
+                f"**最後のゲームでのMMR変化:** {self.rank_info.mmr_change}\n"
+                f"**ELO:** {self.rank_info.elo}\n"
+                f"**過去最高ランク:** {self.rank_info.highest_rank} "
+                f"(シーズン: {self.rank_info.highest_rank_season})"
             )
             reply_message += rank_details
         
@@ -338,8 +336,8 @@ class RankUpdateModal(discord.ui.Modal):
         try:
             # 埋め込みメッセージを作成
             dm_embed = discord.Embed(
-                title=f"アカウント返却完了: {self.account['name']}",
-                description=f"アカウント **{self.account['name']}** を返却しました。",
+                title=f"アカウント返却完了: {self.account.name}",
+                description=f"アカウント **{self.account.name}** を返却しました。",
                 color=0xff9900  # オレンジ色
             )
             
@@ -355,11 +353,11 @@ class RankUpdateModal(discord.ui.Modal):
                 dm_embed.add_field(
                     name="Valorant詳細情報",
                     value=(
-                        f"**ティア内ランキング:** {self.rank_info['tier_ranking']}\n"
-                        f"**最後のゲームでのMMR変化:** {self.rank_info['mmr_change']}\n"
-                        f"**ELO:** {self.rank_info['elo']}\n"
-                        f"**過去最高ランク:** {self.rank_info['highest_rank']} "
-                        f"(シーズン: {self.rank_info['highest_rank_season']})"
+                        f"**ティア内ランキング:** {self.rank_info.tier_ranking}\n"
+                        f"**最後のゲームでのMMR変化:** {self.rank_info.mmr_change}\n"
+                        f"**ELO:** {self.rank_info.elo}\n"
+                        f"**過去最高ランク:** {self.rank_info.highest_rank} "
+                        f"(シーズン: {self.rank_info.highest_rank_season})"
                     ),
                     inline=False
                 )
@@ -378,7 +376,7 @@ class RankUpdateModal(discord.ui.Modal):
         except discord.errors.Forbidden:
             # DMが送信できない場合は従来通り（埋め込み形式で）
             embed = discord.Embed(
-                title=f"アカウント返却完了: {self.account['name']}",
+                title=f"アカウント返却完了: {self.account.name}",
                 description="**注意:** DMが無効になっているため、このメッセージが公開されることはありません。",
                 color=0xff9900
             )
@@ -387,7 +385,7 @@ class RankUpdateModal(discord.ui.Modal):
             embed.add_field(
                 name="返却情報", 
                 value=(
-                    f"アカウント **{self.account['name']}** を返却しました。\n"
+                    f"アカウント **{self.account.name}** を返却しました。\n"
                     f"**新しいランク:** {new_rank}{rank_status}"
                 ), 
                 inline=False
@@ -397,11 +395,11 @@ class RankUpdateModal(discord.ui.Modal):
                 embed.add_field(
                     name="Valorant詳細情報",
                     value=(
-                        f"**ティア内ランキング:** {self.rank_info['tier_ranking']}\n"
-                        f"**最後のゲームでのMMR変化:** {self.rank_info['mmr_change']}\n"
-                        f"**ELO:** {self.rank_info['elo']}\n"
-                        f"**過去最高ランク:** {self.rank_info['highest_rank']} "
-                        f"(シーズン: {self.rank_info['highest_rank_season']})"
+                        f"**ティア内ランキング:** {self.rank_info.tier_ranking}\n"
+                        f"**最後のゲームでのMMR変化:** {self.rank_info.mmr_change}\n"
+                        f"**ELO:** {self.rank_info.elo}\n"
+                        f"**過去最高ランク:** {self.rank_info.highest_rank} "
+                        f"(シーズン: {self.rank_info.highest_rank_season})"
                     ),
                     inline=False
                 )
@@ -418,7 +416,7 @@ class RankUpdateModal(discord.ui.Modal):
                 title="アカウント返却通知",
                 description=(
                     f"{user.mention if user else '不明なユーザー'} が "
-                    f"**{self.account['name']}** を返却しました！"
+                    f"**{self.account.name}** を返却しました！"
                 ),
                 color=0xff9900  # オレンジ色
             )
@@ -432,11 +430,11 @@ class RankUpdateModal(discord.ui.Modal):
                 embed.add_field(
                     name="Valorant詳細情報",
                     value=(
-                        f"**ティア内ランキング:** {self.rank_info['tier_ranking']}\n"
-                        f"**最後のゲームでのMMR変化:** {self.rank_info['mmr_change']}\n"
-                        f"**ELO:** {self.rank_info['elo']}\n"
-                        f"**過去最高ランク:** {self.rank_info['highest_rank']} "
-                        f"(シーズン: {self.rank_info['highest_rank_season']})"
+                        f"**ティア内ランキング:** {self.rank_info.tier_ranking}\n"
+                        f"**最後のゲームでのMMR変化:** {self.rank_info.mmr_change}\n"
+                        f"**ELO:** {self.rank_info.elo}\n"
+                        f"**過去最高ランク:** {self.rank_info.highest_rank} "
+                        f"(シーズン: {self.rank_info.highest_rank_season})"
                     ),
                     inline=False
                 )
@@ -0,0 +1,100 @@
+import io
+import time
+import pstats
+import marshal
+import asyncio
+import cProfile
+import logging
+import tracemalloc
+
+# 1回のプロファイルの最大時間（秒）
+MAX_PROFILE_SECONDS = 60
+# メモリの割り当て元として記録するスタックの深さ
+TRACEMALLOC_FRAMES = 5
+
+_lock = asyncio.Lock()
+
+
+def is_profiling():
+    """
+    プロファイルの取得中か判定
+
+    Returns:
+        bool: 取得中の場合はTrue
+    """
+    return _lock.locked()
+
+
+def _cpu_report(profile, top):
+    """CPUプロファイルを累積時間順のテキストにする"""
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    stream.write("\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return stream.getvalue()
+
+
+def _memory_report(snapshot, top, started_tracing):
+    """メモリの割り当て元の上位をテキストにする"""
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [
+        f"追跡中のメモリ: 現在 {current / 1024:.1f} KiB / 最大 {peak / 1024:.1f} KiB",
+    ]
+    if started_tracing:
+        lines.append("（プロファイル中に追跡を開始したため、期間中に割り当てられて残っているメモリのみ）")
+    lines.append("")
+    for index, stat in enumerate(snapshot.statistics("traceback")[:top], start=1):
+        lines.append(f"#{index}: {stat.size / 1024:.1f} KiB, {stat.count} ブロック")
+        lines.extend(f"    {line}" for line in stat.traceback.format(most_recent_first=True))
+    return "\n".join(lines)
+
+
+async def capture_profile(seconds, top=20):
+    """
+    実行中のBotのCPUプロファイルとメモリの割り当て状況を取得
+
+    指定した時間だけイベントループのスレッドでプロファイラを有効にし、
+    その間に実行されたコマンドやバックグラウンド処理を記録する。
+    tracemalloc が無効な場合は同じ期間だけ有効にする。
+
+    Args:
+        seconds (float): プロファイルを取得する時間（秒）
+        top (int): レポートに含める上位の件数
+
+    Returns:
+        dict: {ファイル名: 内容(bytes)}。pstats形式のCPUプロファイルとテキストのレポート
+
+    Raises:
+        RuntimeError: すでにプロファイルの取得中の場合
+    """
+    if _lock.locked():
+        raise RuntimeError("すでにプロファイルを取得中です")
+    seconds = min(seconds, MAX_PROFILE_SECONDS)
+    async with _lock:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        profile = cProfile.Profile()
+        logging.info(f"プロファイルの取得を開始します（{seconds}秒）")
+        try:
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ))
+            memory_report = _memory_report(snapshot, top, started_tracing)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+    profile.create_stats()
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return {
+        f"cpu-{stamp}.pstats": marshal.dumps(profile.stats),
+        f"cpu-{stamp}.txt": _cpu_report(profile, top).encode("utf-8"),
+        f"memory-{stamp}.txt": memory_report.encode("utf-8"),
+    }
@@ -0,0 +1,241 @@
+import os
+import time
+import struct
+import logging
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# ランク履歴の保存先ディレクトリ（アカウントごとに1ファイル）
+RANK_HISTORY_DIR = os.getenv(
+    "RANK_HISTORY_DIR", os.path.join(os.getenv("DATA_DIR", "data"), "rank_history")
+)
+
+# 1件分の記録: 時刻(int64), ELO(int32), ティアID(int16), ティア内ランキング(int16), MMR変化(int16)
+RECORD = struct.Struct("<qihhh")
+# 推移グラフの文字（低い順）
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+class RankObservation:
+    """ランク履歴の1件分の記録"""
+
+    __slots__ = ("timestamp", "elo", "tier", "tier_ranking", "mmr_change")
+
+    def __init__(self, timestamp, elo, tier, tier_ranking, mmr_change):
+        self.timestamp = timestamp
+        self.elo = elo
+        self.tier = tier
+        self.tier_ranking = tier_ranking
+        self.mmr_change = mmr_change
+
+    def same_values(self, other):
+        """時刻以外の値が同じか判定"""
+        return (
+            other is not None
+            and (self.elo, self.tier, self.tier_ranking, self.mmr_change)
+            == (other.elo, other.tier, other.tier_ranking, other.mmr_change)
+        )
+
+
+class RankHistory:
+    """
+    アカウントごとのランク履歴を固定長レコードのファイルに追記して保持する
+
+    記録は時刻順に追記されるため、期間を指定した読み込みは時刻の二分探索で
+    開始位置を求め、必要な範囲だけを読み込む。
+    """
+
+    def __init__(self, directory=RANK_HISTORY_DIR):
+        """
+        初期化
+
+        Args:
+            directory (str): 保存先ディレクトリ
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        # アカウントごとの最後の記録 {key: RankObservation}
+        self._last = {}
+
+    def _path(self, key):
+        """アカウントの履歴ファイルのパス"""
+        return os.path.join(self.directory, urllib.parse.quote(key, safe="") + ".bin")
+
+    @staticmethod
+    def _clamp(value, bits):
+        """整数を指定したビット数の符号付き整数の範囲に収める"""
+        limit = 1 << (bits - 1)
+        return max(-limit, min(limit - 1, int(value or 0)))
+
+    def append(self, key, elo, tier, tier_ranking, mmr_change, timestamp=None):
+        """
+        ランクの記録を追加（前回の記録と値が同じ場合は追加しない）
+
+        Args:
+            key (str): アカウントのキー（"ユーザー名#タグ"）
+            elo (int): ELO
+            tier (int): ティアID
+            tier_ranking (int): ティア内ランキング
+            mmr_change (int): 最後の試合でのMMR変化
+            timestamp (float, optional): 記録時刻（UNIX時刻）
+
+        Returns:
+            bool: 記録を追加した場合はTrue
+        """
+        observation = RankObservation(
+            int(time.time() if timestamp is None else timestamp),
+            self._clamp(elo, 32),
+            self._clamp(tier, 16),
+            self._clamp(tier_ranking, 16),
+            self._clamp(mmr_change, 16),
+        )
+        path = self._path(key)
+        with self._lock:
+            last = self._last.get(key)
+            if last is None:
+                last = self._read_last(path)
+            if observation.same_values(last):
+                return False
+            if last is not None and observation.timestamp < last.timestamp:
+                # 期間の二分探索のため、時刻が戻っても記録は時刻順に保つ
+                observation.timestamp = last.timestamp
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "ab") as f:
+                f.write(RECORD.pack(
+                    observation.timestamp, observation.elo, observation.tier,
+                    observation.tier_ranking, observation.mmr_change
+                ))
+            self._last[key] = observation
+        return True
+
+    @staticmethod
+    def _read_last(path):
+        """ファイルの最後の記録を読み込む"""
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell() - f.tell() % RECORD.size
+                if size == 0:
+                    return None
+                f.seek(size - RECORD.size)
+                return RankObservation(*RECORD.unpack(f.read(RECORD.size)))
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _timestamp_at(f, index):
+        """index番目の記録の時刻を読み込む"""
+        f.seek(index * RECORD.size)
+        return struct.unpack_from("<q", f.read(8))[0]
+
+    def query(self, key, since=None, until=None):
+        """
+        期間内の記録を取得
+
+        Args:
+            key (str): アカウントのキー
+            since (float, optional): 開始時刻（UNIX時刻、この時刻を含む）
+            until (float, optional): 終了時刻（UNIX時刻、この時刻を含む）
+
+        Returns:
+            list: 時刻順の RankObservation のリスト
+        """
+        try:
+            f = open(self._path(key), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            f.seek(0, os.SEEK_END)
+            count = f.tell() // RECORD.size
+
+            def lower_bound(timestamp):
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    if self._timestamp_at(f, middle) < timestamp:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return low
+
+            start = lower_bound(since) if since is not None else 0
+            end = lower_bound(int(until) + 1) if until is not None else count
+            if start >= end:
+                return []
+            f.seek(start * RECORD.size)
+            data = f.read((end - start) * RECORD.size)
+        return [RankObservation(*values) for values in RECORD.iter_unpack(data)]
+
+
+# Bot全体で共有するランク履歴
+_history = None
+# ランク履歴のファイル書き込みを行うスレッド（1つにして記録順を保つ）
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rank-history")
+
+
+def get_rank_history():
+    """
+    ランク履歴を取得（初回呼び出し時に作成）
+
+    Returns:
+        RankHistory: ランク履歴
+    """
+    global _history
+    if _history is None:
+        _history = RankHistory()
+    return _history
+
+
+def _append_rank(key, rank_info, timestamp):
+    """ランク履歴にファイル書き込みを行う（書き込み用のスレッドで実行）"""
+    try:
+        get_rank_history().append(
+            key, rank_info.elo, rank_info.tier, rank_info.tier_ranking,
+            rank_info.mmr_change, timestamp
+        )
+    except Exception as e:
+        logging.warning(f"ランク履歴の記録に失敗しました: {key}: {e}")
+
+
+def record_rank(name, tag, rank_info):
+    """
+    取得したランク情報を履歴に追加
+
+    ファイルへの書き込みはイベントループを止めないよう書き込み用のスレッドで行う。
+
+    Args:
+        name (str): Valorantユーザー名
+        tag (str): Valorantタグ
+        rank_info (RankSnapshot): get_valorant_rank の結果
+    """
+    _writer.submit(_append_rank, f"{name}#{tag}".lower(), rank_info, time.time())
+
+
+def render_sparkline(observations, width=30):
+    """
+    ELOの推移を1行のグラフとして描画
+
+    記録数が width を超える場合は期間を width 個に区切り、各区間の最後の値を使う。
+
+    Args:
+        observations (list): 時刻順の RankObservation のリスト
+        width (int): グラフの最大文字数
+
+    Returns:
+        str: 推移グラフ
+    """
+    if not observations:
+        return ""
+    if len(observations) > width:
+        first = observations[0].timestamp
+        span = max(1, observations[-1].timestamp - first)
+        buckets = {}
+        for observation in observations:
+            bucket = min(width - 1, (observation.timestamp - first) * width // span)
+            buckets[bucket] = observation
+        observations = [buckets[bucket] for bucket in sorted(buckets)]
+    values = [observation.elo for observation in observations]
+    low, high = min(values), max(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low) if high > low else 0
+    return "".join(SPARK_CHARS[int((value - low) * scale)] for value in values)
@@ -0,0 +1,284 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from .valorant_api import get_current_rank, is_api_available, request_budget
+from .sheets_client import bulk_priority
+
+# バックグラウンドランク更新の設定
+# 更新処理の実行間隔（秒）
+REFRESH_INTERVAL = int(os.getenv("RANK_REFRESH_INTERVAL", "600"))
+# 1回の更新処理で送信できるAPIリクエスト数（再試行を含む）
+REFRESH_BUDGET = int(os.getenv("RANK_REFRESH_BUDGET", "5"))
+# 最後の更新からこの秒数が経過していないアカウントは更新しない
+REFRESH_MIN_AGE = int(os.getenv("RANK_REFRESH_MIN_AGE", "3600"))
+# 一時的なAPIエラー時の再試行回数
+REFRESH_RETRIES = 2
+# ランク更新に必要な列（ID・パスワードは読み込まない）
+RANK_FIELDS = ("name", "rank", "status", "val_username", "val_tag")
+
+# アカウントごとの最終ランク更新時刻 {account_key: timestamp}
+last_refreshed = {}
+# アカウントごとの最終返却時刻 {account_key: timestamp}
+last_returned = {}
+# アカウントごとのランク変更検出用マーカー {account_key: (elo, mmr_change, tier)}
+rank_markers = {}
+
+_refresher_task = None
+
+
+def export_state():
+    """
+    ウォームスタート用にランク更新の状態を書き出す
+
+    Returns:
+        dict: JSONに変換できる状態
+    """
+    return {
+        "last_refreshed": dict(last_refreshed),
+        "last_returned": dict(last_returned),
+        "rank_markers": {key: list(marker) for key, marker in rank_markers.items()},
+    }
+
+
+def restore_state(state):
+    """
+    export_state で書き出した状態を復元（起動後に記録された値を優先する）
+
+    Args:
+        state (dict): export_state の戻り値
+    """
+    for key, timestamp in state.get("last_refreshed", {}).items():
+        last_refreshed.setdefault(key, float(timestamp))
+    for key, timestamp in state.get("last_returned", {}).items():
+        last_returned.setdefault(key, float(timestamp))
+    for key, marker in state.get("rank_markers", {}).items():
+        rank_markers.setdefault(key, tuple(marker))
+
+
+def account_key(account):
+    """
+    アカウントを識別するキーを取得
+
+    Args:
+        account (Account): アカウント情報
+
+    Returns:
+        str or None: "ユーザー名#タグ" 形式のキー。Valorant情報がない場合はNone
+    """
+    val_username = account.val_username
+    val_tag = account.val_tag
+    if not val_username or not val_tag:
+        return None
+    return f"{val_username}#{val_tag}".lower()
+
+
+def mark_refreshed(account, timestamp=None):
+    """
+    アカウントのランクを更新した時刻を記録
+
+    Args:
+        account (Account): アカウント情報
+        timestamp (float, optional): 更新時刻。省略時は現在時刻
+    """
+    key = account_key(account)
+    if key:
+        last_refreshed[key] = timestamp or time.time()
+
+
+def mark_returned(account, timestamp=None):
+    """
+    アカウントが返却された時刻を記録
+
+    Args:
+        account (Account): アカウント情報
+        timestamp (float, optional): 返却時刻。省略時は現在時刻
+    """
+    key = account_key(account)
+    if key:
+        last_returned[key] = timestamp or time.time()
+
+
+def record_rank_marker(account, rank_info):
+    """
+    取得したランク情報から変更検出用マーカーを記録
+
+    APIのティアIDもあわせて記録し、索引の並べ替えに使う。
+
+    Args:
+        account (Account): アカウント情報
+        rank_info (RankSnapshot): get_valorant_rank / get_current_rank の戻り値
+    """
+    key = account_key(account)
+    if key and rank_info and not rank_info.cached:
+        rank_markers[key] = (rank_info.elo, rank_info.mmr_change, rank_info.tier)
+
+
+def has_rank_changed(account, rank_info):
+    """
+    前回のランク取得以降にアカウントのランクが変わったか判定
+
+    取得したランク情報のELOとMMR変化を前回のマーカーと比較する。
+    前回のマーカーがない場合は変更ありとして扱う。
+
+    Args:
+        account (Account): アカウント情報
+        rank_info (RankSnapshot): 今回取得したランク情報
+
+    Returns:
+        bool: 前回から変わった可能性がある場合はTrue
+    """
+    key = account_key(account)
+    previous = rank_markers.get(key) if key else None
+    if previous is None:
+        return True
+    return tuple(previous[:2]) != (rank_info.elo, rank_info.mmr_change)
+
+
+def select_refresh_targets(accounts, limit=None, now=None):
+    """
+    ランクを更新するアカウントを優先度順に選択
+
+    利用可能なアカウントを優先し、その中では最後の更新以降に返却された
+    アカウント（返却が新しい順）、続いて最終更新が古い順に並べる。
+
+    Args:
+        accounts (list): アカウント情報（Account）のリスト
+        limit (int, optional): 選択する最大件数（省略時はすべての候補）
+        now (float, optional): 現在時刻
+
+    Returns:
+        list: 更新対象のアカウント情報リスト
+    """
+    now = now or time.time()
+    candidates = []
+    for account in accounts:
+        key = account_key(account)
+        if key is None:
+            continue
+        refreshed = last_refreshed.get(key, 0)
+        returned = last_returned.get(key, 0)
+        returned_since_refresh = returned > refreshed
+        if not returned_since_refresh and now - refreshed < REFRESH_MIN_AGE:
+            continue
+        priority = (
+            0 if account.status == "available" else 1,
+            0 if returned_since_refresh else 1,
+            -returned if returned_since_refresh else refreshed,
+        )
+        candidates.append((priority, account))
+
+    candidates.sort(key=lambda item: item[0])
+    return [account for _, account in candidates[:limit]]
+
+
+async def refresh_ranks_once(sheet, get_all_accounts, sheet_update_cell, budget=None):
+    """
+    最も古いアカウントから予算の範囲内でランクを更新
+
+    予算はアカウント数ではなく実際に送信したAPIリクエスト数（再試行を含む）で
+    数え、使い切った時点で残りのアカウントは次回に回す。
+
+    Args:
+        sheet: スプレッドシートのワークシート
+        get_all_accounts: アカウント一覧取得関数
+        sheet_update_cell: セル更新関数
+        budget (int, optional): 送信できるAPIリクエスト数
+
+    Returns:
+        int: ランクが変更されたアカウント数
+    """
+    from .accounts import notify_account_event
+    budget = REFRESH_BUDGET if budget is None else budget
+    if not is_api_available():
+        logging.info("バックグラウンドランク更新: Valorant APIが一時停止中のためスキップします")
+        return 0
+
+    accounts = await get_all_accounts(sheet, fields=RANK_FIELDS)
+    candidates = select_refresh_targets(accounts)
+    if not candidates:
+        return 0
+
+    checked = 0
+    changed = 0
+    skipped = 0
+    with request_budget(budget) as requests:
+        for account in candidates:
+            if requests.remaining == 0:
+                break
+            checked += 1
+            val_username = account.val_username
+            val_tag = account.val_tag
+            # MMR履歴で試合の有無を確認し、変わっていた場合だけ詳細情報を取得する
+            rank_info = await get_current_rank(
+                "ap", val_username, val_tag, retries=REFRESH_RETRIES
+            )
+            if not rank_info:
+                continue
+            rank_changed = has_rank_changed(account, rank_info)
+            mark_refreshed(account)
+            record_rank_marker(account, rank_info)
+
+            new_rank = rank_info.current_rank
+            if new_rank == account.rank:
+                if not rank_changed:
+                    skipped += 1
+                continue
+            if await sheet_update_cell(account.row, "rank", new_rank):
+                logging.info(
+                    f"バックグラウンドランク更新: {val_username}#{val_tag} - "
+                    f"{account.rank} -> {new_rank}"
+                )
+                account.rank = new_rank
+                notify_account_event("rank_update", account)
+                changed += 1
+
+    logging.info(
+        f"バックグラウンドランク更新完了: 対象 {checked}/{len(candidates)}件, 変更 {changed}件, "
+        f"変更なし（スキップ） {skipped}件, APIリクエスト {requests.used}/{budget}件"
+    )
+    return changed
+
+
+async def _refresh_loop(get_sheets, get_all_accounts, sheet_update_cell):
+    """ランク更新を一定間隔で繰り返すループ（ワークシートを1回ずつ順番に更新）"""
+    turn = 0
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        try:
+            sheets = await get_sheets()
+            if not sheets:
+                continue
+            sheet = sheets[turn % len(sheets)]
+            turn += 1
+            with bulk_priority():
+                await refresh_ranks_once(
+                    sheet, get_all_accounts, functools.partial(sheet_update_cell, sheet)
+                )
+        except Exception as e:
+            logging.error(f"バックグラウンドランク更新中にエラーが発生しました: {e}")
+
+
+def start_rank_refresher(get_sheets, get_all_accounts, sheet_update_cell):
+    """
+    バックグラウンドランク更新タスクを起動（起動済みの場合は何もしない）
+
+    Args:
+        get_sheets: 更新対象のワークシートのリストを返すコルーチン関数
+        get_all_accounts: アカウント一覧取得関数
+        sheet_update_cell: セル更新関数 (sheet, row, col, value)
+
+    Returns:
+        asyncio.Task: 更新タスク
+    """
+    global _refresher_task
+    if _refresher_task is None or _refresher_task.done():
+        _refresher_task = asyncio.create_task(
+            _refresh_loop(get_sheets, get_all_accounts, sheet_update_cell)
+        )
+        logging.info(
+            f"バックグラウンドランク更新を開始しました: 間隔 {REFRESH_INTERVAL}秒, "
+            f"予算 {REFRESH_BUDGET}リクエスト"
+        )
+    return _refresher_task
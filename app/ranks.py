@@ -0,0 +1,113 @@
+import re
+import functools
+from typing import NamedTuple
+
+# ティアID（Valorant APIの currenttier と同じ番号。1, 2 は未使用）
+UNRATED_TIER = 0
+RADIANT_TIER = 27
+# ランク帯の名前（アイアンから順に、各帯は3段階。レディアントのみ1段階）
+TIER_FAMILIES = (
+    "Iron", "Bronze", "Silver", "Gold", "Platinum",
+    "Diamond", "Ascendant", "Immortal", "Radiant",
+)
+# ランク帯の別名（手入力されたランクの解析用）
+_FAMILY_ALIASES = {
+    "アイアン": "iron", "ブロンズ": "bronze", "シルバー": "silver",
+    "ゴールド": "gold", "プラチナ": "platinum", "プラチナム": "platinum",
+    "ダイヤモンド": "diamond", "ダイヤ": "diamond", "アセンダント": "ascendant",
+    "イモータル": "immortal", "レディアント": "radiant", "plat": "platinum",
+    "dia": "diamond", "asc": "ascendant", "imm": "immortal",
+}
+_FAMILY_INDEX = {family.lower(): i for i, family in enumerate(TIER_FAMILIES)}
+_RANK_PATTERN = re.compile(r"^\s*([^\d\s(]+)\s*(\d)?")
+
+
+def tier_name(tier):
+    """
+    ティアIDを表示用のランク名に変換
+
+    Args:
+        tier (int): ティアID
+
+    Returns:
+        str: ランク名（例: "Diamond 2"）
+    """
+    if tier is None or tier < 3:
+        return "Unrated"
+    if tier >= RADIANT_TIER:
+        return "Radiant"
+    family, division = divmod(tier - 3, 3)
+    return f"{TIER_FAMILIES[family]} {division + 1}"
+
+
+# スラッシュコマンドの選択肢などに使う全ランク名（低い順）
+TIER_NAMES = tuple(tier_name(tier) for tier in range(3, RADIANT_TIER + 1))
+
+
+@functools.lru_cache(maxsize=256)
+def parse_tier(rank):
+    """
+    ランクの文字列をティアIDに変換
+
+    スプレッドシートのランクは "Diamond 2" のような表示用の文字列のため、
+    比較や並べ替えの前に数値に変換する。同じ文字列は結果を使い回す。
+
+    Args:
+        rank (str): ランクの文字列（例: "Diamond 2"、"ダイヤモンド2"）
+
+    Returns:
+        int or None: ティアID。解析できない場合はNone
+    """
+    match = _RANK_PATTERN.match((rank or "").lower())
+    if not match:
+        return None
+    family = _FAMILY_ALIASES.get(match.group(1), match.group(1))
+    index = _FAMILY_INDEX.get(family)
+    if index is None:
+        return None
+    if index == len(TIER_FAMILIES) - 1:
+        return RADIANT_TIER
+    division = min(3, max(1, int(match.group(2) or 1)))
+    return 3 + index * 3 + division - 1
+
+
+def rating(tier, elo=None):
+    """
+    並べ替えに使うレーティングを取得
+
+    APIから取得したELOがあればそれを使い、なければティアの中央の値で推定する。
+
+    Args:
+        tier (int or None): ティアID
+        elo (int, optional): APIから取得したELO
+
+    Returns:
+        int or None: レーティング。ティアもELOも不明な場合はNone
+    """
+    if elo is not None:
+        return elo
+    if tier is None or tier < 3:
+        return None
+    return (tier - 3) * 100 + 50
+
+
+class RankSnapshot(NamedTuple):
+    """
+    get_valorant_rank で取得したランク情報
+
+    表示や比較に使う値だけを保持する不変の値。APIの生データ（raw_data）は
+    DEBUGレベルのログが有効な場合のみ保持する。
+    """
+
+    current_rank: str
+    tier: int
+    tier_ranking: int
+    mmr_change: int
+    elo: int
+    highest_rank: str
+    highest_rank_season: str
+    # 取得時刻（UNIX時刻）
+    fetched_at: float = 0.0
+    # APIから取得できずにキャッシュを返した場合はTrue
+    cached: bool = False
+    raw_data: object = None
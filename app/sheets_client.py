@@ -0,0 +1,605 @@
+import os
+import time
+import asyncio
+import logging
+import contextlib
+import contextvars
+import urllib.parse
+from collections import deque
+import aiohttp
+from google.auth import jwt
+
+# Google API のエンドポイント
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+# 接続プールの最大接続数
+POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", "10"))
+# アイドル状態の接続を保持する時間（秒）
+KEEPALIVE_TIMEOUT = float(os.getenv("SHEETS_KEEPALIVE_TIMEOUT", "60"))
+# リクエストのタイムアウト（秒）
+REQUEST_TIMEOUT = float(os.getenv("SHEETS_REQUEST_TIMEOUT", "30"))
+# JWTアサーションの有効期間（秒、Googleが認める上限は1時間）
+ASSERTION_LIFETIME = 3600
+# アクセストークンの有効期限のこの秒数前に更新する
+TOKEN_REFRESH_MARGIN = 300
+# トークン更新に失敗した場合の再試行間隔（秒）
+TOKEN_RETRY_INTERVAL = 30
+# 同時に実行するリクエストの最大数
+MAX_CONCURRENCY = int(os.getenv("SHEETS_MAX_CONCURRENCY", "4"))
+# 対話的なリクエスト用に常に空けておく実行枠の数
+INTERACTIVE_RESERVED = int(os.getenv("SHEETS_INTERACTIVE_RESERVED", "1"))
+
+# 1分あたりのリクエスト数の上限（Google Sheets API のユーザーごとのクォータ）
+READ_QUOTA = int(os.getenv("SHEETS_READ_QUOTA", "60"))
+WRITE_QUOTA = int(os.getenv("SHEETS_WRITE_QUOTA", "60"))
+# 一括処理のリクエストが使用できるクォータの割合（残りは対話的なリクエスト用）
+BULK_QUOTA_RATIO = float(os.getenv("SHEETS_BULK_QUOTA_RATIO", "0.8"))
+# クォータを計測する期間（秒）
+QUOTA_WINDOW = 60
+
+# リクエストの優先度
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+# 現在のタスクが送信するリクエストの優先度
+_request_priority = contextvars.ContextVar(
+    "sheets_request_priority", default=PRIORITY_INTERACTIVE
+)
+
+
+@contextlib.contextmanager
+def bulk_priority():
+    """
+    このブロック内（と、ここから作成したタスク）のリクエストを低優先度で送信する
+
+    一括更新やバックグラウンド処理で使用し、ユーザー操作によるリクエストを
+    先に処理させる。
+    """
+    token = _request_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+class RequestScheduler:
+    """
+    優先度付きの2レーンでリクエストの同時実行数を制限するスケジューラ
+
+    空きができた場合は対話的なレーンの待機中リクエストを先に実行し、
+    一括処理のレーンは予約枠を除いた数までしか同時に実行しない。
+    """
+
+    def __init__(self, max_concurrency, interactive_reserved):
+        """
+        初期化
+
+        Args:
+            max_concurrency (int): 同時に実行するリクエストの最大数
+            interactive_reserved (int): 対話的なリクエスト用に空けておく枠の数
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.bulk_limit = max(1, self.max_concurrency - interactive_reserved)
+        self.in_flight = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 0}
+        self._queues = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BULK: deque()}
+
+    def _can_start(self, priority):
+        """指定した優先度のリクエストを今すぐ開始できるか判定"""
+        if sum(self.in_flight.values()) >= self.max_concurrency:
+            return False
+        if priority == PRIORITY_BULK:
+            return self.in_flight[PRIORITY_BULK] < self.bulk_limit
+        return True
+
+    async def acquire(self, priority):
+        """
+        実行枠を確保（空きがなければ順番が来るまで待機）
+
+        Args:
+            priority (str): リクエストの優先度
+        """
+        ahead = self._queues[PRIORITY_INTERACTIVE] if priority == PRIORITY_BULK else ()
+        if self._can_start(priority) and not self._queues[priority] and not ahead:
+            self.in_flight[priority] += 1
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._queues[priority].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 枠を受け取った直後にキャンセルされた場合は返却する
+                self.release(priority)
+            raise
+
+    def release(self, priority):
+        """
+        実行枠を返却し、待機中のリクエストを優先度順に開始
+
+        Args:
+            priority (str): 返却するリクエストの優先度
+        """
+        self.in_flight[priority] -= 1
+        for lane in (PRIORITY_INTERACTIVE, PRIORITY_BULK):
+            queue = self._queues[lane]
+            while queue and self._can_start(lane):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self.in_flight[lane] += 1
+                waiter.set_result(None)
+
+    def stats(self):
+        """
+        実行中・待機中のリクエスト数を取得
+
+        Returns:
+            dict: {"in_flight": {優先度: 件数}, "queued": {優先度: 件数}}
+        """
+        return {
+            "in_flight": dict(self.in_flight),
+            "queued": {
+                lane: sum(1 for waiter in list(queue) if not waiter.done())
+                for lane, queue in self._queues.items()
+            },
+        }
+
+
+class QuotaAccountant:
+    """
+    読み込み・書き込みのリクエスト数を直近1分間のスライディングウィンドウで数え、
+    クォータを超えないように送信を遅らせる
+
+    一括処理のリクエストはクォータの一定割合に達した時点で待機させ、
+    残りを対話的なリクエスト用に空けておく。
+    """
+
+    def __init__(self, limits, bulk_ratio, window=QUOTA_WINDOW):
+        """
+        初期化
+
+        Args:
+            limits (dict): {種類: 期間内のリクエスト数の上限}
+            bulk_ratio (float): 一括処理のリクエストが使用できるクォータの割合
+            window (float): クォータを計測する期間（秒）
+        """
+        self.limits = {kind: max(1, limit) for kind, limit in limits.items()}
+        self.bulk_limits = {
+            kind: max(1, int(limit * bulk_ratio)) for kind, limit in self.limits.items()
+        }
+        self.window = window
+        self.deferred = {kind: 0 for kind in self.limits}
+        self._sent = {kind: deque() for kind in self.limits}
+
+    def _prune(self, kind, now):
+        """期間外になった送信記録を削除"""
+        sent = self._sent[kind]
+        while sent and sent[0] <= now - self.window:
+            sent.popleft()
+
+    async def reserve(self, kind, priority):
+        """
+        リクエスト1件分のクォータを確保（上限に達している場合は空くまで待機）
+
+        Args:
+            kind (str): リクエストの種類（"read" または "write"）
+            priority (str): リクエストの優先度
+        """
+        limit = self.limits[kind] if priority == PRIORITY_INTERACTIVE else self.bulk_limits[kind]
+        sent = self._sent[kind]
+        deferred = False
+        while True:
+            now = time.monotonic()
+            self._prune(kind, now)
+            if len(sent) < limit:
+                sent.append(now)
+                return
+            if not deferred:
+                deferred = True
+                self.deferred[kind] += 1
+                logging.info(
+                    f"Sheets APIの{kind}クォータが上限に近いため{priority}のリクエストを待機させます"
+                    f"（{len(sent)}/{self.limits[kind]}）"
+                )
+            # 上限を下回るのに必要な分の記録が期間外になるまで待つ
+            await asyncio.sleep(max(0.01, sent[len(sent) - limit] + self.window - now))
+
+    def stats(self):
+        """
+        クォータの使用状況を取得
+
+        Returns:
+            dict: {種類: {"used", "limit", "bulk_limit", "deferred"}}
+        """
+        # 別スレッド（/metrics）からも呼ばれるため記録は変更せずに数える
+        cutoff = time.monotonic() - self.window
+        result = {}
+        for kind in self.limits:
+            result[kind] = {
+                "used": sum(1 for sent_at in list(self._sent[kind]) if sent_at > cutoff),
+                "limit": self.limits[kind],
+                "bulk_limit": self.bulk_limits[kind],
+                "deferred": self.deferred[kind],
+            }
+        return result
+
+
+class SheetsAPIError(Exception):
+    """Google Sheets / Drive API がエラーを返したことを示す例外"""
+
+    def __init__(self, status, message, retry_after=None):
+        """
+        初期化
+
+        Args:
+            status (int): HTTPステータスコード
+            message (str): エラーメッセージ
+            retry_after (float, optional): Retry-After ヘッダーの秒数
+        """
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class SheetsClient:
+    """
+    Google Sheets API の非同期クライアント
+
+    Botのイベントループ上で keep-alive の接続プールを使ってリクエストを送信する。
+    サービスアカウントのアクセストークンは有効期限が切れる前にバックグラウンドで
+    更新するため、通常のリクエスト中にトークン更新が発生することはない。
+    """
+
+    def __init__(self, credentials, credentials_env=None, token_uri=GOOGLE_TOKEN_URI):
+        """
+        初期化
+
+        Args:
+            credentials: google-auth の service_account.Credentials
+                （JWTアサーションの署名にのみ使用）
+            credentials_env (str, optional): クレデンシャルを格納した環境変数名
+                （ワークシートのキーに含めてクレデンシャルごとに区別する）
+            token_uri (str): アクセストークンを取得するエンドポイント
+        """
+        self.credentials = credentials
+        self.credentials_env = credentials_env
+        self.token_uri = token_uri
+        self._session = None
+        self._token = None
+        self._token_expires_at = 0.0
+        self._refresh_task = None
+        self._start_lock = None
+        self.scheduler = RequestScheduler(MAX_CONCURRENCY, INTERACTIVE_RESERVED)
+        self.quota = QuotaAccountant(
+            {"read": READ_QUOTA, "write": WRITE_QUOTA}, BULK_QUOTA_RATIO
+        )
+
+    async def start(self):
+        """接続プールを作成し、アクセストークンを取得して更新タスクを開始"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=POOL_SIZE, keepalive_timeout=KEEPALIVE_TIMEOUT
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                )
+            if self._token is None:
+                await self._refresh_token()
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._token_refresh_loop())
+
+    async def close(self):
+        """トークン更新タスクを停止し、接続プールを閉じる"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _refresh_token(self):
+        """サービスアカウントのJWTアサーションでアクセストークンを取得"""
+        now = int(time.time())
+        payload = {
+            "iss": self.credentials.service_account_email,
+            "scope": " ".join(self.credentials.scopes),
+            "aud": self.token_uri,
+            "iat": now,
+            "exp": now + ASSERTION_LIFETIME,
+        }
+        assertion = jwt.encode(self.credentials.signer, payload).decode("ascii")
+        data = {
+            "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+            "assertion": assertion,
+        }
+        async with self._session.post(self.token_uri, data=data) as response:
+            body = await response.json(content_type=None)
+            if response.status != 200:
+                raise SheetsAPIError(response.status, str(body))
+        self._token = body["access_token"]
+        self._token_expires_at = time.monotonic() + int(body.get("expires_in", 3600))
+        logging.info("Google APIのアクセストークンを更新しました")
+
+    async def _token_refresh_loop(self):
+        """有効期限が切れる前にアクセストークンを更新し続けるループ"""
+        while True:
+            delay = self._token_expires_at - TOKEN_REFRESH_MARGIN - time.monotonic()
+            await asyncio.sleep(max(0.0, delay))
+            try:
+                await self._refresh_token()
+            except Exception as e:
+                logging.error(f"Google APIのアクセストークン更新エラー: {str(e)}")
+                await asyncio.sleep(TOKEN_RETRY_INTERVAL)
+
+    async def request(self, method, url, params=None, json=None):
+        """
+        認証付きでAPIリクエストを送信
+
+        リクエストは現在の優先度（bulk_priority 参照）でクォータと実行枠を
+        確保してから送信される。Sheets API へのリクエストはGETを読み込み、
+        それ以外を書き込みとしてクォータに数える。
+
+        Args:
+            method (str): HTTPメソッド
+            url (str): リクエストURL
+            params (dict or list, optional): クエリパラメータ
+            json (dict, optional): リクエストボディ
+
+        Returns:
+            dict: レスポンスのJSON
+
+        Raises:
+            SheetsAPIError: APIがエラーを返した場合
+        """
+        if self._session is None or self._token is None:
+            await self.start()
+        elif time.monotonic() >= self._token_expires_at:
+            # 更新タスクが失敗し続けている場合のみここで更新する
+            await self._refresh_token()
+
+        priority = _request_priority.get()
+        if url.startswith(SHEETS_API_URL):
+            await self.quota.reserve("read" if method == "GET" else "write", priority)
+        await self.scheduler.acquire(priority)
+        try:
+            return await self._send(method, url, params, json)
+        finally:
+            self.scheduler.release(priority)
+
+    async def _send(self, method, url, params, json):
+        """認証ヘッダーを付けてリクエストを送信（401の場合はトークンを更新して再送）"""
+        for attempt in range(2):
+            headers = {"Authorization": f"Bearer {self._token}"}
+            async with self._session.request(
+                method, url, params=params, json=json, headers=headers
+            ) as response:
+                if response.status == 401 and attempt == 0:
+                    await self._refresh_token()
+                    continue
+                body = await response.json(content_type=None)
+                if response.status >= 400:
+                    error = body.get("error") if isinstance(body, dict) else None
+                    message = error.get("message") if isinstance(error, dict) else str(body)
+                    retry_after = response.headers.get("Retry-After")
+                    raise SheetsAPIError(
+                        response.status,
+                        message,
+                        float(retry_after) if retry_after and retry_after.isdigit() else None,
+                    )
+                return body or {}
+
+    async def find_spreadsheet_id(self, title):
+        """
+        スプレッドシート名からIDを取得
+
+        Args:
+            title (str): スプレッドシート名
+
+        Returns:
+            str: スプレッドシートのID
+        """
+        escaped = title.replace("\\", "\\\\").replace("'", "\\'")
+        body = await self.request("GET", DRIVE_FILES_URL, params={
+            "q": (
+                f"name = '{escaped}' and "
+                "mimeType = 'application/vnd.google-apps.spreadsheet' and trashed = false"
+            ),
+            "fields": "files(id)",
+            "supportsAllDrives": "true",
+            "includeItemsFromAllDrives": "true",
+        })
+        files = body.get("files", [])
+        if not files:
+            raise SheetsAPIError(404, f"スプレッドシート '{title}' が見つかりません")
+        return files[0]["id"]
+
+    def worksheet(self, spreadsheet_id, index=0):
+        """
+        ワークシートのハンドルを取得（ワークシート名の取得は最初のリクエスト時に行う）
+
+        Args:
+            spreadsheet_id (str): スプレッドシートのID（find_spreadsheet_id で取得）
+            index (int): ワークシートの番号（0始まり）
+
+        Returns:
+            Worksheet: ワークシート
+        """
+        return Worksheet(self, spreadsheet_id, index)
+
+
+class Worksheet:
+    """Google スプレッドシートの1つのワークシートに対する非同期操作"""
+
+    def __init__(self, client, spreadsheet_id, index=0):
+        """
+        初期化
+
+        キーはクレデンシャルとスプレッドシートのIDから作るため、別のサーバーが
+        同じ名前のスプレッドシートを使っていても、ジャーナルやキャッシュが混ざらない。
+
+        Args:
+            client (SheetsClient): APIクライアント
+            spreadsheet_id (str): スプレッドシートのID
+            index (int): ワークシートの番号（0始まり）
+        """
+        self.client = client
+        self.spreadsheet_id = spreadsheet_id
+        self.index = index
+        self.key = f"{client.credentials_env}/{spreadsheet_id}/{index}"
+        self.title = None
+        self._resolve_lock = None
+
+    async def _resolve(self):
+        """ワークシート名を取得"""
+        if self.title is not None:
+            return
+        if self._resolve_lock is None:
+            self._resolve_lock = asyncio.Lock()
+        async with self._resolve_lock:
+            if self.title is not None:
+                return
+            body = await self.client.request(
+                "GET", f"{SHEETS_API_URL}/{self.spreadsheet_id}",
+                params={"fields": "sheets.properties"}
+            )
+            self.title = body["sheets"][self.index]["properties"]["title"]
+
+    def _range(self, a1_range=None):
+        """ワークシート名付きのA1形式の範囲をURL用にエンコード"""
+        quoted_title = "'" + self.title.replace("'", "''") + "'"
+        label = f"{quoted_title}!{a1_range}" if a1_range else quoted_title
+        return urllib.parse.quote(label, safe="")
+
+    async def get_revision(self):
+        """
+        スプレッドシートのDrive上のバージョン番号を取得
+
+        Returns:
+            str: バージョン番号（スプレッドシートが編集されるたびに増加する）
+        """
+        await self._resolve()
+        body = await self.client.request(
+            "GET", f"{DRIVE_FILES_URL}/{self.spreadsheet_id}",
+            params={"fields": "version", "supportsAllDrives": "true"}
+        )
+        return body["version"]
+
+    async def get_all_values(self):
+        """
+        ワークシートのすべての値を取得
+
+        Returns:
+            list: 行ごとの値のリスト
+        """
+        await self._resolve()
+        body = await self.client.request(
+            "GET", f"{SHEETS_API_URL}/{self.spreadsheet_id}/values/{self._range()}"
+        )
+        return body.get("values", [])
+
+    async def row_values(self, row):
+        """
+        指定した行の値を取得
+
+        Args:
+            row (int): 行番号
+
+        Returns:
+            list: 行の値のリスト
+        """
+        values = await self.batch_get([f"{row}:{row}"])
+        return values[0][0] if values[0] else []
+
+    async def batch_get(self, ranges):
+        """
+        複数の範囲の値をまとめて取得
+
+        Args:
+            ranges (list): A1形式の範囲のリスト（ワークシート名は不要）
+
+        Returns:
+            list: 範囲ごとの行の値のリスト
+        """
+        await self._resolve()
+        quoted_title = "'" + self.title.replace("'", "''") + "'"
+        params = [("ranges", f"{quoted_title}!{a1_range}") for a1_range in ranges]
+        body = await self.client.request(
+            "GET", f"{SHEETS_API_URL}/{self.spreadsheet_id}/values:batchGet",
+            params=params
+        )
+        return [value_range.get("values", []) for value_range in body.get("valueRanges", [])]
+
+    async def cell_value(self, row, col):
+        """
+        指定したセルの値を取得
+
+        Args:
+            row (int): 行番号
+            col (int): 列番号
+
+        Returns:
+            str or None: セルの値
+        """
+        await self._resolve()
+        body = await self.client.request(
+            "GET",
+            f"{SHEETS_API_URL}/{self.spreadsheet_id}/values/"
+            f"{self._range(_a1(row, col))}"
+        )
+        values = body.get("values", [])
+        return values[0][0] if values and values[0] else None
+
+    async def update_cell(self, row, col, value):
+        """
+        指定したセルを更新
+
+        Args:
+            row (int): 行番号
+            col (int): 列番号
+            value: 設定する値
+        """
+        await self._resolve()
+        await self.client.request(
+            "PUT",
+            f"{SHEETS_API_URL}/{self.spreadsheet_id}/values/"
+            f"{self._range(_a1(row, col))}",
+            params={"valueInputOption": "USER_ENTERED"},
+            json={"values": [[value]]}
+        )
+
+    async def append_row(self, values):
+        """
+        ワークシートの末尾に行を追加
+
+        Args:
+            values (list): 追加する行の値のリスト
+        """
+        await self._resolve()
+        await self.client.request(
+            "POST",
+            f"{SHEETS_API_URL}/{self.spreadsheet_id}/values/{self._range()}:append",
+            params={"valueInputOption": "RAW"},
+            json={"values": [values]}
+        )
+
+
+def column_letter(col):
+    """列番号(1始まり)をA1形式の列名に変換"""
+    letters = ""
+    while col > 0:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def _a1(row, col):
+    """行番号と列番号をA1形式のセル名に変換"""
+    return f"{column_letter(col)}{row}"
@@ -1,89 +1,501 @@
 import os
 import json
+import asyncio
 import logging
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import weakref
+from google.oauth2 import service_account
+from .accounts import Account
+from .sheets_client import (
+    GOOGLE_TOKEN_URI, SheetsClient, SheetsAPIError, bulk_priority, column_letter
+)
+from .write_journal import WriteJournal
 
+# 前回の更新確認からこの秒数以内はキャッシュをそのまま使用する
+REVISION_CHECK_INTERVAL = float(os.getenv("SHEET_REVISION_CHECK_INTERVAL", "5"))
+# 書き込みの再適用に失敗した場合の待機時間（秒）
+JOURNAL_RETRY_BASE_DELAY = 5
+JOURNAL_RETRY_MAX_DELAY = 300
+
+# ワークシートごとのヘッダーと列番号の対応 {sheet_key: (header, {フィールド名: 列番号})}
+_column_maps = {}
+
+# アカウント一覧をダウンロードした時に呼ばれる関数のリスト
+_load_listeners = []
+
+# ワークシートごとの読み込み結果のキャッシュ
+# {sheet_key: {"version": str, "checked_at": float, "records": {fields: [Account]}}}
+_record_caches = {}
+
+
+def _sheet_key(sheet):
+    """ワークシートを識別するキーを取得"""
+    return sheet.key
+
+
+def _build_column_map(header):
+    """
+    ヘッダー行から列番号の対応表を作成
+
+    Args:
+        header (list): ヘッダー行の値
+
+    Returns:
+        dict: {フィールド名: 列番号(1始まり)}。Account のフィールドのみを含む
+    """
+    column_map = {}
+    for index, title in enumerate(header):
+        title = str(title).strip()
+        if title in Account.FIELDS and title not in column_map:
+            column_map[title] = index + 1
+    return column_map
+
+
+def _resolve_column_map(sheet, header):
+    """
+    ヘッダー行に対応する列番号の対応表を取得（ヘッダーが変わらない限り再作成しない）
+
+    Args:
+        sheet: スプレッドシートのワークシート
+        header (list): ヘッダー行の値
+
+    Returns:
+        dict: {フィールド名: 列番号(1始まり)}
+    """
+    key = _sheet_key(sheet)
+    header = tuple(header)
+    cached = _column_maps.get(key)
+    if cached is not None and cached[0] == header:
+        return cached[1]
+
+    column_map = _build_column_map(header)
+    _column_maps[key] = (header, column_map)
+    logging.info(f"列番号の対応表を作成しました: {column_map}")
+    return column_map
+
+
+async def get_column_map(sheet):
+    """
+    ワークシートの列番号の対応表を取得
+
+    一度取得した対応表はキャッシュし、以降はヘッダー行を読み込まない。
+
+    Args:
+        sheet: スプレッドシートのワークシート
+
+    Returns:
+        dict: {フィールド名: 列番号(1始まり)}
+    """
+    cached = _column_maps.get(_sheet_key(sheet))
+    if cached is not None:
+        return cached[1]
+
+    header = await sheet.row_values(1)
+    return _resolve_column_map(sheet, header)
+
+
+
+# Google APIの認証設定とクライアントの作成
+def create_sheets_client(credentials_env="CREDENTIALS_JSON"):
+    """
+    サービスアカウントのクレデンシャルから Google Sheets API のクライアントを作成
+
+    Args:
+        credentials_env (str): クレデンシャル（JSON形式）を格納した環境変数名
+
+    Returns:
+        SheetsClient: APIクライアント
+    """
+    scope = ["https://spreadsheets.google.com/feeds", 
+            "https://www.googleapis.com/auth/drive"]
+    credentials_info = json.loads(os.getenv(credentials_env))
+    credentials = service_account.Credentials.from_service_account_info(
+        credentials_info, scopes=scope
+    )
+    return SheetsClient(
+        credentials, credentials_env,
+        credentials_info.get("token_uri", GOOGLE_TOKEN_URI)
+    )
 
 
 # Googleスプレッドシートの認証設定と初期化
-def init_spreadsheet():
+async def init_spreadsheet(spreadsheet_name="Accounts", index=0, 
+                           credentials_env="CREDENTIALS_JSON"):
     """
     Googleスプレッドシートの初期設定を行う
     
+    スプレッドシート名からIDを取得する（Botのイベントループ上で呼び出す）。
+    
+    Args:
+        spreadsheet_name (str): スプレッドシート名
+        index (int): ワークシートの番号（0始まり）
+        credentials_env (str): クレデンシャルを格納した環境変数名
+
     Returns:
-        gspread.models.Worksheet: スプレッドシートのワークシート
+        Worksheet: スプレッドシートのワークシート
     """
     try:
-        scope = ["https://spreadsheets.google.com/feeds", 
-                "https://www.googleapis.com/auth/drive"]
-        credentials_info = json.loads(os.getenv("CREDENTIALS_JSON"))
-        credentials = ServiceAccountCredentials.from_json_keyfile_dict(
-            credentials_info, scope
-        )
-        gc = gspread.authorize(credentials)
-        sheet = gc.open("Accounts").sheet1  # スプレッドシート名を指定
+        client = create_sheets_client(credentials_env)
+        spreadsheet_id = await client.find_spreadsheet_id(spreadsheet_name)
+        sheet = client.worksheet(spreadsheet_id, index)
         logging.info("スプレッドシートの初期化に成功しました")
         return sheet
     except Exception as e:
         logging.error(f"スプレッドシートの初期化に失敗しました: {str(e)}", exc_info=True)
-        import traceback
-        logging.error(traceback.format_exc())
         raise
 
 
 
+async def _get_fresh_cache(sheet):
+    """
+    スプレッドシートが前回の読み込みから編集されていなければキャッシュを取得
+
+    編集されている場合はキャッシュを破棄する。バージョンを取得できなかった場合は
+    キャッシュをそのまま使う。
+
+    Args:
+        sheet: スプレッドシートのワークシート
+
+    Returns:
+        dict: ワークシートのキャッシュ（"records" に読み込み結果を保持）
+    """
+    import time
+    key = _sheet_key(sheet)
+    cache = _record_caches.setdefault(
+        key, {"version": None, "checked_at": 0.0, "records": {}}
+    )
+    now = time.monotonic()
+    if cache["records"] and now - cache["checked_at"] < REVISION_CHECK_INTERVAL:
+        return cache
+
+    try:
+        version = await sheet.get_revision()
+    except Exception as e:
+        logging.warning(f"スプレッドシートのバージョン取得エラー: {str(e)}")
+        return cache
+
+    if version != cache["version"]:
+        if cache["records"]:
+            logging.info(
+                f"スプレッドシートの更新を検出しました: {cache['version']} -> {version}"
+            )
+        cache["records"] = {}
+    cache["version"] = version
+    cache["checked_at"] = now
+    return cache
+
+
+async def _record_own_revision(sheet):
+    """
+    自分の書き込みで増えたバージョンをキャッシュに記録
+
+    書き込んだ値はキャッシュにも反映済みのため、自分の書き込みによるバージョンの
+    変化ではキャッシュを破棄しないようにする。
+
+    Args:
+        sheet: スプレッドシートのワークシート
+    """
+    import time
+    cache = _record_caches.get(_sheet_key(sheet))
+    if cache is None or not cache["records"]:
+        return
+    try:
+        version = await sheet.get_revision()
+    except Exception as e:
+        # 次の確認時にバージョンの変化として扱われる（キャッシュを読み直す）
+        logging.warning(f"スプレッドシートのバージョン取得エラー: {str(e)}")
+        return
+    cache["version"] = version
+    cache["checked_at"] = time.monotonic()
+
+
+def _cached_accounts(cache, fields):
+    """キャッシュから指定フィールドの読み込み結果を取得（なければNone）"""
+    records = cache["records"]
+    if fields in records:
+        return records[fields]
+    # すべての列を読み込んだ結果があれば部分読み込みにも使用する
+    return records.get(None)
+
+
+def _update_cached_accounts(sheet, row, col, value):
+    """自分で書き込んだ値をキャッシュ済みのアカウント情報にも反映"""
+    cache = _record_caches.get(_sheet_key(sheet))
+    column_map = _column_maps.get(_sheet_key(sheet))
+    if cache is None or column_map is None:
+        return
+    field = next(
+        (name for name, index in column_map[1].items() if index == col), None
+    )
+    if field is None:
+        return
+    for accounts in cache["records"].values():
+        if 0 <= row - 2 < len(accounts) and accounts[row - 2].row == row:
+            setattr(accounts[row - 2], field, str(value))
+
+
+def add_load_listener(listener):
+    """
+    アカウント一覧をスプレッドシートからダウンロードした時に呼ばれる関数を登録
+
+    Args:
+        listener: (sheet, fields, accounts) を受け取る関数
+    """
+    _load_listeners.append(listener)
+
+
+# ウォームスタート用のスナップショットに含めない（ディスクに書き出さない）フィールド
+SNAPSHOT_EXCLUDED_FIELDS = ("id", "password")
+
+
+def export_cache_snapshot():
+    """
+    ウォームスタート用にワークシートのキャッシュを書き出す
+
+    列を指定した読み込み結果のうち、ログイン情報を含まないものだけを対象にする。
+
+    Returns:
+        dict: {sheet_key: {"version", "title", "header", "records"}}
+    """
+    snapshot = {}
+    for key, cache in _record_caches.items():
+        column_map = _column_maps.get(key)
+        sheet = _worksheets.get(key)
+        if cache["version"] is None or column_map is None:
+            continue
+        records = {
+            ",".join(fields): [
+                [account.row] + [getattr(account, field) for field in fields]
+                for account in accounts
+            ]
+            for fields, accounts in cache["records"].items()
+            if fields is not None and not set(fields) & set(SNAPSHOT_EXCLUDED_FIELDS)
+        }
+        if not records:
+            continue
+        snapshot[key] = {
+            "version": cache["version"],
+            "title": getattr(sheet, "title", None),
+            "header": list(column_map[0]),
+            "records": records,
+        }
+    return snapshot
+
+
+def restore_cache_snapshot(snapshot, sheets):
+    """
+    export_cache_snapshot で書き出したキャッシュを復元
+
+    復元したキャッシュは最初の使用時にスプレッドシートのバージョンを確認し、
+    編集されていなければダウンロードせずにそのまま使用する。
+
+    Args:
+        snapshot (dict): export_cache_snapshot の戻り値
+        sheets (list): 復元するワークシートのリスト
+
+    Returns:
+        int: 復元したワークシートの数
+    """
+    restored = 0
+    for sheet in sheets:
+        data = snapshot.get(sheet.key)
+        if data is None or sheet.key in _record_caches:
+            continue
+        if sheet.title is None and data["title"]:
+            sheet.title = data["title"]
+        _resolve_column_map(sheet, data["header"])
+        records = {}
+        for joined, rows in data["records"].items():
+            fields = tuple(joined.split(","))
+            accounts = []
+            for values in rows:
+                account = Account(values[0])
+                for field, value in zip(fields, values[1:]):
+                    setattr(account, field, value)
+                account.sheet = sheet.key
+                accounts.append(account)
+            records[fields] = accounts
+        # checked_at を 0 にして、最初の使用時に必ずバージョンを確認させる
+        _record_caches[sheet.key] = {
+            "version": data["version"], "checked_at": 0.0, "records": records
+        }
+        _register_worksheet(sheet)
+        for fields, accounts in records.items():
+            for listener in list(_load_listeners):
+                listener(sheet, fields, list(accounts))
+        restored += 1
+    return restored
+
+
+def _invalidate_cache(sheet):
+    """ワークシートの読み込み結果のキャッシュを破棄"""
+    _record_caches.pop(_sheet_key(sheet), None)
+
+
+
 # アカウント一覧を取得
-async def get_all_accounts(sheet):
+async def get_all_accounts(sheet, fields=None):
     """
     スプレッドシートからすべてのアカウント情報を取得
     
+    スプレッドシートのDrive上のバージョンが前回の読み込みから変わっていない場合は
+    ダウンロードせずにキャッシュ済みの結果を返す。返されるアカウント情報は
+    キャッシュと共有される。
+    
     Args:
         sheet: スプレッドシートのワークシート
+        fields (tuple, optional): 読み込むフィールド名。指定した列だけを取得し、
+            それ以外のフィールドは空文字になる。省略時はすべての列を取得
         
     Returns:
-        list: アカウント情報のリスト
+        list: アカウント情報（Account）のリスト
     """
-    import asyncio
     try:
-        return await asyncio.get_event_loop().run_in_executor(
-            None, sheet.get_all_records
-        )
+        if fields is not None:
+            fields = tuple(fields)
+        cache = await _get_fresh_cache(sheet)
+        accounts = _cached_accounts(cache, fields)
+        if accounts is None:
+            accounts = await _fetch_accounts(sheet, fields)
+            cache["records"][fields] = accounts
+            _register_worksheet(sheet)
+            for listener in list(_load_listeners):
+                listener(sheet, fields, list(accounts))
+        return list(accounts)
     except Exception as e:
         logging.error(f"アカウント情報取得エラー: {str(e)}", exc_info=True)
-        import traceback
-        logging.error(traceback.format_exc())
         return []
 
 
+async def _fetch_accounts(sheet, fields):
+    """
+    スプレッドシートからアカウント情報をダウンロード
+
+    Args:
+        sheet: スプレッドシートのワークシート
+        fields (tuple or None): 読み込むフィールド名（Noneの場合はすべての列）
+
+    Returns:
+        list: アカウント情報（Account）のリスト
+    """
+    if fields is None:
+        values = await sheet.get_all_values()
+        if not values:
+            return []
+        column_map = _resolve_column_map(sheet, values[0])
+        accounts = [
+            Account.from_values(index + 2, row_values, column_map)
+            for index, row_values in enumerate(values[1:])
+        ]
+        return await _overlay_pending_writes(sheet, accounts)
+
+    column_map = await get_column_map(sheet)
+    subset_map = {field: column_map[field] for field in fields if field in column_map}
+    if not subset_map:
+        return []
+    ranges = [
+        f"{column_letter(col)}2:{column_letter(col)}" for col in subset_map.values()
+    ]
+    columns = await sheet.batch_get(ranges)
+    row_count = max((len(column) for column in columns), default=0)
+
+    accounts = [Account(index + 2) for index in range(row_count)]
+    for field, column in zip(subset_map, columns):
+        for account, cell in zip(accounts, column):
+            if cell:
+                setattr(account, field, str(cell[0]))
+    return await _overlay_pending_writes(sheet, accounts)
+
+
+async def _overlay_pending_writes(sheet, accounts):
+    """
+    まだスプレッドシートに適用されていない書き込みを読み込み結果に反映
+
+    あわせて各アカウントに読み込み元のワークシートを記録する。
+
+    Args:
+        sheet: スプレッドシートのワークシート
+        accounts (list): 読み込んだアカウント情報のリスト
+
+    Returns:
+        list: 未適用の書き込みを反映したアカウント情報のリスト
+    """
+    for account in accounts:
+        account.sheet = sheet.key
+    if _journal is None:
+        return accounts
+    pending = await _record(_journal.pending_updates, sheet.key)
+    if not pending:
+        return accounts
+
+    column_map = _column_maps.get(_sheet_key(sheet))
+    fields = {col: field for field, col in column_map[1].items()} if column_map else {}
+    for (row, col), value in pending.items():
+        field = fields.get(col)
+        if field and 0 <= row - 2 < len(accounts):
+            setattr(accounts[row - 2], field, str(value))
+    return accounts
+
+
+
+# スプレッドシートの特定のセルの値を取得
+async def get_cell_value(sheet, row, field):
+    """
+    スプレッドシートの特定のセルの値を取得
+    
+    Args:
+        sheet: スプレッドシートのワークシート
+        row (int): 行番号
+        field (str): フィールド名（ヘッダー名）
+        
+    Returns:
+        str or None: セルの値
+    """
+    # スプレッドシートが編集されていなければキャッシュから返す
+    cache = await _get_fresh_cache(sheet)
+    accounts = _cached_accounts(cache, None)
+    if accounts is not None and 0 <= row - 2 < len(accounts):
+        return getattr(accounts[row - 2], field)
+
+    col = (await get_column_map(sheet))[field]
+    return await sheet.cell_value(row, col)
+
+
 
 # スプレッドシートの特定のセルを更新
 async def update_cell(sheet, row, col, value):
     """
     スプレッドシートの特定のセルを更新
     
+    書き込みは適用前にジャーナルに記録する。Google側の障害で適用できなかった
+    場合も記録済みであれば成功として扱い、復旧後に記録順に再適用する。
+    
     Args:
         sheet: スプレッドシートのワークシート
         row (int): 行番号
-        col (int): 列番号
+        col (int or str): 列番号、またはフィールド名（ヘッダー名）
         value: 設定する値
+        
+    Returns:
+        bool: 書き込みが適用済み、または再適用待ちとして記録された場合はTrue
     """
-    import asyncio
     try:
-        await asyncio.get_event_loop().run_in_executor(
-            None, sheet.update_cell, row, col, value
-        )
-        logging.info(f"セル更新: ({row}, {col}) = {value}")
-        return True
+        if isinstance(col, str):
+            col = (await get_column_map(sheet))[col]
+        entry = await _record(get_journal().record_update, sheet.key, row, col, value)
     except Exception as e:
         logging.error(
             f"セル更新エラー: ({row}, {col}) = {value}: {str(e)}", 
             exc_info=True
         )
-        import traceback
-        logging.error(traceback.format_exc())
         return False
 
+    _register_worksheet(sheet)
+    _update_cached_accounts(sheet, row, col, value)
+    if await _apply_entry(sheet, entry):
+        logging.info(f"セル更新: ({row}, {col}) = {value}")
+        return True
+    return entry["status"] != "failed"
+
 
 
 # スプレッドシートに行を追加
@@ -91,19 +503,254 @@ async def append_row(sheet, row_data):
     """
     スプレッドシートに行を追加
     
+    書き込みの扱いは update_cell と同様。
+    
     Args:
         sheet: スプレッドシートのワークシート
         row_data (list): 追加する行のデータリスト
+        
+    Returns:
+        bool: 書き込みが適用済み、または再適用待ちとして記録された場合はTrue
     """
-    import asyncio
     try:
-        await asyncio.get_event_loop().run_in_executor(
-            None, sheet.append_row, row_data
-        )
+        entry = await _record(get_journal().record_append, sheet.key, row_data)
+    except Exception as e:
+        logging.error(f"行追加エラー: {row_data}: {str(e)}", exc_info=True)
+        return False
+
+    _register_worksheet(sheet)
+    if await _apply_entry(sheet, entry):
         logging.info(f"行追加: {row_data}")
         return True
+    return entry["status"] != "failed"
+
+
+
+# -------------------------------
+# 書き込みジャーナル
+_journal = None
+# ジャーナルやスナップショットのキーからワークシートを引くための対応表 {sheet_key: Worksheet}
+# （キャッシュから削除されたワークシートを保持し続けないよう弱参照で持つ）
+_worksheets = weakref.WeakValueDictionary()
+# 対応表にないキーからワークシートを取得する関数（set_worksheet_resolver 参照）
+_worksheet_resolver = None
+# セルごとの書き込みロック {(sheet_key, row, col): asyncio.Lock}
+_cell_locks = {}
+# 適用中のエントリの番号（再適用タスクとの二重送信を防ぐ）
+_applying = set()
+_replay_task = None
+
+
+def get_journal():
+    """
+    書き込みジャーナルを取得（初回呼び出し時に開く）
+
+    Returns:
+        WriteJournal: 書き込みジャーナル
+    """
+    global _journal
+    if _journal is None:
+        _journal = WriteJournal()
+    return _journal
+
+
+def _register_worksheet(sheet):
+    """ジャーナルの再適用やスナップショットで使用するワークシートを登録"""
+    _worksheets[sheet.key] = sheet
+
+
+def set_worksheet_resolver(resolver):
+    """
+    ジャーナルの再適用で、対応表にないキーのワークシートを取得する関数を設定
+
+    Args:
+        resolver: ワークシートのキーを受け取り Worksheet を返す関数
+            （取得できない場合は例外を送出する）
+    """
+    global _worksheet_resolver
+    _worksheet_resolver = resolver
+
+
+def _lookup_worksheet(sheet_key):
+    """
+    ジャーナルのキーからワークシートを取得
+
+    Args:
+        sheet_key (str): ワークシートのキー
+
+    Returns:
+        Worksheet or None: ワークシート（取得できない場合はNone）
+    """
+    sheet = _worksheets.get(sheet_key)
+    if sheet is None and _worksheet_resolver is not None:
+        try:
+            sheet = _worksheet_resolver(sheet_key)
+        except Exception as e:
+            logging.warning(f"ワークシート {sheet_key} を取得できませんでした: {e}")
+            return None
+        _register_worksheet(sheet)
+    return sheet
+
+
+async def _record(func, *args):
+    """ジャーナルへの記録（fsyncを伴う）をイベントループ外で実行"""
+    return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+async def _apply_entry(sheet, entry):
+    """
+    ジャーナルのエントリをスプレッドシートに適用
+
+    一時的なエラーの場合はエントリを未適用のまま残して再適用タスクを開始する。
+    再試行しても成功しないエラーの場合はエントリを失敗として記録する。
+
+    Args:
+        sheet: スプレッドシートのワークシート
+        entry (dict): ジャーナルのエントリ
+
+    Returns:
+        bool: 適用できた場合はTrue
+    """
+    _applying.add(entry["seq"])
+    try:
+        return await _apply_entry_locked(sheet, entry)
+    finally:
+        _applying.discard(entry["seq"])
+
+
+async def _apply_entry_locked(sheet, entry):
+    """同じセルへの書き込みが追い越さないように1件ずつ適用"""
+    journal = get_journal()
+    if entry["op"] == "update":
+        key = (entry["sheet"], entry["row"], entry["col"])
+        lock = _cell_locks.get(key)
+        if lock is None:
+            lock = _cell_locks[key] = asyncio.Lock()
+        async with lock:
+            if await _record(journal.is_superseded, entry):
+                await _record(journal.mark_applied, entry)
+                entry["status"] = "applied"
+                return True
+            return await _send_entry(sheet, entry)
+    return await _send_entry(sheet, entry)
+
+
+def _normalize_row(values):
+    """行の比較用に値を文字列にして末尾の空セルを除く"""
+    row = ["" if value is None else str(value) for value in values]
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+async def _append_already_applied(sheet, entry):
+    """
+    以前の送信（タイムアウトなどで結果が不明）で行が追加済みか確認
+
+    Args:
+        sheet: スプレッドシートのワークシート
+        entry (dict): 行追加のエントリ
+
+    Returns:
+        bool: 同じ内容の行が既に存在する場合はTrue
+    """
+    expected = _normalize_row(entry["value"])
+    return any(_normalize_row(row) == expected for row in await sheet.get_all_values())
+
+
+async def _send_entry(sheet, entry):
+    """エントリの内容をスプレッドシートに送信して結果をジャーナルに記録"""
+    journal = get_journal()
+    if not await _record(journal.claim, entry):
+        # 他のプロセスが送信中（占有期限が切れるまで待つ）
+        entry["status"] = "leased"
+        return False
+    try:
+        if entry["op"] == "update":
+            await sheet.update_cell(entry["row"], entry["col"], entry["value"])
+        elif entry["attempts"] > 1 and await _append_already_applied(sheet, entry):
+            # 行追加は再送すると重複するため、前回の送信が届いていれば送らない
+            logging.info(f"行追加は適用済みでした: seq={entry['seq']}")
+            _invalidate_cache(sheet)
+        else:
+            await sheet.append_row(entry["value"])
+            _invalidate_cache(sheet)
     except Exception as e:
-        logging.error(f"行追加エラー: {row_data}: {str(e)}", exc_info=True)
-        import traceback
-        logging.error(traceback.format_exc())
-        return False 
\ No newline at end of file
+        permanent = isinstance(e, SheetsAPIError) and e.status in (400, 404)
+        await _record(journal.mark_failed, entry, e, permanent)
+        if permanent:
+            entry["status"] = "failed"
+            logging.error(f"書き込みを適用できませんでした（再試行しません）: {entry}: {e}")
+        else:
+            entry["status"] = "pending"
+            logging.warning(f"書き込みを再適用待ちにしました: seq={entry['seq']}: {e}")
+            start_journal_replay()
+        return False
+
+    await _record(journal.mark_applied, entry)
+    entry["status"] = "applied"
+    if entry["op"] == "update":
+        await _record_own_revision(sheet)
+    return True
+
+
+async def _replay_pending():
+    """未適用のエントリを記録順に再適用（失敗した場合は間隔を空けて再試行）"""
+    journal = get_journal()
+    delay = JOURNAL_RETRY_BASE_DELAY
+    while True:
+        entries = await _record(journal.pending_entries)
+        if not entries:
+            logging.info("未適用の書き込みをすべて再適用しました")
+            return
+
+        in_flight = False
+        unregistered = set()
+        for entry in entries:
+            if entry["seq"] in _applying:
+                in_flight = True
+                continue
+            sheet = _lookup_worksheet(entry["sheet"])
+            if sheet is None:
+                # 開かれていないワークシートの分は、開かれた時に再適用する
+                unregistered.add(entry["sheet"])
+                continue
+            if await _apply_entry(sheet, entry):
+                continue
+            if entry["status"] == "leased":
+                # 他のプロセスが送信中のエントリは結果を待ってから確認し直す
+                in_flight = True
+                continue
+            if entry["status"] == "pending":
+                break
+        else:
+            delay = JOURNAL_RETRY_BASE_DELAY
+            if in_flight:
+                # 適用中のエントリの結果を待ってから確認し直す
+                await asyncio.sleep(1)
+                continue
+            if unregistered:
+                logging.warning(
+                    f"ワークシート {', '.join(sorted(unregistered))} が未登録のため再適用を保留します"
+                )
+                return
+            continue
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, JOURNAL_RETRY_MAX_DELAY)
+
+
+def start_journal_replay(sheet=None):
+    """
+    未適用の書き込みの再適用タスクを開始（実行中の場合は何もしない）
+
+    Args:
+        sheet (optional): 再適用先として登録するワークシート
+    """
+    global _replay_task
+    if sheet is not None:
+        _register_worksheet(sheet)
+    if _replay_task is None or _replay_task.done():
+        # 再適用はバックグラウンド処理としてユーザー操作のリクエストを優先させる
+        with bulk_priority():
+            _replay_task = asyncio.create_task(_replay_pending())
@@ -1,54 +1,435 @@
 import os
+import time
+import random
+import asyncio
 import logging
-import traceback
+import datetime
+import contextlib
+import contextvars
+import email.utils
+import requests
 import valo_api
 
+from .ranks import UNRATED_TIER, RankSnapshot
+from .rank_history import record_rank
+
+# -------------------------------
+# APIの耐障害性設定
+# 再試行時のバックオフ基準時間（秒）
+RETRY_BASE_DELAY = float(os.getenv("VALO_API_RETRY_BASE_DELAY", "1.0"))
+# これより長い待機が必要な場合は再試行せずに諦める（秒）
+RETRY_MAX_DELAY = float(os.getenv("VALO_API_RETRY_MAX_DELAY", "60"))
+# サーキットブレーカーが開くまでの連続失敗回数
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("VALO_API_BREAKER_THRESHOLD", "5"))
+# サーキットブレーカーが開いている時間（秒）
+BREAKER_RESET_TIMEOUT = float(os.getenv("VALO_API_BREAKER_TIMEOUT", "60"))
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているためリクエストを送信しなかったことを示す例外"""
+
+
+class BudgetExhaustedError(Exception):
+    """リクエスト数の予算を使い切ったためリクエストを送信しなかったことを示す例外"""
+
+
+class RequestBudget:
+    """
+    一括処理が送信できるAPIリクエスト数（再試行を含む）
+
+    request_budget のブロック内（と、ここから作成したタスク）で実際に送信した
+    リクエストを数える。実行中の同じリクエストに合流した場合は数えない。
+    """
+
+    def __init__(self, limit):
+        """
+        初期化
+
+        Args:
+            limit (int): 送信できるリクエスト数
+        """
+        self.limit = limit
+        self.used = 0
+
+    @property
+    def remaining(self):
+        """残りのリクエスト数"""
+        return max(0, self.limit - self.used)
+
+
+# 現在のタスクが使用するリクエスト数の予算（Noneの場合は制限しない）
+_request_budget = contextvars.ContextVar("valorant_request_budget", default=None)
+
+
+@contextlib.contextmanager
+def request_budget(limit):
+    """
+    このブロック内で送信するAPIリクエスト数を制限する
+
+    予算を使い切った後のリクエストは BudgetExhaustedError で失敗し、
+    失敗したリクエストの再試行も行わない。
+
+    Args:
+        limit (int): 送信できるリクエスト数（再試行を含む）
+
+    Yields:
+        RequestBudget: 使用状況
+    """
+    budget = RequestBudget(limit)
+    token = _request_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _request_budget.reset(token)
+
+
+class CircuitBreaker:
+    """
+    Valorant API 用のサーキットブレーカー
+
+    連続して失敗した場合やレート制限を受けた場合に一定時間リクエストを遮断し、
+    時間経過後は1件だけ試行リクエストを通して復旧を確認する。
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        """
+        初期化
+
+        Args:
+            failure_threshold (int): ブレーカーが開くまでの連続失敗回数
+            reset_timeout (float): ブレーカーが開いている時間（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_until = 0.0
+        self._probing = False
+
+    def allow(self):
+        """
+        リクエストを送信してよいか判定
+
+        Returns:
+            bool: 送信してよい場合はTrue
+        """
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() >= self.opened_until:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def retry_in(self):
+        """
+        ブレーカーが閉じるまでの残り時間を取得
+
+        Returns:
+            float: 残り秒数（閉じている場合は0）
+        """
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def record_success(self):
+        """リクエスト成功を記録してブレーカーを閉じる"""
+        if self.state != "closed":
+            logging.info("Valorant API: サーキットブレーカーを閉じました")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def release_probe(self):
+        """
+        結果を記録せずに終わった試行リクエスト（キャンセルなど）の枠を解放する
+
+        半開状態のまま次のリクエストが試行できなくなるのを防ぐ。
+        """
+        if self.state == "half_open":
+            self._probing = False
+
+    def record_failure(self, retry_after=None):
+        """
+        リクエスト失敗を記録
+
+        Args:
+            retry_after (float, optional): APIから指示された待機時間（秒）
+        """
+        self.failures += 1
+        self._probing = False
+        if (
+            retry_after is not None
+            or self.state == "half_open"
+            or self.failures >= self.failure_threshold
+        ):
+            # APIから待機時間が指示された場合はその時間だけ開く
+            timeout = retry_after if retry_after is not None else self.reset_timeout
+            self.state = "open"
+            self.opened_until = time.monotonic() + timeout
+            logging.warning(
+                f"Valorant API: サーキットブレーカーを開きました ({timeout:.0f}秒間)"
+            )
+
+
+_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+# 最後に取得できたランク情報 {(region, name, tag): RankSnapshot}
+_rank_cache = {}
+
+# 実行中のリクエスト {(種類, region, name, tag): asyncio.Task}
+_inflight = {}
+
+
 # Valorant API のキー設定
 def setup_api():
     """Valorant APIのキー設定を行う"""
     valo_api.set_api_key(os.getenv("VALO_API_KEY"))
 
+
+def is_api_available():
+    """
+    Valorant APIへリクエストを送信できる状態か確認
+
+    Returns:
+        bool: サーキットブレーカーが開いていない場合はTrue
+    """
+    return _breaker.state != "open" or _breaker.retry_in() == 0
+
+
+def _error_status(error):
+    """例外からHTTPステータスコードを取得（取得できない場合はNone）"""
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_retry_after(error):
+    """
+    例外に含まれるレスポンスヘッダーから待機時間を取得
+
+    Args:
+        error (Exception): APIリクエストで発生した例外
+
+    Returns:
+        float or None: 待機時間（秒）。指定がない場合はNone
+    """
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    headers = {str(k).lower(): v for k, v in dict(headers).items()}
+
+    value = headers.get("retry-after") or headers.get("x-ratelimit-reset")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(str(value))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return max(0.0, (retry_at - now).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_transient_error(error, status):
+    """
+    再試行とブレーカーの失敗の対象になる一時的なエラーか判定
+
+    Args:
+        error (Exception): APIリクエストで発生した例外
+        status (int or None): HTTPステータスコード
+
+    Returns:
+        bool: 通信エラー・タイムアウト・408・429・5xx の場合はTrue
+    """
+    if status is None:
+        return isinstance(error, (
+            requests.exceptions.ConnectionError, requests.exceptions.Timeout, TimeoutError
+        ))
+    return status >= 500 or status in (408, 429)
+
+
+async def _call_api(func, *args, retries=0):
+    """
+    サーキットブレーカーと再試行を適用してValorant APIを呼び出す
+
+    429 の場合は Retry-After に従って待機し、5xx や通信エラーの場合は
+    ジッター付き指数バックオフで再試行する。それ以外の 4xx と、解析エラーなど
+    ステータスのない例外は即座に送出し、ブレーカーの失敗にも数えない。
+
+    Args:
+        func: valo_api の関数
+        *args: 関数に渡す引数
+        retries (int): 再試行の最大回数（対話的な処理では0を推奨）
+
+    Returns:
+        関数の戻り値
+
+    Raises:
+        CircuitOpenError: ブレーカーが開いている場合
+        BudgetExhaustedError: request_budget の予算を使い切っている場合
+        Exception: APIリクエストが失敗した場合
+    """
+    loop = asyncio.get_event_loop()
+    budget = _request_budget.get()
+    attempt = 0
+    while True:
+        if budget is not None and budget.remaining == 0:
+            raise BudgetExhaustedError("APIリクエスト数の予算を使い切りました")
+        if not _breaker.allow():
+            raise CircuitOpenError(
+                f"Valorant APIは一時停止中です (残り{_breaker.retry_in():.0f}秒)"
+            )
+        if budget is not None:
+            budget.used += 1
+        probing = _breaker.state == "half_open"
+        try:
+            result = await loop.run_in_executor(None, func, *args)
+        except Exception as e:
+            status = _error_status(e)
+            if not _is_transient_error(e, status):
+                # 4xx はAPIには到達できているのでブレーカーの失敗には数えない
+                if status is not None:
+                    _breaker.record_success()
+                # 解析エラーなどステータスのない例外は再試行しても直らないのでそのまま送出する
+                raise
+
+            retry_after = _parse_retry_after(e) if status == 429 else None
+            if retry_after is not None:
+                delay = retry_after
+            else:
+                delay = RETRY_BASE_DELAY * (2 ** attempt)
+                delay += random.uniform(0, delay)
+            will_retry = (
+                attempt < retries
+                and (budget is None or budget.remaining > 0)
+                and delay <= RETRY_MAX_DELAY
+            )
+            if status != 429 or not will_retry:
+                # 待機して再試行する 429 ではブレーカーを開かない（他の呼び出し元を止めない）
+                _breaker.record_failure(retry_after)
+            if not will_retry:
+                raise
+
+            # 失敗が続いてブレーカーが開いた場合は閉じるまで待ってから再試行する
+            delay = max(delay, _breaker.retry_in())
+            if delay > RETRY_MAX_DELAY:
+                raise
+            logging.warning(
+                f"Valorant APIエラー (status={status}), {delay:.1f}秒後に再試行します"
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        finally:
+            if probing:
+                # キャンセルされた場合も試行中のまま残らないようにする
+                _breaker.release_probe()
+
+        _breaker.record_success()
+        return result
+
+
+async def _single_flight(key, coro_func, *args):
+    """
+    同じキーのリクエストが実行中であればその結果を待ち、なければ新しく実行する
+
+    Args:
+        key (tuple): リクエストを識別するキー
+        coro_func: 実行するコルーチン関数
+        *args: コルーチン関数に渡す引数
+
+    Returns:
+        コルーチンの戻り値
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(coro_func(*args))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        logging.debug(f"実行中のリクエストに合流します: {key}")
+    # 待機中の呼び出し元がキャンセルされても共有タスクは継続させる
+    return await asyncio.shield(task)
+
+
 # Valorant ランク情報取得関数
-def get_valorant_rank(region, name, tag):
+async def get_valorant_rank(region, name, tag, retries=0):
     """
     Valorantのランク情報を取得する関数
-    
+
+    同じアカウントへのリクエストが実行中の場合は、新しくリクエストを送らずに
+    その結果を共有する（再試行回数は最初の呼び出し元の指定に従う）。
+    APIが利用できない場合は最後に取得できたランク情報を返す。
+
     Args:
         region (str): リージョン（例: 'ap', 'na', 'eu'）
         name (str): Valorantユーザー名
         tag (str): Valorantタグ
-        
+        retries (int): 一時的なエラー時の再試行回数
+
     Returns:
-        dict or None: ランク情報を含む辞書。エラー時はNone
+        RankSnapshot or None: ランク情報。エラー時はNone
     """
     if not name or not tag:
         logging.warning(
             f"Valorantユーザー名またはタグが空です: name='{name}', tag='{tag}'"
         )
         return None
-        
+
+    key = ("rank", region, name.lower(), tag.lower())
+    return await _single_flight(key, _fetch_valorant_rank, region, name, tag, retries)
+
+
+async def _fetch_valorant_rank(region, name, tag, retries):
+    """get_valorant_rank の実処理"""
+    cache_key = (region, name.lower(), tag.lower())
     try:
         logging.info(
             f"Valorantランク情報取得開始: region={region}, name={name}, tag={tag}"
         )
-        
+
         # バージョンを 'v2' として指定
-        mmr_data = valo_api.get_mmr_details_by_name("v2", region, name, tag)
-        
+        mmr_data = await _call_api(
+            valo_api.get_mmr_details_by_name, "v2", region, name, tag,
+            retries=retries
+        )
+    except CircuitOpenError as e:
+        logging.warning(f"Valorantランク情報取得スキップ: {e}")
+        return _cached_rank(cache_key)
+    except Exception as e:
+        logging.warning(
+            f"Valorantランク情報取得エラー (status={_error_status(e)}): "
+            f"name={name}, tag={tag}: {str(e)}"
+        )
+        return _cached_rank(cache_key)
+
+    try:
         # mmr_dataが存在するか確認
         if not mmr_data:
             logging.warning(
                 f"MMRデータが取得できませんでした: region={region}, name={name}, tag={tag}"
             )
             return None
-            
+
         # current_dataが存在するか確認
         if not hasattr(mmr_data, 'current_data') or not mmr_data.current_data:
             logging.warning(
                 f"current_dataがありません: region={region}, name={name}, tag={tag}"
             )
             return None
-            
+
         # highest_rankが存在するか確認
         if not hasattr(mmr_data, 'highest_rank') or not mmr_data.highest_rank:
             logging.warning(
@@ -59,28 +440,133 @@ def get_valorant_rank(region, name, tag):
         else:
             highest_rank = mmr_data.highest_rank.patched_tier
             highest_rank_season = mmr_data.highest_rank.season
-        
+
         # 現在のランク情報
         current_rank = mmr_data.current_data.currenttierpatched
         tier_ranking = mmr_data.current_data.ranking_in_tier
         mmr_change = mmr_data.current_data.mmr_change_to_last_game
         elo = mmr_data.current_data.elo
-        
-        result = {
-            "current_rank": current_rank,
-            "tier_ranking": tier_ranking,
-            "mmr_change": mmr_change,
-            "elo": elo,
-            "highest_rank": highest_rank,
-            "highest_rank_season": highest_rank_season,
-            "raw_data": mmr_data
-        }
-        
+        # 比較・並べ替え用の数値のティアID（0 はランクなし）
+        tier = getattr(mmr_data.current_data, "currenttier", None) or UNRATED_TIER
+
+        result = RankSnapshot(
+            current_rank=current_rank,
+            tier=tier,
+            tier_ranking=tier_ranking,
+            mmr_change=mmr_change,
+            elo=elo,
+            highest_rank=highest_rank,
+            highest_rank_season=highest_rank_season,
+            fetched_at=time.time(),
+            # APIの生データはデバッグ時のみ保持する（キャッシュに大きなオブジェクトを残さない）
+            raw_data=mmr_data if logging.getLogger().isEnabledFor(logging.DEBUG) else None
+        )
+        _rank_cache[cache_key] = result
+        # APIから取得できた値だけを履歴に残す（キャッシュからの応答は記録しない）
+        record_rank(name, tag, result)
+
         logging.info(f"Valorantランク情報取得成功: name={name}, rank={current_rank}")
         return result
-        
+
     except Exception as e:
-        logging.error(f"Valorantランク情報取得エラー: {str(e)}", exc_info=True)
-        # エラーの詳細をログに記録
-        logging.error(traceback.format_exc())
-        return None 
\ No newline at end of file
+        logging.error(f"Valorantランク情報の解析エラー: {str(e)}", exc_info=True)
+        return None
+
+
+def export_rank_cache():
+    """
+    ウォームスタート用にランク情報のキャッシュを書き出す（APIの生データは含めない）
+
+    Returns:
+        dict: {"region|name|tag": ランク情報}
+    """
+    return {
+        "|".join(key): result._replace(raw_data=None, cached=False)._asdict()
+        for key, result in _rank_cache.items()
+    }
+
+
+def restore_rank_cache(data):
+    """
+    export_rank_cache で書き出したキャッシュを復元（起動後に取得した値を優先する）
+
+    Args:
+        data (dict): export_rank_cache の戻り値
+    """
+    for key, result in data.items():
+        region, name, tag = key.split("|", 2)
+        try:
+            snapshot = RankSnapshot(**{
+                field: value for field, value in result.items()
+                if field in RankSnapshot._fields and field != "raw_data"
+            })
+        except TypeError:
+            continue
+        _rank_cache.setdefault((region, name, tag), snapshot)
+
+
+def _cached_rank(cache_key):
+    """
+    キャッシュ済みのランク情報を取得
+
+    Args:
+        cache_key (tuple): (region, name, tag) のキー
+
+    Returns:
+        RankSnapshot or None: キャッシュされたランク情報（cached=True）
+    """
+    cached = _rank_cache.get(cache_key)
+    if cached is None:
+        return None
+    logging.info(f"キャッシュ済みのランク情報を使用します: {cache_key[1]}#{cache_key[2]}")
+    return cached._replace(cached=True)
+
+
+# 現在のランク取得関数（一括更新用）
+async def get_current_rank(region, name, tag, retries=0):
+    """
+    試合がなければ詳細情報を取得せずに現在のランクを取得する関数
+
+    まずMMR履歴（v1）を取得し、最新の試合のELOとMMR変化をマーカーとして
+    前回取得したランク情報と比較する。同じであれば前回の値をそのまま返す。
+    変わっていた場合（または前回の値がない場合）だけ v2 の詳細情報を取得する。
+
+    Args:
+        region (str): リージョン（例: 'ap', 'na', 'eu'）
+        name (str): Valorantユーザー名
+        tag (str): Valorantタグ
+        retries (int): 一時的なエラー時の再試行回数
+
+    Returns:
+        RankSnapshot or None: ランク情報。エラー時はNone
+    """
+    if not name or not tag:
+        return None
+
+    key = ("current", region, name.lower(), tag.lower())
+    return await _single_flight(key, _fetch_current_rank, region, name, tag, retries)
+
+
+async def _fetch_current_rank(region, name, tag, retries):
+    """get_current_rank の実処理"""
+    cache_key = (region, name.lower(), tag.lower())
+    try:
+        history = await _call_api(
+            valo_api.get_mmr_history_by_name, "v1", region, name, tag,
+            retries=retries
+        )
+    except Exception as e:
+        logging.warning(
+            f"MMR履歴の取得エラー (status={_error_status(e)}): "
+            f"name={name}, tag={tag}: {str(e)}"
+        )
+        return None
+
+    previous = _rank_cache.get(cache_key)
+    if history and previous is not None:
+        latest = history[0]
+        if (latest.elo, latest.mmr_change_to_last_game) == (previous.elo, previous.mmr_change):
+            logging.info(f"前回の取得以降に試合がないため詳細情報の取得を省略します: {name}#{tag}")
+            return previous._replace(cached=False, fetched_at=time.time())
+
+    return await get_valorant_rank(region, name, tag, retries=retries)
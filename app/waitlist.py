@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import logging
+import discord
+from .accounts import is_account_borrowed
+from .waitlist_store import WaitlistStore
+
+# 空いたアカウントを待機中のユーザーのために確保しておく時間（秒）
+WAITLIST_OFFER_TIMEOUT = float(os.getenv("WAITLIST_OFFER_TIMEOUT", "120"))
+
+
+class Waitlist:
+    """
+    利用可能なアカウントがない場合の借用待ちの列（サーバーごとの先着順）
+
+    アカウントが返却・自動返却されると、列の先頭のユーザーにそのアカウントを
+    一定時間確保して通知する。時間内に借りられなかった場合は次のユーザーに回す。
+    列と確保状況は共有のSQLiteに保持し、複数のシャードプロセスで共有する。
+    """
+
+    def __init__(self, bot, guild_sheets, store=None):
+        """
+        初期化
+
+        Args:
+            bot: Discordボット
+            guild_sheets (GuildSheets): サーバーごとのスプレッドシートの対応表
+            store (WaitlistStore, optional): 待機列のストア（省略時は共有のファイルを開く）
+        """
+        self.bot = bot
+        self.guild_sheets = guild_sheets
+        self.store = store or WaitlistStore()
+        # このプロセスで実行中の確保・通知タスク {(sheet_key, row): asyncio.Task}
+        self._offer_tasks = {}
+
+    async def _run(self, func, *args):
+        """ストア（SQLite）の操作をイベントループ外で実行"""
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    async def join(self, guild_id, user_id, channel_id):
+        """
+        待機列に並ぶ（並んでいる場合は順番を変えない）
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+            channel_id (int): 通知を送るチャンネルのID
+
+        Returns:
+            int: 待機列での順番（1始まり）
+        """
+        return await self._run(self.store.join, guild_id, user_id, channel_id)
+
+    async def leave(self, guild_id, user_id):
+        """
+        待機列から抜ける
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+
+        Returns:
+            bool: 待機列に並んでいた場合はTrue
+        """
+        return await self._run(self.store.leave, guild_id, user_id)
+
+    async def position(self, guild_id, user_id):
+        """
+        待機列での順番を取得
+
+        Returns:
+            int or None: 順番（1始まり）。並んでいない場合はNone
+        """
+        return await self._run(self.store.position, guild_id, user_id)
+
+    async def reservations(self, sheet_key):
+        """
+        ワークシートの確保中のアカウントを取得
+
+        Args:
+            sheet_key (str): ワークシートのキー
+
+        Returns:
+            dict: {行番号: 確保しているユーザーのID}
+        """
+        return await self._run(self.store.reservations, sheet_key)
+
+    def on_account_event(self, event, account):
+        """返却・自動返却されたアカウントを待機列の先頭のユーザーに回す"""
+        key = (account.sheet, account.row)
+        if event == "borrow":
+            self._cancel_offer_task(key)
+            asyncio.create_task(self._run(self.store.clear_offer, *key))
+        elif event in ("return", "auto_return"):
+            asyncio.create_task(self._offer(key, account.name))
+
+    def _cancel_offer_task(self, key):
+        """このプロセスで実行中のアカウントの確保・通知を止める"""
+        task = self._offer_tasks.pop(key, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    async def _next_user(self, guild_ids):
+        """待機列の先頭から、まだアカウントを借りていないユーザーを取り出す"""
+        for guild_id in guild_ids:
+            while True:
+                waiting = await self._run(self.store.pop_next, guild_id)
+                if waiting is None:
+                    break
+                user_id, channel_id = waiting
+                if not await is_account_borrowed(user_id, guild_id):
+                    return guild_id, user_id, channel_id
+        return None
+
+    async def _offer(self, key, account_name):
+        """
+        アカウントを待機列のユーザーに順番に確保して通知
+
+        確保したユーザーが期限内に借りた場合（他のプロセスで借りた場合も含む）は
+        確保が解除されているため、そこで終了する。
+
+        Args:
+            key (tuple): (ワークシートのキー, 行番号)
+            account_name (str): アカウント名
+        """
+        self._cancel_offer_task(key)
+        self._offer_tasks[key] = asyncio.current_task()
+        try:
+            guild_ids = await self._run(self.store.waiting_guilds)
+            if not guild_ids:
+                return
+            # 待機列にユーザーがいるサーバーのうち、ワークシートを使用しているサーバーが対象
+            guild_ids = await self.guild_sheets.guilds_for_sheet(key[0], guild_ids)
+            while guild_ids:
+                waiting = await self._next_user(guild_ids)
+                if waiting is None:
+                    break
+                guild_id, user_id, channel_id = waiting
+                await self._run(
+                    self.store.offer, *key, user_id, time.time() + WAITLIST_OFFER_TIMEOUT
+                )
+                await self._notify(user_id, channel_id, account_name)
+                await asyncio.sleep(WAITLIST_OFFER_TIMEOUT)
+                if not await self._run(self.store.clear_offer, *key, user_id):
+                    # 借りられたため確保が解除されている
+                    break
+                logging.info(f"待機列: {user_id} が {account_name} を借りなかったため次の順番に回します")
+        finally:
+            if self._offer_tasks.get(key) is asyncio.current_task():
+                del self._offer_tasks[key]
+
+    async def _notify(self, user_id, channel_id, account_name):
+        """アカウントが空いたことをDM（送れない場合はチャンネル）で通知"""
+        minutes = max(1, round(WAITLIST_OFFER_TIMEOUT / 60))
+        message = (
+            f"お待たせしました！アカウント **{account_name}** が空きました。\n"
+            f"{minutes}分間確保しています。`/use_account` で借りてください。"
+        )
+        try:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            await user.send(message)
+            return
+        except discord.HTTPException as e:
+            logging.warning(f"待機列の通知をDMで送れませんでした (user={user_id}): {e}")
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            try:
+                await channel.send(f"<@{user_id}> {message}")
+            except discord.HTTPException as e:
+                logging.error(f"待機列の通知に失敗しました (user={user_id}): {e}")
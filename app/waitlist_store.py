@@ -0,0 +1,208 @@
+import os
+import time
+import sqlite3
+import threading
+
+# 待機列と確保中のアカウントの保存先（複数のシャードプロセスで共有する）
+WAITLIST_STORE_PATH = os.getenv(
+    "WAITLIST_STORE_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "waitlist.db")
+)
+# 他のプロセスが書き込み中の場合に待機する時間（ミリ秒）
+BUSY_TIMEOUT_MS = 5000
+
+
+class WaitlistStore:
+    """
+    サーバーごとの借用待ちの列と、待機中のユーザーに確保したアカウントを保持する
+    SQLiteストア
+
+    WALモードで開くため、同じマシン上の複数のシャードプロセスが同じ列と
+    確保状況を参照する。列の先頭は pop_next で1つのプロセスだけが取り出せる。
+    """
+
+    def __init__(self, path=WAITLIST_STORE_PATH):
+        """
+        初期化
+
+        Args:
+            path (str): SQLiteファイルのパス
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS queue (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                channel_id INTEGER,
+                UNIQUE (guild_id, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS offers (
+                sheet TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (sheet, row)
+            );
+            """
+        )
+
+    def join(self, guild_id, user_id, channel_id):
+        """
+        待機列に並ぶ（並んでいる場合は順番を変えない）
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+            channel_id (int): 通知を送るチャンネルのID
+
+        Returns:
+            int: 待機列での順番（1始まり）
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO queue (guild_id, user_id, channel_id) VALUES (?, ?, ?) "
+                "ON CONFLICT (guild_id, user_id) DO NOTHING",
+                (guild_id, user_id, channel_id)
+            )
+            return self._position(guild_id, user_id)
+
+    def leave(self, guild_id, user_id):
+        """
+        待機列から抜ける
+
+        Args:
+            guild_id (int): サーバーID
+            user_id (int): ユーザーID
+
+        Returns:
+            bool: 待機列に並んでいた場合はTrue
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM queue WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+            )
+        return cursor.rowcount > 0
+
+    def position(self, guild_id, user_id):
+        """
+        待機列での順番を取得
+
+        Returns:
+            int or None: 順番（1始まり）。並んでいない場合はNone
+        """
+        with self._lock:
+            return self._position(guild_id, user_id)
+
+    def _position(self, guild_id, user_id):
+        """position の実処理（ロックを取得してから呼び出す）"""
+        (position,) = self._conn.execute(
+            "SELECT COUNT(*) FROM queue WHERE guild_id = ? AND seq <= "
+            "(SELECT seq FROM queue WHERE guild_id = ? AND user_id = ?)",
+            (guild_id, guild_id, user_id)
+        ).fetchone()
+        return position or None
+
+    def waiting_guilds(self):
+        """
+        待機列にユーザーがいるサーバーを取得
+
+        Returns:
+            list: サーバーIDのリスト
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT guild_id FROM queue").fetchall()
+        return [guild_id for (guild_id,) in rows]
+
+    def pop_next(self, guild_id):
+        """
+        待機列の先頭のユーザーを取り出す
+
+        Args:
+            guild_id (int): サーバーID
+
+        Returns:
+            tuple or None: (user_id, channel_id)。列が空の場合はNone
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT seq, user_id, channel_id FROM queue WHERE guild_id = ? "
+                    "ORDER BY seq LIMIT 1",
+                    (guild_id,)
+                ).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM queue WHERE seq = ?", (row[0],))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return (row[1], row[2]) if row else None
+
+    def offer(self, sheet_key, row, user_id, expires_at):
+        """
+        アカウントをユーザーのために確保（既存の確保は置き換える）
+
+        Args:
+            sheet_key (str): ワークシートのキー
+            row (int): アカウントの行番号
+            user_id (int): 確保するユーザーのID
+            expires_at (float): 確保の期限（UNIX時刻）
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO offers (sheet, row, user_id, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (sheet_key, row, user_id, expires_at)
+            )
+
+    def clear_offer(self, sheet_key, row, user_id=None):
+        """
+        アカウントの確保を解除
+
+        Args:
+            sheet_key (str): ワークシートのキー
+            row (int): アカウントの行番号
+            user_id (int, optional): 指定した場合はこのユーザーの確保だけを解除
+
+        Returns:
+            bool: 確保を解除した場合はTrue（既に解除されていた場合はFalse）
+        """
+        with self._lock:
+            if user_id is None:
+                cursor = self._conn.execute(
+                    "DELETE FROM offers WHERE sheet = ? AND row = ?", (sheet_key, row)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM offers WHERE sheet = ? AND row = ? AND user_id = ?",
+                    (sheet_key, row, user_id)
+                )
+        return cursor.rowcount > 0
+
+    def reservations(self, sheet_key, now=None):
+        """
+        ワークシートの確保中のアカウントを取得
+
+        Args:
+            sheet_key (str): ワークシートのキー
+            now (float, optional): 現在時刻（UNIX時刻）
+
+        Returns:
+            dict: {行番号: 確保しているユーザーのID}
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row, user_id FROM offers WHERE sheet = ? AND expires_at > ?",
+                (sheet_key, now)
+            ).fetchall()
+        return dict(rows)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from . import spreadsheet
+from . import valorant_api
+from . import rank_refresher
+
+# スナップショットの保存先
+WARM_SNAPSHOT_PATH = os.getenv(
+    "WARM_SNAPSHOT_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "warm_snapshot.json")
+)
+# スナップショットを保存する間隔（秒）
+WARM_SNAPSHOT_INTERVAL = int(os.getenv("WARM_SNAPSHOT_INTERVAL", "300"))
+# これより古いスナップショットは読み込まない（秒）
+WARM_SNAPSHOT_MAX_AGE = int(os.getenv("WARM_SNAPSHOT_MAX_AGE", "86400"))
+# 保存形式のバージョン（形式を変えた場合は増やす）
+SNAPSHOT_VERSION = 2
+
+_saver_task = None
+_restored = False
+
+
+def build_snapshot():
+    """
+    各モジュールのキャッシュと状態からスナップショットを作成
+
+    Returns:
+        dict: JSONに変換できるスナップショット
+    """
+    return {
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.time(),
+        "sheets": spreadsheet.export_cache_snapshot(),
+        "rank_cache": valorant_api.export_rank_cache(),
+        "rank_refresher": rank_refresher.export_state(),
+    }
+
+
+def write_snapshot(snapshot, path=WARM_SNAPSHOT_PATH):
+    """
+    スナップショットをファイルに書き込む（書き込み途中のファイルは残さない）
+
+    Args:
+        snapshot (dict): build_snapshot の戻り値
+        path (str): 保存先
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, default=str)
+    os.replace(temp_path, path)
+
+
+def load_snapshot(path=WARM_SNAPSHOT_PATH, now=None):
+    """
+    スナップショットを読み込んで検証
+
+    Args:
+        path (str): 保存先
+        now (float, optional): 現在時刻
+
+    Returns:
+        dict or None: 使用できるスナップショット（存在しない・古い・壊れている場合はNone）
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"スナップショットを読み込めませんでした: {e}")
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        logging.warning("スナップショットの形式が異なるため使用しません")
+        return None
+    age = (time.time() if now is None else now) - snapshot.get("created_at", 0)
+    if not 0 <= age <= WARM_SNAPSHOT_MAX_AGE:
+        logging.info(f"スナップショットが古いため使用しません（{age:.0f}秒前）")
+        return None
+    for field in ("sheets", "rank_cache", "rank_refresher"):
+        if not isinstance(snapshot.get(field), dict):
+            logging.warning(f"スナップショットの {field} が不正なため使用しません")
+            return None
+    return snapshot
+
+
+def restore_snapshot(sheets, path=WARM_SNAPSHOT_PATH):
+    """
+    スナップショットからキャッシュと状態を復元（最初の1回のみ）
+
+    ランクのマーカーを先に復元し、索引の作成時にELOを使えるようにする。
+
+    Args:
+        sheets (list): 復元するワークシートのリスト
+        path (str): 保存先
+
+    Returns:
+        bool: 復元した場合はTrue
+    """
+    global _restored
+    if _restored:
+        return False
+    _restored = True
+
+    started = time.perf_counter()
+    snapshot = load_snapshot(path)
+    if snapshot is None:
+        return False
+    try:
+        rank_refresher.restore_state(snapshot["rank_refresher"])
+        valorant_api.restore_rank_cache(snapshot["rank_cache"])
+        restored_sheets = spreadsheet.restore_cache_snapshot(snapshot["sheets"], sheets)
+    except Exception as e:
+        logging.error(f"スナップショットの復元に失敗しました: {e}", exc_info=True)
+        return False
+    logging.info(
+        f"スナップショットを復元しました: ワークシート {restored_sheets}件, "
+        f"ランク情報 {len(snapshot['rank_cache'])}件 "
+        f"({(time.perf_counter() - started) * 1000:.1f}ms)"
+    )
+    return True
+
+
+async def save_snapshot(path=WARM_SNAPSHOT_PATH):
+    """
+    現在のキャッシュと状態をスナップショットとして保存
+
+    スナップショットの作成はイベントループ上で行い、ファイルへの書き込みのみ
+    別スレッドで行う。
+
+    Args:
+        path (str): 保存先
+    """
+    snapshot = build_snapshot()
+    await asyncio.get_event_loop().run_in_executor(None, write_snapshot, snapshot, path)
+
+
+async def _save_loop():
+    """スナップショットを定期的に保存するループ"""
+    while True:
+        await asyncio.sleep(WARM_SNAPSHOT_INTERVAL)
+        try:
+            await save_snapshot()
+        except Exception as e:
+            logging.error(f"スナップショットの保存に失敗しました: {e}")
+
+
+def start_snapshot_saver():
+    """
+    スナップショットを定期的に保存するタスクを起動（起動済みの場合は何もしない）
+
+    Returns:
+        asyncio.Task: 保存のタスク
+    """
+    global _saver_task
+    if _saver_task is None or _saver_task.done():
+        _saver_task = asyncio.create_task(_save_loop())
+    return _saver_task
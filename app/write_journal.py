@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+# ジャーナルファイルの保存先
+JOURNAL_PATH = os.getenv(
+    "SHEET_JOURNAL_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "sheet_journal.db")
+)
+# 適用済みのエントリを保持する期間（秒）
+APPLIED_RETENTION = 7 * 24 * 60 * 60
+# エントリを送信するプロセスが保持する占有期間（秒）
+# 送信中にプロセスが停止した場合は、期限切れ後に他のプロセスが引き継ぐ
+LEASE_SECONDS = 120
+# このプロセスを識別する名前（同じジャーナルを共有する複数のシャードを区別する）
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WriteJournal:
+    """
+    スプレッドシートへの書き込みを適用前に記録する追記型のジャーナル
+
+    SQLite（WALモード、synchronous=FULL）に記録し、コミット時点でディスクに
+    書き込まれたことを保証する。セル更新は (ワークシート, 行, 列) ごとの
+    バージョン番号を持ち、新しいバージョンが存在するエントリは再適用しない。
+
+    送信前に claim でエントリを占有するため、同じジャーナルを共有する
+    複数のプロセスが同じエントリを同時に送信することはない。
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        """
+        初期化
+
+        Args:
+            path (str): SQLiteファイルのパス
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                sheet TEXT NOT NULL,
+                op TEXT NOT NULL,
+                row INTEGER,
+                col INTEGER,
+                version INTEGER,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_until REAL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS journal_status ON journal (status, seq)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS journal_cell ON journal (sheet, row, col, version)"
+        )
+        self._conn.execute(
+            "DELETE FROM journal WHERE status != 'pending' AND created_at < ?",
+            (time.time() - APPLIED_RETENTION,)
+        )
+
+    def record_update(self, sheet_key, row, col, value):
+        """
+        セル更新を記録
+
+        Args:
+            sheet_key (str): ワークシートのキー
+            row (int): 行番号
+            col (int): 列番号
+            value: 設定する値
+
+        Returns:
+            dict: 記録したエントリ
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (version,) = self._conn.execute(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM journal "
+                    "WHERE sheet = ? AND row = ? AND col = ?",
+                    (sheet_key, row, col)
+                ).fetchone()
+                cursor = self._conn.execute(
+                    "INSERT INTO journal (sheet, op, row, col, version, payload, created_at) "
+                    "VALUES (?, 'update', ?, ?, ?, ?, ?)",
+                    (sheet_key, row, col, version, json.dumps(value), time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {
+            "seq": cursor.lastrowid, "sheet": sheet_key, "op": "update",
+            "row": row, "col": col, "version": version, "value": value,
+            "attempts": 0,
+        }
+
+    def record_append(self, sheet_key, row_data):
+        """
+        行追加を記録
+
+        Args:
+            sheet_key (str): ワークシートのキー
+            row_data (list): 追加する行のデータリスト
+
+        Returns:
+            dict: 記録したエントリ
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO journal (sheet, op, payload, created_at) "
+                "VALUES (?, 'append', ?, ?)",
+                (sheet_key, json.dumps(row_data), time.time())
+            )
+        return {
+            "seq": cursor.lastrowid, "sheet": sheet_key, "op": "append",
+            "row": None, "col": None, "version": None, "value": row_data,
+            "attempts": 0,
+        }
+
+    def claim(self, entry, owner=LEASE_OWNER, lease=LEASE_SECONDS):
+        """
+        送信するエントリを占有して送信回数を数える
+
+        未適用で、他のプロセスが占有していない（または占有期限が切れた）
+        エントリのみ占有できる。占有できた場合は entry["attempts"] を
+        今回を含む送信回数に更新する。
+
+        Args:
+            entry (dict): 送信するエントリ
+            owner (str): 占有するプロセスの名前
+            lease (float): 占有期間（秒）
+
+        Returns:
+            bool: 占有できた場合はTrue
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "UPDATE journal SET lease_owner = ?, lease_until = ?, "
+                    "attempts = attempts + 1 "
+                    "WHERE seq = ? AND status = 'pending' AND (lease_owner IS NULL "
+                    "OR lease_owner = ? OR lease_until < ?)",
+                    (owner, now + lease, entry["seq"], owner, now)
+                )
+                claimed = cursor.rowcount == 1
+                if claimed:
+                    (entry["attempts"],) = self._conn.execute(
+                        "SELECT attempts FROM journal WHERE seq = ?", (entry["seq"],)
+                    ).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def mark_applied(self, entry):
+        """
+        エントリの適用完了を記録
+
+        セル更新の場合は、同じセルの古いバージョンの未適用エントリも不要になる。
+
+        Args:
+            entry (dict): 適用したエントリ
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE journal SET status = 'applied', lease_owner = NULL, "
+                "lease_until = NULL WHERE seq = ?",
+                (entry["seq"],)
+            )
+            if entry["op"] == "update":
+                self._conn.execute(
+                    "UPDATE journal SET status = 'superseded' "
+                    "WHERE status = 'pending' AND sheet = ? AND row = ? AND col = ? "
+                    "AND version < ?",
+                    (entry["sheet"], entry["row"], entry["col"], entry["version"])
+                )
+
+    def mark_failed(self, entry, error, permanent=False):
+        """
+        エントリの適用失敗を記録
+
+        Args:
+            entry (dict): 適用に失敗したエントリ
+            error (Exception): 発生したエラー
+            permanent (bool): 再試行しても成功しないエラーの場合はTrue
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE journal SET last_error = ?, lease_owner = NULL, lease_until = NULL, "
+                "status = CASE WHEN ? THEN 'failed' ELSE status END WHERE seq = ?",
+                (str(error), permanent, entry["seq"])
+            )
+
+    def is_superseded(self, entry):
+        """
+        同じセルにより新しいバージョンの書き込みがあるか判定
+
+        Args:
+            entry (dict): 判定するエントリ
+
+        Returns:
+            bool: 新しいバージョンがある場合はTrue
+        """
+        if entry["op"] != "update":
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM journal WHERE sheet = ? AND row = ? AND col = ? "
+                "AND version > ? AND status IN ('pending', 'applied') LIMIT 1",
+                (entry["sheet"], entry["row"], entry["col"], entry["version"])
+            ).fetchone()
+        return row is not None
+
+    def pending_entries(self):
+        """
+        未適用のエントリを記録順に取得
+
+        Returns:
+            list: エントリのリスト
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, sheet, op, row, col, version, payload, attempts FROM journal "
+                "WHERE status = 'pending' ORDER BY seq"
+            ).fetchall()
+        return [
+            {
+                "seq": seq, "sheet": sheet, "op": op, "row": row, "col": col,
+                "version": version, "value": json.loads(payload), "attempts": attempts,
+            }
+            for seq, sheet, op, row, col, version, payload, attempts in rows
+        ]
+
+    def pending_updates(self, sheet_key):
+        """
+        ワークシートの未適用のセル更新をセルごとの最新値で取得
+
+        Args:
+            sheet_key (str): ワークシートのキー
+
+        Returns:
+            dict: {(行, 列): 値}
+        """
+        updates = {}
+        for entry in self.pending_entries():
+            if entry["sheet"] == sheet_key and entry["op"] == "update":
+                updates[(entry["row"], entry["col"])] = entry["value"]
+        return updates
+
+    def pending_count(self):
+        """
+        未適用のエントリ数を取得
+
+        Returns:
+            int: 未適用のエントリ数
+        """
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE status = 'pending'"
+            ).fetchone()
+        return count
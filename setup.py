@@ -18,8 +18,8 @@ setup(
         "discord.py==2.3.2",
         "flask==2.3.3",
         "valo_api==2.1.0",
-        "gspread==5.12.1",
-        "oauth2client==4.1.3",
+        "aiohttp>=3.7.4,<4",
+        "google-auth>=2,<3",
         "PyNaCl==1.5.0",
         "python-dotenv==1.0.1",
         "zoneinfo; python_version < '3.9'",  # For Python < 3.9
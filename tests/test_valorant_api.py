@@ -0,0 +1,178 @@
+import asyncio
+import json
+import types
+
+import msgspec
+import pytest
+import valo_api
+from valo_api.endpoints_config import EndpointsConfig
+
+from app import valorant_api
+
+OK_RESPONSE = types.SimpleNamespace(ok=True)
+
+# HenrikDev API の実際の応答（一部の試合・シーズンを省略）
+MMR_HISTORY_V1_PAYLOAD = {
+    "status": 200,
+    "name": "Henrik3",
+    "tag": "EUW3",
+    "data": [
+        {
+            "currenttier": 15,
+            "currenttierpatched": "Platinum 1",
+            "images": {
+                "small": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/smallicon.png",
+                "large": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/largeicon.png",
+                "triangle_down": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangledownicon.png",
+                "triangle_up": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangleupicon.png",
+            },
+            "match_id": "2e5ac4a3-fe7b-4a6c-8c5b-a6d2a4ed3e6a",
+            "map": {"name": "Ascent", "id": "7eaecc1b-4337-bbf6-6ab9-04b8f06b3319"},
+            "season_id": "34093c29-4306-43de-452f-3f944bde22be",
+            "ranking_in_tier": 27,
+            "mmr_change_to_last_game": -18,
+            "elo": 1227,
+            "date": "Tuesday, January 16, 2024 9:02 PM",
+            "date_raw": 1705438928,
+        },
+        {
+            "currenttier": 15,
+            "currenttierpatched": "Platinum 1",
+            "images": {
+                "small": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/smallicon.png",
+                "large": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/largeicon.png",
+                "triangle_down": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangledownicon.png",
+                "triangle_up": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangleupicon.png",
+            },
+            "match_id": "b2c6a1f0-5f0e-4b1a-9c1e-0f3c2d8e7a11",
+            "map": {"name": "Lotus", "id": "2fe4ed3a-450a-948b-6d6b-e89a78e680a9"},
+            "season_id": "34093c29-4306-43de-452f-3f944bde22be",
+            "ranking_in_tier": 45,
+            "mmr_change_to_last_game": 21,
+            "elo": 1245,
+            "date": "Tuesday, January 16, 2024 8:21 PM",
+            "date_raw": 1705436471,
+        },
+    ],
+}
+
+MMR_V1_PAYLOAD = {
+    "status": 200,
+    "data": {
+        "currenttier": 15,
+        "currenttierpatched": "Platinum 1",
+        "images": {
+            "small": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/smallicon.png",
+            "large": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/largeicon.png",
+            "triangle_down": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangledownicon.png",
+            "triangle_up": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangleupicon.png",
+        },
+        "ranking_in_tier": 27,
+        "mmr_change_to_last_game": -18,
+        "elo": 1227,
+        "name": "Henrik3",
+        "tag": "EUW3",
+        "old": False,
+    },
+}
+
+MMR_V2_PAYLOAD = {
+    "status": 200,
+    "data": {
+        "name": "Henrik3",
+        "tag": "EUW3",
+        "puuid": "54942ced-1967-5f66-8a16-1e0dae875641",
+        "current_data": {
+            "currenttier": 15,
+            "currenttierpatched": "Platinum 1",
+            "images": {
+                "small": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/smallicon.png",
+                "large": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/largeicon.png",
+                "triangle_down": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangledownicon.png",
+                "triangle_up": "https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/15/ranktriangleupicon.png",
+            },
+            "ranking_in_tier": 27,
+            "mmr_change_to_last_game": -18,
+            "elo": 1227,
+            "games_needed_for_rating": 0,
+            "old": False,
+        },
+        "highest_rank": {
+            "old": False,
+            "tier": 18,
+            "patched_tier": "Diamond 1",
+            "season": "e7a2",
+        },
+        "by_season": {
+            "e8a1": {
+                "wins": 12,
+                "number_of_games": 23,
+                "final_rank": 15,
+                "final_rank_patched": "Platinum 1",
+                "act_rank_wins": [
+                    {"patched_tier": "Platinum 1", "tier": 15},
+                    {"patched_tier": "Gold 3", "tier": 14},
+                ],
+                "old": False,
+            },
+            "e7a3": {"error": "No data Available"},
+        },
+    },
+}
+
+
+def _decode(endpoint, payload):
+    return endpoint.value.parse_response(OK_RESPONSE, json.dumps(payload).encode())
+
+
+def test_decode_mmr_history_v1():
+    history = _decode(EndpointsConfig.MMR_HISTORY_BY_NAME, MMR_HISTORY_V1_PAYLOAD)
+    assert history[0].elo == 1227
+    assert history[0].mmr_change_to_last_game == -18
+    assert history[0].currenttierpatched == "Platinum 1"
+
+
+def test_decode_mmr_details_v2():
+    mmr_data = _decode(EndpointsConfig.MMR_DETAILS_BY_NAME, MMR_V2_PAYLOAD)
+    assert mmr_data.current_data.currenttier == 15
+    assert mmr_data.current_data.elo == 1227
+    assert mmr_data.highest_rank.patched_tier == "Diamond 1"
+
+
+def test_mmr_details_endpoint_cannot_decode_v1_payload():
+    # valo_api は MMR詳細を常に v2 の型で解析するため、v1 の応答は使えない
+    with pytest.raises(msgspec.ValidationError):
+        _decode(EndpointsConfig.MMR_DETAILS_BY_NAME, MMR_V1_PAYLOAD)
+
+
+@pytest.fixture
+def api_calls(monkeypatch):
+    calls = []
+
+    def fake_history(version, region, name, tag):
+        calls.append(("mmr-history", version))
+        return _decode(EndpointsConfig.MMR_HISTORY_BY_NAME, MMR_HISTORY_V1_PAYLOAD)
+
+    def fake_details(version, region, name, tag):
+        calls.append(("mmr", version))
+        return _decode(EndpointsConfig.MMR_DETAILS_BY_NAME, MMR_V2_PAYLOAD)
+
+    monkeypatch.setattr(valo_api, "get_mmr_history_by_name", fake_history)
+    monkeypatch.setattr(valo_api, "get_mmr_details_by_name", fake_details)
+    monkeypatch.setattr(valorant_api, "record_rank", lambda name, tag, result: None)
+    monkeypatch.setattr(valorant_api, "_rank_cache", {})
+    return calls
+
+
+def test_get_current_rank_skips_details_when_marker_unchanged(api_calls):
+    first = asyncio.run(valorant_api.get_current_rank("eu", "Henrik3", "EUW3"))
+    assert first.current_rank == "Platinum 1"
+    assert first.tier == 15
+    assert first.highest_rank == "Diamond 1"
+    assert api_calls == [("mmr-history", "v1"), ("mmr", "v2")]
+
+    api_calls.clear()
+    second = asyncio.run(valorant_api.get_current_rank("eu", "Henrik3", "EUW3"))
+    assert second.current_rank == "Platinum 1"
+    assert not second.cached
+    assert api_calls == [("mmr-history", "v1")]